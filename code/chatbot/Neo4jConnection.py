@@ -1,60 +1,251 @@
-from neo4j import GraphDatabase
+import threading
+import time
+from collections import Counter
+
+from neo4j import AsyncGraphDatabase, GraphDatabase
+
+from instrumentation import record_neo4j
+
 
 class Neo4jConnection:
-    def __init__(self, uri, user, password, db=None):
+    def __init__(
+        self,
+        uri,
+        user,
+        password,
+        db=None,
+        max_connection_pool_size=50,
+        connection_acquisition_timeout=10.0,
+        max_connection_lifetime=3600,
+        max_transaction_retry_time=15.0,
+    ):
         self.__uri = uri
         self.__user = user
         self.__password = password
         self.__db = db
+        self.__driver = None
+        self.__statements = {}
+        # executions per distinct statement text, used to estimate plan cache reuse
+        self.__statement_counts = Counter()
+        self.__stats_lock = threading.Lock()
         self.is_alive = False
         try:
-            with GraphDatabase.driver(self.__uri, auth=(self.__user, self.__password)) as driver:
-                driver.verify_connectivity()    
+            # One long-lived driver per process; sessions borrow connections from its pool
+            self.__driver = GraphDatabase.driver(
+                self.__uri,
+                auth=(self.__user, self.__password),
+                max_connection_pool_size=max_connection_pool_size,
+                connection_acquisition_timeout=connection_acquisition_timeout,
+                max_connection_lifetime=max_connection_lifetime,
+                max_transaction_retry_time=max_transaction_retry_time,
+            )
+            self.__driver.verify_connectivity()
         except Exception as e:
             print("Failed to create the driver:", e)
         else:
             self.is_alive = True
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.__driver is not None:
+            self.__driver.close()
+            self.__driver = None
+        self.is_alive = False
+
     def query(self, query, **parameters):
+        self._count_statement(query)
+        response = None
+        success = False
+        try:
+            with self.__driver.session(database=self.__db) as session:
+                response = list(session.run(query, **parameters))
+        except Exception as e:
+            print("Query failed:", e)
+        else:
+            success = True
+        return response, success
+
+    def _count_statement(self, query):
+        with self.__stats_lock:
+            self.__statement_counts[query] += 1
+
+    def plan_cache_stats(self):
+        # Neo4j caches plans by statement text, so every execution of a text that
+        # has been seen before can reuse a cached plan; the first one is a miss.
+        with self.__stats_lock:
+            executions = sum(self.__statement_counts.values())
+            distinct = len(self.__statement_counts)
+        hits = executions - distinct
+        return {
+            "executions": executions,
+            "distinct_statements": distinct,
+            "hits": hits,
+            "hit_rate": hits / executions if executions else 0.0,
+        }
+
+    def prepare(self, statements):
+        # Register named statements once; they are looked up by name on every call
+        self.__statements.update(statements)
+
+    def run_prepared(self, name, **parameters):
+        return self._run(self.__statements[name], name, parameters)
+
+    def read_query(self, query, **parameters):
+        # execute_read retries the whole unit of work on transient errors
+        # (dropped connections, leader switches, ...) until max_transaction_retry_time
+        def work(tx):
+            return [dict(record) for record in tx.run(query, parameters)]
+
+        self._count_statement(query)
+        response = None
+        success = False
+        try:
+            with self.__driver.session(database=self.__db) as session:
+                response = session.execute_read(work)
+        except Exception as e:
+            print("Query failed:", e)
+        else:
+            success = True
+        return response, success
+
+    def write_query(self, query, **parameters):
+        # execute_write retries the unit of work on transient errors, including deadlocks
+        # between concurrent writers, so a batch is committed whole or not at all
+        def work(tx):
+            return [dict(record) for record in tx.run(query, parameters)]
+
+        self._count_statement(query)
         response = None
         success = False
         try:
-            with GraphDatabase.driver(self.__uri, auth=(self.__user, self.__password)) as driver:
-                with driver.session(database=self.__db) as session:
-                    response = list(session.run(query, **parameters))
+            with self.__driver.session(database=self.__db) as session:
+                response = session.execute_write(work)
         except Exception as e:
             print("Query failed:", e)
         else:
             success = True
         return response, success
-    
+
+    def profile(self, query, **parameters):
+        # Runs the statement under PROFILE and returns the plan tree with db hits and rows
+        # per operator; errors are raised, since a plan that cannot be profiled is a failure
+        def work(tx):
+            return tx.run(f"PROFILE {query}", parameters).consume().profile
+
+        with self.__driver.session(database=self.__db) as session:
+            return session.execute_read(work)
+
     def bulk_query(self, queries, **parameters):
         response = None
         try:
-            with GraphDatabase.driver(self.__uri, auth=(self.__user, self.__password)) as driver:
-                with driver.session(database=self.__db) as session:
-                    response = []
-                    # Use transaction to execute all queries within one transaction block
-                    with session.begin_transaction() as txn:
-                        for query in queries:
-                            result = txn.run(query, parameters)
-                            response.append(list(result))
-                        # Commit the transaction after all queries are run
-                        txn.commit()
+            with self.__driver.session(database=self.__db) as session:
+                response = []
+                # Use transaction to execute all queries within one transaction block
+                with session.begin_transaction() as txn:
+                    for query in queries:
+                        result = txn.run(query, parameters)
+                        response.append(list(result))
+                    # Commit the transaction after all queries are run
+                    txn.commit()
         except Exception as e:
             print("Query failed:", e)
         return response
 
-    
-    def run_query(self, cypher):
-        query_result, success = self.query(cypher)
+    def run_query(self, cypher, **parameters):
+        return self._run(cypher, "adhoc", parameters)
+
+    def _run(self, cypher, name, parameters):
+        start = time.perf_counter()
+        query_result, success = self.read_query(cypher, **parameters)
+        record_neo4j(name, len(query_result) if success else 0, time.perf_counter() - start, success)
+        if success:
+            return query_result
+
+
+class AsyncNeo4jConnection:
+    # Same interface as Neo4jConnection on top of the asyncio driver. The driver
+    # binds its pool to the running event loop, so use one instance per loop.
+    def __init__(
+        self,
+        uri,
+        user,
+        password,
+        db=None,
+        max_connection_pool_size=50,
+        connection_acquisition_timeout=10.0,
+        max_connection_lifetime=3600,
+        max_transaction_retry_time=15.0,
+    ):
+        self.__db = db
+        self.__statements = {}
+        self.__driver = AsyncGraphDatabase.driver(
+            uri,
+            auth=(user, password),
+            max_connection_pool_size=max_connection_pool_size,
+            connection_acquisition_timeout=connection_acquisition_timeout,
+            max_connection_lifetime=max_connection_lifetime,
+            max_transaction_retry_time=max_transaction_retry_time,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        await self.__driver.close()
+
+    async def verify(self):
+        try:
+            await self.__driver.verify_connectivity()
+        except Exception as e:
+            print("Failed to connect:", e)
+            return False
+        return True
+
+    def prepare(self, statements):
+        self.__statements.update(statements)
+
+    async def read_query(self, query, **parameters):
+        async def work(tx):
+            result = await tx.run(query, parameters)
+            return [dict(record) async for record in result]
+
+        response = None
+        success = False
+        try:
+            async with self.__driver.session(database=self.__db) as session:
+                response = await session.execute_read(work)
+        except Exception as e:
+            print("Query failed:", e)
+        else:
+            success = True
+        return response, success
+
+    async def run_query(self, cypher, **parameters):
+        return await self._run(cypher, "adhoc", parameters)
+
+    async def run_prepared(self, name, **parameters):
+        return await self._run(self.__statements[name], name, parameters)
+
+    async def _run(self, cypher, name, parameters):
+        start = time.perf_counter()
+        query_result, success = await self.read_query(cypher, **parameters)
+        record_neo4j(name, len(query_result) if success else 0, time.perf_counter() - start, success)
         if success:
-            return [dict(record) for record in query_result]
+            return query_result
+
 
 if __name__ == "__main__":
     import os
     # Test the connection
     uri = os.getenv("NEO4J_URI")
     AUTH = ("neo4j", os.getenv("NEO4J_PASSWORD"))
-    driver = Neo4jConnection(uri, *AUTH, "neo4j")
-    
\ No newline at end of file
+    with Neo4jConnection(uri, *AUTH, "neo4j") as driver:
+        print("Connected:", driver.is_alive)
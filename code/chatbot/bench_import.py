@@ -0,0 +1,59 @@
+"""Cold-start benchmark: time to import each chatbot module and to warm everything up.
+
+    python bench_import.py --repeats 3
+
+Every measurement runs in a fresh interpreter, so nothing is shared between runs.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+MODULES = ["utils2", "intent", "graph", "lifecycle"]
+
+SNIPPET = """
+import json, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter() - start
+result = {{"import_s": imported}}
+if {warm_up}:
+    import lifecycle
+    start = time.perf_counter()
+    result["steps"] = lifecycle.warm_up()
+    result["warm_up_s"] = time.perf_counter() - start
+print(json.dumps(result))
+"""
+
+
+def run(module, warm_up=False):
+    output = subprocess.run(
+        [sys.executable, "-c", SNIPPET.format(module=module, warm_up=warm_up)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--warm-up", action="store_true", help="also time lifecycle.warm_up()")
+    args = parser.parse_args()
+
+    for module in MODULES:
+        times = [run(module)["import_s"] for _ in range(args.repeats)]
+        print(f"import {module:>10}: median {np.median(times):6.2f} s   max {max(times):6.2f} s")
+
+    if args.warm_up:
+        result = run("graph", warm_up=True)
+        print(f"warm_up: {result['warm_up_s']:.2f} s")
+        for step, seconds in result["steps"].items():
+            print(f"  {step:>24}: {seconds:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Compare the old full-result matching query with the server-side top-k one.
+
+    python bench_matching.py --subcategories 5 --repeats 10
+
+Runs both on the broadest subcategories of the catalog and reports rows and
+product ids shipped per call and p50/p95 latency.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from queries import MATCHING_PRODUCTS, _MATCHING_PRODUCTS_HEAD
+from recommendation import MATCHING_TIED_POOL, MATCHING_TOP_K
+from utils2 import get_graphdb
+
+# what find_matching_products used to run: one row per product, ranked in the database
+# but filtered and sliced in Python
+LEGACY_MATCHING_PRODUCTS = f"""
+{_MATCHING_PRODUCTS_HEAD}
+RETURN p.product_id AS product_id,
+    keyword_matches,
+    subcategory_matches,
+    (keyword_matches * 3 + subcategory_matches * 2) AS score
+ORDER BY score DESC, keyword_matches DESC, subcategory_matches DESC
+""".strip()
+
+BROAD_SUBCATEGORIES = """
+MATCH (s:Subcategory)<-[:BELONGS_TO]-(p:Product)
+RETURN s.name AS name, count(p) AS products
+ORDER BY products DESC
+LIMIT $limit
+""".strip()
+
+COMMON_KEYWORDS = """
+MATCH (s:Subcategory {name: $subcategory})<-[:BELONGS_TO]-(:Product)-[:HAS_KEYWORD]->(k:Keyword)
+RETURN k.name AS name, count(*) AS products
+ORDER BY products DESC
+LIMIT $limit
+""".strip()
+
+
+def timed(graphdb, statement, parameters, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rows, success = graphdb.read_query(statement, **parameters)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if not success:
+            raise RuntimeError("Matching query failed")
+    return rows, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subcategories", type=int, default=5)
+    parser.add_argument("--keywords", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--top-k", type=int, default=MATCHING_TOP_K)
+    parser.add_argument("--tied-pool", type=int, default=MATCHING_TIED_POOL)
+    args = parser.parse_args()
+
+    graphdb = get_graphdb()
+    subcategories = graphdb.run_query(BROAD_SUBCATEGORIES, limit=args.subcategories) or []
+    latencies = {"legacy": [], "top_k": []}
+    shipped = {"legacy": [], "top_k": []}
+
+    for subcategory in subcategories:
+        keywords = graphdb.run_query(COMMON_KEYWORDS, subcategory=subcategory["name"], limit=args.keywords) or []
+        parameters = {
+            "subcategories": [subcategory["name"]],
+            "usecases": [],
+            "keywords": [keyword["name"] for keyword in keywords],
+            "price": None,
+        }
+        legacy_rows, times = timed(graphdb, LEGACY_MATCHING_PRODUCTS, parameters, args.repeats)
+        latencies["legacy"].extend(times)
+        shipped["legacy"].append(len(legacy_rows))
+
+        rows, times = timed(
+            graphdb,
+            MATCHING_PRODUCTS,
+            {**parameters, "top_k": args.top_k, "tied_pool": args.tied_pool},
+            args.repeats,
+        )
+        latencies["top_k"].extend(times)
+        shipped["top_k"].append(len(rows[0]["top_products"]) + len(rows[0]["tied_products"]))
+
+        # ties may be broken differently, so check the top-k is drawn from the legacy
+        # above-minimum products and is as long as the legacy slice
+        min_score = min((row["score"] for row in legacy_rows), default=None)
+        legacy_above = [row["product_id"] for row in legacy_rows if row["score"] > min_score]
+        top_products = rows[0]["top_products"]
+        agrees = set(top_products) <= set(legacy_above) and len(top_products) == len(legacy_above[: args.top_k])
+        print(
+            f"{subcategory['name']!r} ({subcategory['products']} products): "
+            f"{len(legacy_rows)} rows -> {shipped['top_k'][-1]} ids, top-k agrees: {agrees}"
+        )
+
+    for name, times in latencies.items():
+        if times:
+            print(
+                f"{name:>6}: p50 {np.percentile(times, 50):8.1f} ms   "
+                f"p95 {np.percentile(times, 95):8.1f} ms   "
+                f"mean ids shipped {np.mean(shipped[name]):8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
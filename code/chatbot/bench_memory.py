@@ -0,0 +1,76 @@
+"""Peak RSS and load time of the search stack with per-searcher clients vs the shared registry.
+
+    python bench_memory.py
+
+Each layout is measured in a fresh interpreter so the numbers do not overlap.
+"""
+import json
+import subprocess
+import sys
+import time
+
+COLLECTIONS = ["subcategories", "summaries", "usecases", "keywords"]
+
+
+def load_per_searcher():
+    # the old layout: one client and one set of models per searcher, plus the intent model
+    import os
+    from fastembed import TextEmbedding
+    from qdrant_client import QdrantClient
+
+    from embedding_registry import DENSE_MODEL, SPARSE_MODEL
+
+    clients = []
+    for _ in COLLECTIONS:
+        client = QdrantClient(url=os.environ["QDRANT_URL"], api_key=os.environ["QDRANT_API_KEY"])
+        client.set_model(DENSE_MODEL)
+        client.set_sparse_model(SPARSE_MODEL)
+        clients.append(client)
+    intent_model = TextEmbedding(DENSE_MODEL)
+    return clients, intent_model
+
+
+def load_shared():
+    from embedding_registry import get_dense_model, get_qdrant_client, get_sparse_model
+
+    # searchers embed queries themselves with the registry models
+    client = get_qdrant_client()
+    clients = [client for _ in COLLECTIONS]
+    return clients, get_dense_model(), get_sparse_model()
+
+
+LAYOUTS = {"per_searcher": load_per_searcher, "shared": load_shared}
+
+
+def measure(layout):
+    import resource
+
+    from dotenv import load_dotenv, find_dotenv
+
+    load_dotenv(find_dotenv())
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    LAYOUTS[layout]()
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"layout": layout, "load_s": seconds, "peak_rss_mb": peak / 1024, "added_rss_mb": (peak - baseline) / 1024}))
+
+
+def main():
+    for layout in LAYOUTS:
+        output = subprocess.run(
+            [sys.executable, __file__, layout], capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{layout:>12}: load {result['load_s']:6.2f} s   peak RSS {result['peak_rss_mb']:8.1f} MB   "
+            f"(+{result['added_rss_mb']:.1f} MB for models and clients)"
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        measure(sys.argv[1])
+    else:
+        main()
@@ -0,0 +1,103 @@
+"""Compare reduce_keys with the LSH-blocked reduce_keys_blocked on runtime and output agreement.
+
+    python bench_reduce_keys.py --keywords ../../data/keywords.pkl
+    python bench_reduce_keys.py --synthetic 20000
+
+Agreement is the share of keys both versions map to the same kept key. Pass
+--pairwise-below 0 to time the LSH path on inputs smaller than its crossover size.
+"""
+import argparse
+import pickle
+import random
+import time
+
+from reduce_keys import PAIRWISE_BELOW, reduce_keys, reduce_keys_blocked
+
+ADJECTIVES = [
+    "hydrating", "organic", "lightweight", "matte", "long-lasting", "gentle", "vegan", "cruelty-free",
+    "fragrance-free", "anti-aging", "brightening", "soothing", "nourishing", "waterproof", "sensitive skin",
+    "oil-free", "natural", "daily", "overnight", "travel size",
+]
+NOUNS = [
+    "facial serum", "body lotion", "night cream", "lip balm", "mascara", "sunscreen", "face mask", "shampoo",
+    "conditioner", "hair oil", "eye cream", "toner", "cleanser", "foundation", "nail polish", "body wash",
+    "hand cream", "face mist", "exfoliating scrub", "makeup remover",
+]
+
+
+def perturb(text, rng):
+    variants = [
+        lambda t: t + "s",
+        lambda t: t.replace("-", " "),
+        lambda t: t.title(),
+        lambda t: t.replace(" ", "", 1),
+        # swap two neighbouring characters
+        lambda t: (lambda i: t[:i] + t[i + 1] + t[i] + t[i + 2:])(rng.randrange(len(t) - 1)),
+    ]
+    return rng.choice(variants)(text)
+
+
+def synthetic_keywords(count, seed=0):
+    rng = random.Random(seed)
+    entries = []
+    for product_index in range(count // 5):
+        for _ in range(5):
+            keyword = f"{rng.choice(ADJECTIVES)} {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+            if rng.random() < 0.3:
+                keyword = perturb(keyword, rng)
+            entries.append({"keyword": keyword, "product_index": product_index})
+    return entries
+
+
+def notebook_keywords(path):
+    with open(path, "rb") as f:
+        keywords = pickle.load(f)
+    entries = []
+    for index, entry in enumerate(keywords):
+        for value in (entry or {}).get("extractive", []) + (entry or {}).get("abstractive", []):
+            entries.append({"keyword": value, "product_index": index})
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keywords", help="keywords.pkl from the enrichment step")
+    parser.add_argument("--synthetic", type=int, default=10000, help="synthetic keywords when no file is given")
+    parser.add_argument("--threshold", type=int, default=90)
+    parser.add_argument("--bands", type=int, default=32)
+    parser.add_argument("--num-perm", type=int, default=128)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--pairwise-below", type=int, default=PAIRWISE_BELOW)
+    args = parser.parse_args()
+
+    entries = notebook_keywords(args.keywords) if args.keywords else synthetic_keywords(args.synthetic)
+    unique = {entry["keyword"] for entry in entries}
+    print(f"{len(entries)} entries, {len(unique)} distinct keywords")
+
+    start = time.perf_counter()
+    reduced, kept = reduce_keys(entries, "keyword", similarity_threshold=args.threshold)
+    pairwise_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reduced_blocked, kept_blocked = reduce_keys_blocked(
+        entries,
+        "keyword",
+        similarity_threshold=args.threshold,
+        num_perm=args.num_perm,
+        bands=args.bands,
+        workers=args.workers,
+        pairwise_below=args.pairwise_below,
+    )
+    blocked_seconds = time.perf_counter() - start
+
+    mapping = {entry["keyword"]: reduced_entry["keyword"] for entry, reduced_entry in zip(entries, reduced)}
+    mapping_blocked = {entry["keyword"]: reduced_entry["keyword"] for entry, reduced_entry in zip(entries, reduced_blocked)}
+    agreement = sum(mapping[key] == mapping_blocked[key] for key in mapping) / len(mapping)
+
+    print(f"pairwise: {pairwise_seconds:8.2f}s  {len(kept)} kept keys")
+    print(f" blocked: {blocked_seconds:8.2f}s  {len(kept_blocked)} kept keys")
+    print(f"speed-up: {pairwise_seconds / blocked_seconds:.1f}x   agreement: {agreement:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Compare the Jina and local cross-encoder rerank backends on the summaries collection.
+
+    python bench_rerank.py --repeats 5 --limit 5
+
+Reports p50/p95 latency per backend and how much their top results overlap.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from reranker import JinaReranker, CrossEncoderReranker
+from utils2 import summary_searcher
+
+QUERIES = [
+    "Can you show me a night cream that helps with anti-aging?",
+    "I want to find a nice luxury skincare set for my mom as a Mother's Day gift.",
+    "What's a good vitamin C serum under $40 that reduces dark spots?",
+    "I need a unique birthday gift for a friend who's really into natural makeup.",
+    "fragrance free moisturizer for sensitive skin",
+    "long lasting waterproof mascara",
+    "shampoo for dry and frizzy hair",
+    "sunscreen that doesn't leave a white cast",
+]
+
+
+def timed(backend, query, documents, limit, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        results = backend.rerank(query, documents, limit)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    backends = {
+        "jina": JinaReranker(),
+        "local": CrossEncoderReranker(batch_size=args.batch_size),
+    }
+    latencies = {name: [] for name in backends}
+    overlaps, top1_agreement = [], []
+
+    for query in QUERIES:
+        hits = summary_searcher.search(query, limit=args.candidates, threshold=0.0)
+        documents = [hit["document"] for hit in hits]
+        if not documents:
+            print(f"No candidates for {query!r}, skipping")
+            continue
+
+        rankings = {}
+        for name, backend in backends.items():
+            # the first call warms up connections and the ONNX session
+            backend.rerank(query, documents, args.limit)
+            results, times = timed(backend, query, documents, args.limit, args.repeats)
+            latencies[name].extend(times)
+            rankings[name] = [entry["index"] for entry in results]
+
+        jina, local = rankings["jina"], rankings["local"]
+        overlaps.append(len(set(jina) & set(local)) / max(len(jina), 1))
+        top1_agreement.append(bool(jina) and bool(local) and jina[0] == local[0])
+
+    for name, times in latencies.items():
+        if times:
+            print(
+                f"{name:>6}: p50 {np.percentile(times, 50):8.1f} ms   "
+                f"p95 {np.percentile(times, 95):8.1f} ms   ({len(times)} calls)"
+            )
+    if overlaps:
+        print(f"top-{args.limit} overlap: {np.mean(overlaps):.2f}")
+        print(f"top-1 agreement: {np.mean(top1_agreement):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Load test for server.py against a stub graph that stands in for the LLM and database calls.
+
+    python bench_server.py --requests 200 --clients 32 --workers 1 2 4 8 16
+
+The stub sleeps for the configured LLM and DB latencies, so throughput should grow with
+the number of worker slots until the clients are the bottleneck. Requests beyond the
+slots are answered with 429 and counted separately.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from server import create_app
+
+
+class StubGraph:
+    def __init__(self, llm_latency, db_latency, tokens=20):
+        self.llm_latency = llm_latency
+        self.db_latency = db_latency
+        self.tokens = tokens
+
+    async def ainvoke(self, state, config=None):
+        await asyncio.sleep(self.db_latency)
+        await asyncio.sleep(self.llm_latency)
+        return {"messages": [*state["messages"], AIMessage("stub answer")]}
+
+    async def astream(self, state, config=None, stream_mode=None):
+        await asyncio.sleep(self.db_latency)
+        yield "custom", {"stage": "candidates_retrieved", "count": 20}
+        for _ in range(self.tokens):
+            await asyncio.sleep(self.llm_latency / self.tokens)
+            yield "messages", (AIMessageChunk(content="token "), {"langgraph_node": "information_retrieval"})
+
+
+async def run_load(workers, args):
+    app = create_app(
+        graph=StubGraph(args.llm_latency, args.db_latency),
+        max_concurrency=workers,
+        request_timeout=30,
+        queue_timeout=args.queue_timeout,
+    )
+    latencies, statuses = [], []
+    queue = asyncio.Queue()
+    for index in range(args.requests):
+        queue.put_nowait(index)
+
+    async def client_loop(client):
+        while not queue.empty():
+            index = queue.get_nowait()
+            start = time.perf_counter()
+            path = f"/threads/{index}/messages" + ("/stream" if args.stream else "")
+            response = await client.post(path, json={"content": "night cream for anti-aging"})
+            statuses.append(response.status_code)
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*[client_loop(client) for _ in range(args.clients)])
+            elapsed = time.perf_counter() - start
+
+    ok = statuses.count(200)
+    return {
+        "workers": workers,
+        "throughput": ok / elapsed,
+        "p50": np.percentile(latencies, 50) if latencies else float("nan"),
+        "p95": np.percentile(latencies, 95) if latencies else float("nan"),
+        "rejected": statuses.count(429),
+        "other": len(statuses) - ok - statuses.count(429),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--db-latency", type=float, default=0.05)
+    # give waiting requests a chance instead of rejecting as soon as all slots are busy
+    parser.add_argument("--queue-timeout", type=float, default=10.0)
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        result = asyncio.run(run_load(workers, args))
+        print(
+            f"workers {result['workers']:>3}: {result['throughput']:7.1f} req/s   "
+            f"p50 {result['p50']:6.2f} s   p95 {result['p95']:6.2f} s   "
+            f"429s {result['rejected']:>4}   errors {result['other']:>3}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import threading
+import time
+from ast import literal_eval
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from queries import CATALOG_PRODUCTS
+
+
+def get_price_range(price, change_point=550, percentage=15):
+    # Same intervals as the AROUND_PRICE ranges created in kg_generation.ipynb
+    if price <= change_point:
+        # Use percentage-based interval
+        lower_bound = price * (1 - percentage / 100)
+        upper_bound = price * (1 + percentage / 100)
+    else:
+        # Use logarithmic-based interval
+        log_base = 1.1
+        lower_bound = price / log_base
+        upper_bound = price * log_base
+
+    return int(lower_bound), int(upper_bound)
+
+
+def rows_from_graph(graphdb):
+    return graphdb.run_query(CATALOG_PRODUCTS)
+
+
+def rows_from_csv(path):
+    import pandas as pd
+
+    products_df = pd.read_csv(path, usecols=["parent_asin", "price", "categories"])
+    rows = []
+    for product_id, price, categories in products_df.itertuples(index=False):
+        rows.append(
+            {
+                "product_id": product_id,
+                "price": price,
+                "subcategories": literal_eval(categories),
+                "lower_limit": None,
+                "upper_limit": None,
+            }
+        )
+    return rows
+
+
+class _CatalogArrays(NamedTuple):
+    product_ids: np.ndarray
+    # price filter for {"lt": x}: prices sorted ascending and the product positions in that order
+    sorted_prices: np.ndarray
+    price_order: np.ndarray
+    # price filter for {"around": x}: interval bounds sorted by lower limit
+    sorted_lower: np.ndarray
+    lower_order: np.ndarray
+    upper_limits: np.ndarray
+    # subcategory name -> packed bitmap over product positions
+    subcategory_bitmaps: Dict[str, np.ndarray]
+    built_at: float
+    build_seconds: float
+
+
+class CatalogIndex:
+    """Read-only, in-process index that turns subcategories and a price filter into candidate product ids."""
+
+    def __init__(self, loader, retry_seconds=60.0, max_age=0.0):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._arrays: Optional[_CatalogArrays] = None
+        self._retry_seconds = retry_seconds
+        # seconds before a loaded snapshot is reloaded; 0 keeps it until the process restarts
+        self._max_age = max_age
+        self._next_refresh = float("inf")
+        self.refresh()
+
+    @classmethod
+    def from_graph(cls, graphdb, **options):
+        return cls(lambda: rows_from_graph(graphdb), **options)
+
+    @classmethod
+    def from_csv(cls, path, **options):
+        return cls(lambda: rows_from_csv(path), **options)
+
+    def __len__(self):
+        arrays = self._arrays
+        return len(arrays.product_ids) if arrays is not None else 0
+
+    def loaded(self):
+        return self._arrays is not None
+
+    def refresh_due(self):
+        """True when a failed load should be retried or the snapshot is older than max_age."""
+        return time.monotonic() >= self._next_refresh
+
+    def ready(self):
+        """True once a snapshot is loaded, reloading it first when a refresh is due. Blocks
+        while loading; until a load succeeds callers use the Cypher statements instead."""
+        if self.refresh_due():
+            self.refresh()
+        return self.loaded()
+
+    def refresh_in_background(self):
+        """Start a refresh on its own thread, for callers that must not block, and keep
+        serving the current snapshot meanwhile."""
+        if not self.refresh_due():
+            return
+        self._next_refresh = float("inf")
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def refresh(self):
+        # Build the new arrays off to the side and swap them in, so lookups running
+        # during a reload keep using the previous snapshot.
+        with self._lock:
+            # retried after retry_seconds unless the load below succeeds
+            self._next_refresh = time.monotonic() + self._retry_seconds
+            start = time.perf_counter()
+            rows = self._loader()
+            if rows is None:
+                # the load failed; keep serving the previous snapshot, if there is one
+                if self._arrays is None:
+                    print("Catalog index could not be loaded, falling back to Cypher lookups")
+                else:
+                    print("Catalog index could not be reloaded, keeping the previous snapshot")
+                return None
+            arrays = self._build(rows, start)
+            self._arrays = arrays
+            self._next_refresh = time.monotonic() + self._max_age if self._max_age else float("inf")
+        return arrays.build_seconds
+
+    @staticmethod
+    def _build(rows, start):
+        num_products = len(rows)
+        product_ids = np.array([row["product_id"] for row in rows], dtype=str)
+        prices = np.array(
+            [row["price"] if row["price"] is not None else np.nan for row in rows],
+            dtype=np.float64,
+        )
+
+        lower_limits = np.empty(num_products, dtype=np.float64)
+        upper_limits = np.empty(num_products, dtype=np.float64)
+        members: Dict[str, List[int]] = {}
+        for position, row in enumerate(rows):
+            lower, upper = row.get("lower_limit"), row.get("upper_limit")
+            if lower is None or upper is None:
+                if np.isnan(prices[position]):
+                    lower, upper = np.inf, -np.inf
+                else:
+                    lower, upper = get_price_range(prices[position])
+            lower_limits[position] = lower
+            upper_limits[position] = upper
+            for subcategory in row["subcategories"]:
+                members.setdefault(subcategory, []).append(position)
+
+        subcategory_bitmaps = {}
+        for subcategory, positions in members.items():
+            mask = np.zeros(num_products, dtype=bool)
+            mask[positions] = True
+            subcategory_bitmaps[subcategory] = np.packbits(mask)
+
+        # NaN prices sort last, so they never fall below a "lt" bound
+        price_order = np.argsort(prices, kind="stable")
+        lower_order = np.argsort(lower_limits, kind="stable")
+        return _CatalogArrays(
+            product_ids=product_ids,
+            sorted_prices=prices[price_order],
+            price_order=price_order,
+            sorted_lower=lower_limits[lower_order],
+            lower_order=lower_order,
+            upper_limits=upper_limits,
+            subcategory_bitmaps=subcategory_bitmaps,
+            built_at=time.time(),
+            build_seconds=time.perf_counter() - start,
+        )
+
+    def _price_mask(self, arrays, price_range):
+        num_products = len(arrays.product_ids)
+        mask = np.zeros(num_products, dtype=bool)
+        if "lt" in price_range:
+            end = np.searchsorted(arrays.sorted_prices, price_range["lt"], side="left")
+            mask[arrays.price_order[:end]] = True
+        elif "around" in price_range:
+            price = price_range["around"]
+            # every interval with lower_limit <= price, then keep the ones that reach price
+            end = np.searchsorted(arrays.sorted_lower, price, side="right")
+            positions = arrays.lower_order[:end]
+            mask[positions[arrays.upper_limits[positions] >= price]] = True
+        else:
+            mask[:] = True
+        return mask
+
+    def candidates(self, subcategories, price_range=None):
+        arrays = self._arrays
+        num_products = len(arrays.product_ids)
+        bitmaps = [
+            arrays.subcategory_bitmaps[subcategory]
+            for subcategory in subcategories
+            if subcategory in arrays.subcategory_bitmaps
+        ]
+        if not bitmaps or num_products == 0:
+            return []
+        bits = np.bitwise_or.reduce(bitmaps) if len(bitmaps) > 1 else bitmaps[0]
+        if price_range:
+            bits = bits & np.packbits(self._price_mask(arrays, price_range))
+        positions = np.flatnonzero(np.unpackbits(bits, count=num_products))
+        return arrays.product_ids[positions].tolist()
+
+    def memory_report(self):
+        arrays = self._arrays
+        if arrays is None:
+            return {"products": 0, "total_bytes": 0}
+        bitmap_bytes = sum(bitmap.nbytes for bitmap in arrays.subcategory_bitmaps.values())
+        report = {
+            "products": len(arrays.product_ids),
+            "subcategories": len(arrays.subcategory_bitmaps),
+            "product_ids_bytes": arrays.product_ids.nbytes,
+            "price_bytes": arrays.sorted_prices.nbytes + arrays.price_order.nbytes,
+            "price_range_bytes": arrays.sorted_lower.nbytes
+            + arrays.lower_order.nbytes
+            + arrays.upper_limits.nbytes,
+            "subcategory_bitmap_bytes": bitmap_bytes,
+            "build_seconds": arrays.build_seconds,
+            "built_at": arrays.built_at,
+        }
+        report["total_bytes"] = (
+            report["product_ids_bytes"]
+            + report["price_bytes"]
+            + report["price_range_bytes"]
+            + report["subcategory_bitmap_bytes"]
+        )
+        return report
+
+
+if __name__ == "__main__":
+    import sys
+    from pprint import pprint
+
+    # Size the index for a catalog dump, e.g. python catalog_index.py ../../data/products_0.001.csv
+    index = CatalogIndex.from_csv(sys.argv[1])
+    pprint(index.memory_report())
@@ -0,0 +1,422 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+from langgraph.checkpoint.base import WRITES_IDX_MAP, BaseCheckpointSaver, CheckpointTuple
+from langgraph.checkpoint.memory import MemorySaver
+
+
+class BoundedMemorySaver(MemorySaver):
+    """MemorySaver that keeps only the latest checkpoints of each thread and evicts whole threads.
+
+    Threads are evicted when idle for longer than `ttl_seconds`, when there are more than
+    `max_threads`, or when all threads together take more than `max_bytes`, least recently
+    used first. The thread being written is never evicted by its own write.
+    """
+
+    def __init__(self, keep_checkpoints=2, ttl_seconds=3600, max_threads=1000, max_bytes=256 * 1024 * 1024, **kwargs):
+        super().__init__(**kwargs)
+        self.keep_checkpoints = keep_checkpoints
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        # thread_id -> last write time, least recently used first
+        self.last_used = OrderedDict()
+        self.thread_bytes = {}
+        self.total_bytes = 0
+        # keys of `writes` and `blobs` per thread, so a write only touches its own thread's state
+        self.write_keys = defaultdict(set)
+        self.blob_keys = defaultdict(set)
+        self.evictions = 0
+        self._lock = threading.RLock()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+            blobs = self._blob_store()
+            if blobs is not None:
+                self.blob_keys[thread_id].update(
+                    key
+                    for key in ((thread_id, checkpoint_ns, channel, version) for channel, version in new_versions.items())
+                    if key in blobs
+                )
+            self._prune_thread(thread_id)
+            self._touch(thread_id)
+            return next_config
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            if task_path:
+                super().put_writes(config, writes, task_id, task_path)
+            else:
+                # older checkpoint packages do not accept task_path
+                super().put_writes(config, writes, task_id)
+            configurable = config["configurable"]
+            thread_id = configurable["thread_id"]
+            self.write_keys[thread_id].add((thread_id, configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"]))
+            self._touch(thread_id)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return self.put_writes(config, writes, task_id, task_path)
+
+    def _blob_store(self):
+        # channel values live in `blobs` on current checkpoint packages, inline on older ones
+        return getattr(self, "blobs", None)
+
+    def _prune_thread(self, thread_id):
+        blobs = self._blob_store()
+        for checkpoint_ns, checkpoints in self.storage.get(thread_id, {}).items():
+            # checkpoint ids are time-ordered, so the newest sort last
+            checkpoint_ids = sorted(checkpoints)
+            for checkpoint_id in checkpoint_ids[:-self.keep_checkpoints]:
+                del checkpoints[checkpoint_id]
+                self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+                self.write_keys[thread_id].discard((thread_id, checkpoint_ns, checkpoint_id))
+
+            if blobs is None:
+                continue
+            referenced = set()
+            for saved in checkpoints.values():
+                channel_versions = self.serde.loads_typed(saved[0]).get("channel_versions", {})
+                referenced.update(channel_versions.items())
+            stale = [
+                key
+                for key in self.blob_keys[thread_id]
+                if key[1] == checkpoint_ns and (key[2], key[3]) not in referenced
+            ]
+            for key in stale:
+                blobs.pop(key, None)
+                self.blob_keys[thread_id].discard(key)
+
+    def _measure(self, thread_id):
+        size = 0
+        for checkpoints in self.storage.get(thread_id, {}).values():
+            for saved in checkpoints.values():
+                size += len(saved[0][1]) + len(saved[1][1] if isinstance(saved[1], tuple) else saved[1])
+        for key in self.write_keys.get(thread_id, ()):
+            size += sum(len(write[2][1]) for write in self.writes.get(key, {}).values())
+        blobs = self._blob_store()
+        if blobs is not None:
+            size += sum(len(blobs[key][1]) for key in self.blob_keys.get(thread_id, ()) if key in blobs)
+        return size
+
+    def _touch(self, thread_id):
+        now = time.time()
+        self.last_used[thread_id] = now
+        self.last_used.move_to_end(thread_id)
+        size = self._measure(thread_id)
+        self.total_bytes += size - self.thread_bytes.get(thread_id, 0)
+        self.thread_bytes[thread_id] = size
+        self._evict(now, keep=thread_id)
+
+    def _evict(self, now, keep):
+        for thread_id, last_used in list(self.last_used.items()):
+            if thread_id == keep:
+                continue
+            over_budget = len(self.last_used) > self.max_threads or self.total_bytes > self.max_bytes
+            if now - last_used > self.ttl_seconds or over_budget:
+                self.delete_thread(thread_id)
+                self.evictions += 1
+            else:
+                # the rest were used more recently and are within budget
+                break
+
+    def delete_thread(self, thread_id):
+        thread_id = str(thread_id)
+        with self._lock:
+            self.storage.pop(thread_id, None)
+            for key in self.write_keys.pop(thread_id, ()):
+                self.writes.pop(key, None)
+            blobs = self._blob_store()
+            for key in self.blob_keys.pop(thread_id, ()):
+                blobs.pop(key, None)
+            self.last_used.pop(thread_id, None)
+            self.total_bytes -= self.thread_bytes.pop(thread_id, 0)
+
+    async def adelete_thread(self, thread_id):
+        self.delete_thread(thread_id)
+
+    def thread_stats(self):
+        with self._lock:
+            now = time.time()
+            return {
+                thread_id: {
+                    "bytes": self.thread_bytes.get(thread_id, 0),
+                    "checkpoints": sum(len(c) for c in self.storage.get(thread_id, {}).values()),
+                    "idle_s": now - last_used,
+                }
+                for thread_id, last_used in self.last_used.items()
+            }
+
+    def report(self):
+        with self._lock:
+            total = self.total_bytes
+            threads = len(self.last_used)
+            return {
+                "threads": threads,
+                "bytes": total,
+                "bytes_per_thread": total / threads if threads else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver):
+    """File-backed checkpointer that several processes on one host can share.
+
+    SQLite in WAL mode lets readers run while one process writes. Checkpoints and
+    pending writes are stored per thread with zlib-compressed serde payloads, and the
+    writes of one graph step go in a single transaction. Retention follows
+    BoundedMemorySaver: the latest `keep_checkpoints` per thread, and threads idle past
+    `ttl_seconds` or beyond `max_threads` are deleted.
+    """
+
+    def __init__(self, path, keep_checkpoints=2, ttl_seconds=24 * 3600, max_threads=10000, evict_interval=60, **kwargs):
+        super().__init__(**kwargs)
+        self.keep_checkpoints = keep_checkpoints
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        # eviction scans every thread, so run it at most this often (seconds)
+        self.evict_interval = evict_interval
+        self.evictions = 0
+        self._last_evict = 0.0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                parent_checkpoint_id TEXT,
+                type TEXT,
+                checkpoint BLOB,
+                metadata_type TEXT,
+                metadata BLOB,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT,
+                value BLOB,
+                task_path TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS checkpoints_updated ON checkpoints(thread_id, updated_at);
+            """
+        )
+
+    def _dumps(self, value):
+        type_, data = self.serde.dumps_typed(value)
+        return type_, zlib.compress(data, 3)
+
+    def _loads(self, type_, data):
+        return self.serde.loads_typed((type_, zlib.decompress(data)))
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def _tuple(self, row):
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        with self._lock:
+            writes = self.conn.execute(
+                "SELECT task_id, channel, type, value FROM writes "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self._loads(type_, checkpoint),
+            metadata=self._loads(metadata_type, metadata),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id
+                else None
+            ),
+            pending_writes=[(task_id, channel, self._loads(value_type, value)) for task_id, channel, value_type, value in writes],
+        )
+
+    def get_tuple(self, config):
+        configurable = config["configurable"]
+        thread_id = str(configurable["thread_id"])
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        columns = "thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if configurable.get("checkpoint_id"):
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, configurable["checkpoint_id"]),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+        return self._tuple(row) if row else None
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        clauses, parameters = [], []
+        if config is not None:
+            clauses.append("thread_id = ?")
+            parameters.append(str(config["configurable"]["thread_id"]))
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                parameters.append(config["configurable"]["checkpoint_ns"])
+        if before is not None:
+            clauses.append("checkpoint_id < ?")
+            parameters.append(before["configurable"]["checkpoint_id"])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                f"metadata_type, metadata FROM checkpoints {where} ORDER BY checkpoint_id DESC",
+                parameters,
+            ).fetchall()
+        returned = 0
+        for row in rows:
+            if limit is not None and returned >= limit:
+                break
+            checkpoint_tuple = self._tuple(row)
+            if filter and any(checkpoint_tuple.metadata.get(key) != value for key, value in filter.items()):
+                continue
+            returned += 1
+            yield checkpoint_tuple
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        configurable = config["configurable"]
+        thread_id = str(configurable["thread_id"])
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        type_, data = self._dumps(checkpoint)
+        metadata_type, metadata_data = self._dumps(metadata)
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], configurable.get("checkpoint_id"),
+                 type_, data, metadata_type, metadata_data, now),
+            )
+            # keep only the newest checkpoints of this thread and their writes
+            kept = (
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC LIMIT ?"
+            )
+            prune = (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep_checkpoints)
+            conn.execute(
+                f"DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ({kept})",
+                prune,
+            )
+            conn.execute(
+                f"DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ({kept})",
+                prune,
+            )
+        if now - self._last_evict > self.evict_interval:
+            self._evict(now)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        configurable = config["configurable"]
+        key = (str(configurable["thread_id"]), configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"])
+        rows = [
+            (*key, task_id, WRITES_IDX_MAP.get(channel, index), channel, *self._dumps(value), task_path)
+            for index, (channel, value) in enumerate(writes)
+        ]
+        # special channels (errors, interrupts) overwrite, regular writes are kept from the first attempt
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        with self._transaction() as conn:
+            conn.executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _evict(self, now):
+        self._last_evict = now
+        with self._transaction() as conn:
+            threads = conn.execute(
+                "SELECT thread_id, MAX(updated_at) AS last_used FROM checkpoints GROUP BY thread_id ORDER BY last_used DESC"
+            ).fetchall()
+            evicted = [
+                thread_id
+                for rank, (thread_id, last_used) in enumerate(threads)
+                if rank >= self.max_threads or now - last_used > self.ttl_seconds
+            ]
+            for table in ("checkpoints", "writes"):
+                conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", [(thread_id,) for thread_id in evicted])
+        self.evictions += len(evicted)
+
+    def delete_thread(self, thread_id):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (str(thread_id),))
+            conn.execute("DELETE FROM writes WHERE thread_id = ?", (str(thread_id),))
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for checkpoint_tuple in await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        ):
+            yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def thread_stats(self):
+        now = time.time()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT thread_id, COUNT(*), SUM(LENGTH(checkpoint) + LENGTH(metadata)), MAX(updated_at) "
+                "FROM checkpoints GROUP BY thread_id"
+            ).fetchall()
+            write_bytes = dict(
+                self.conn.execute("SELECT thread_id, SUM(LENGTH(value)) FROM writes GROUP BY thread_id").fetchall()
+            )
+        return {
+            thread_id: {
+                "bytes": size + (write_bytes.get(thread_id) or 0),
+                "checkpoints": checkpoints,
+                "idle_s": now - last_used,
+            }
+            for thread_id, checkpoints, size, last_used in rows
+        }
+
+    def report(self):
+        stats = self.thread_stats()
+        total = sum(thread["bytes"] for thread in stats.values())
+        return {
+            "threads": len(stats),
+            "bytes": total,
+            "bytes_per_thread": total / len(stats) if stats else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,266 @@
+"""Build the Qdrant collections HybridSearcher queries from the knowledge graph.
+
+    python collection_builder.py                          # all four collections
+    python collection_builder.py summaries --recreate     # rebuild one from scratch
+    python collection_builder.py --parallel 0             # embed on every core
+
+Documents are read from Neo4j, embedded with the dense and sparse models in batches
+spread over worker processes, and uploaded with parallel batched upserts. HNSW indexing
+is held back during the upload and built once at the end. Point ids are derived from the
+document (or product id), so reruns overwrite points instead of duplicating them.
+"""
+import os
+import time
+import uuid
+
+from qdrant_client import models
+
+from embedding_registry import (
+    DENSE_VECTOR_NAME,
+    SPARSE_VECTOR_NAME,
+    get_dense_model,
+    get_qdrant_client,
+    get_sparse_model,
+)
+
+DENSE_SIZE = 384
+# Qdrant's default, in kB of vectors per segment; restored once the upload is done
+INDEXING_THRESHOLD = 20000
+HNSW_M = 16
+
+# payload is {"document": ...}, plus the product id where searches filter on it
+COLLECTIONS = {
+    "subcategories": "MATCH (s:Subcategory) RETURN DISTINCT s.name AS document",
+    "summaries": """
+MATCH (p:Product)
+WHERE p.summary IS NOT NULL
+RETURN p.summary AS document, p.product_id AS product_id
+""".strip(),
+    "usecases": "MATCH (u:UseCase) RETURN DISTINCT u.title AS document",
+    "keywords": "MATCH (k:Keyword) RETURN DISTINCT k.name AS document",
+}
+
+BATCH_SIZE = int(os.getenv("COLLECTION_BATCH_SIZE", 256))
+# fastembed worker processes per model; 0 uses every core, 1 embeds in this process
+EMBED_PARALLEL = int(os.getenv("COLLECTION_EMBED_PARALLEL", 0))
+UPLOAD_PARALLEL = int(os.getenv("COLLECTION_UPLOAD_PARALLEL", 4))
+
+
+def load_documents(graphdb, name):
+    records, success = graphdb.read_query(COLLECTIONS[name])
+    if not success:
+        raise RuntimeError(f"Could not read the {name} documents from Neo4j")
+    return [record for record in records if record["document"]]
+
+
+def point_id(collection_name, payload, key_field=None):
+    key = payload[key_field] if key_field else payload.get("product_id") or payload["document"]
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{collection_name}/{key}"))
+
+
+def scalar_quantization():
+    # int8 copies stay in RAM for the search; originals on disk only rescore the top hits
+    return models.ScalarQuantization(
+        scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+    )
+
+
+def create_collection(client, name, on_disk=True, quantization=True, recreate=False, product_index=False):
+    """Create `name`, or bring an existing one to the same storage settings, with indexing paused for the upload."""
+    if recreate and client.collection_exists(name):
+        client.delete_collection(name)
+    sparse_vectors_config = {
+        SPARSE_VECTOR_NAME: models.SparseVectorParams(index=models.SparseIndexParams(on_disk=on_disk))
+    }
+    hnsw_config = models.HnswConfigDiff(m=HNSW_M, on_disk=on_disk)
+    paused = models.OptimizersConfigDiff(indexing_threshold=0)
+    if not client.collection_exists(name):
+        client.create_collection(
+            name,
+            vectors_config={
+                DENSE_VECTOR_NAME: models.VectorParams(
+                    size=DENSE_SIZE, distance=models.Distance.COSINE, on_disk=on_disk
+                )
+            },
+            sparse_vectors_config=sparse_vectors_config,
+            quantization_config=scalar_quantization() if quantization else None,
+            hnsw_config=hnsw_config,
+            on_disk_payload=on_disk,
+            optimizers_config=paused,
+        )
+    else:
+        # the settings only apply to new collections otherwise; the optimizer rewrites
+        # the existing segments to match
+        client.update_collection(
+            name,
+            vectors_config={DENSE_VECTOR_NAME: models.VectorParamsDiff(on_disk=on_disk)},
+            sparse_vectors_config=sparse_vectors_config,
+            quantization_config=scalar_quantization() if quantization else models.Disabled.DISABLED,
+            hnsw_config=hnsw_config,
+            collection_params=models.CollectionParamsDiff(on_disk_payload=on_disk),
+            optimizer_config=paused,
+        )
+    if product_index:
+        # searches over product documents filter on the product
+        client.create_payload_index(name, "product_id", models.PayloadSchemaType.KEYWORD)
+
+
+def embed_points(
+    collection_name, payloads, batch_size=BATCH_SIZE, parallel=EMBED_PARALLEL, stats=None, key_field=None
+):
+    """Yield one point per payload; both models stream their batches from their own worker pool."""
+    documents = [payload["document"] for payload in payloads]
+    parallel = parallel if parallel != 1 else None
+    dense = get_dense_model().embed(documents, batch_size=batch_size, parallel=parallel)
+    sparse = get_sparse_model().embed(documents, batch_size=batch_size, parallel=parallel)
+    for payload, dense_vector, sparse_vector in zip(payloads, dense, sparse):
+        if stats is not None:
+            stats["sparse_values"] += len(sparse_vector.indices)
+        yield models.PointStruct(
+            id=point_id(collection_name, payload, key_field),
+            vector={
+                DENSE_VECTOR_NAME: dense_vector.tolist(),
+                SPARSE_VECTOR_NAME: models.SparseVector(
+                    indices=sparse_vector.indices.tolist(), values=sparse_vector.values.tolist()
+                ),
+            },
+            payload=payload,
+        )
+
+
+def wait_until_indexed(client, name, timeout=3600, interval=2.0, settle=3):
+    """Wait for the optimizer to finish building the index after indexing is switched back on.
+
+    The optimizer starts asynchronously, so the status has to stay green for `settle`
+    polls in a row. Segments under the indexing threshold are never indexed, so the
+    indexed vector count is reported rather than waited for.
+    """
+    deadline = time.monotonic() + timeout
+    green = 0
+    while True:
+        info = client.get_collection(name)
+        green = green + 1 if info.status == models.CollectionStatus.GREEN else 0
+        if green >= settle:
+            return info
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{name} is still {info.status} after {timeout}s")
+        time.sleep(interval)
+
+
+def estimate_memory(points, sparse_values, on_disk=True, quantization=True):
+    """Rough RAM and disk bytes of the vectors and their indexes, leaving out the payload."""
+    dense = points * DENSE_SIZE * 4
+    quantized = points * DENSE_SIZE if quantization else 0
+    # level-0 HNSW links dominate: up to 2 * m neighbour ids per point
+    hnsw = points * HNSW_M * 2 * 4
+    # an index and a float per non-zero, in the vector storage and again in the inverted index
+    sparse = sparse_values * 8 * 2
+    return {
+        "ram_bytes": quantized + (0 if on_disk else dense + hnsw + sparse),
+        "disk_bytes": quantized + dense + hnsw + sparse,
+    }
+
+
+def build_collection(
+    client,
+    name,
+    payloads,
+    batch_size=BATCH_SIZE,
+    parallel=EMBED_PARALLEL,
+    upload_parallel=UPLOAD_PARALLEL,
+    on_disk=True,
+    quantization=True,
+    recreate=False,
+    key_field=None,
+):
+    """Embed and upload `payloads` into `name`, then build the index; returns a report.
+
+    Point ids come from `key_field` when given, else from the product id or the document.
+    """
+    create_collection(
+        client,
+        name,
+        on_disk=on_disk,
+        quantization=quantization,
+        recreate=recreate,
+        product_index=any("product_id" in payload for payload in payloads),
+    )
+    stats = {"sparse_values": 0}
+    start = time.perf_counter()
+    client.upload_points(
+        name,
+        points=embed_points(name, payloads, batch_size, parallel, stats, key_field),
+        batch_size=batch_size,
+        parallel=upload_parallel,
+        max_retries=3,
+        wait=True,
+    )
+    upload_seconds = time.perf_counter() - start
+    client.update_collection(
+        name, optimizer_config=models.OptimizersConfigDiff(indexing_threshold=INDEXING_THRESHOLD)
+    )
+    info = wait_until_indexed(client, name)
+    seconds = time.perf_counter() - start
+    return {
+        "collection": name,
+        "documents": len(payloads),
+        "points": info.points_count,
+        "indexed_vectors": info.indexed_vectors_count,
+        "upload_seconds": upload_seconds,
+        "seconds": seconds,
+        "docs_per_second": len(payloads) / max(upload_seconds, 1e-9),
+        **estimate_memory(info.points_count or 0, stats["sparse_values"], on_disk, quantization),
+    }
+
+
+def print_report(report):
+    print(
+        f"{report['collection']}: {report['documents']} documents in {report['upload_seconds']:.1f}s "
+        f"({report['docs_per_second']:.0f} docs/s), indexed after {report['seconds']:.1f}s, "
+        f"{report['points']} points ({report['indexed_vectors']} vectors in HNSW), ~{report['ram_bytes'] / 2**20:.1f} MiB RAM, "
+        f"~{report['disk_bytes'] / 2**20:.1f} MiB on disk"
+    )
+
+
+def build_collections(graphdb, names=tuple(COLLECTIONS), client=None, **options):
+    client = client or get_qdrant_client()
+    reports = []
+    for name in names:
+        payloads = load_documents(graphdb, name)
+        report = build_collection(client, name, payloads, **options)
+        print_report(report)
+        reports.append(report)
+    documents = sum(report["documents"] for report in reports)
+    seconds = sum(report["seconds"] for report in reports)
+    print(
+        f"Built {len(reports)} collections, {documents} documents in {seconds:.1f}s, "
+        f"~{sum(report['ram_bytes'] for report in reports) / 2**20:.1f} MiB RAM"
+    )
+    return reports
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from utils2 import get_graphdb
+
+    parser = argparse.ArgumentParser(description="Build the Qdrant collections used by the hybrid searchers")
+    parser.add_argument("collections", nargs="*", choices=list(COLLECTIONS), default=list(COLLECTIONS))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--parallel", type=int, default=EMBED_PARALLEL, help="embedding processes, 0 for all cores")
+    parser.add_argument("--upload-parallel", type=int, default=UPLOAD_PARALLEL)
+    parser.add_argument("--in-memory", action="store_true", help="keep vectors and indexes in RAM")
+    parser.add_argument("--no-quantization", action="store_true")
+    parser.add_argument("--recreate", action="store_true", help="drop existing collections first")
+    args = parser.parse_args()
+
+    build_collections(
+        get_graphdb(),
+        args.collections,
+        batch_size=args.batch_size,
+        parallel=args.parallel,
+        upload_parallel=args.upload_parallel,
+        on_disk=not args.in_memory,
+        quantization=not args.no_quantization,
+        recreate=args.recreate,
+    )
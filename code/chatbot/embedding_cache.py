@@ -0,0 +1,90 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_registry import DENSE_MODEL, SPARSE_MODEL, get_dense_model, get_sparse_model
+
+
+def normalize_text(text):
+    # both models are uncased, so case and spacing do not change the vectors
+    return " ".join(text.split()).casefold()
+
+
+class EmbeddingCache:
+    """Byte-bounded LRU of query embeddings keyed on (model, normalized text).
+
+    Dense vectors are stored as float32 arrays, sparse vectors as (int32 indices, float32 values).
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(key, value):
+        arrays = value if isinstance(value, tuple) else (value,)
+        return sum(array.nbytes for array in arrays) + len(key[1])
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self._size(key, value)
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            self.bytes += size
+            while self.bytes > self.max_bytes and self._entries:
+                old_key, old_value = self._entries.popitem(last=False)
+                self.bytes -= self._size(old_key, old_value)
+
+    def dense(self, text, model_name=DENSE_MODEL):
+        key = (model_name, normalize_text(text))
+        vector = self.get(key)
+        if vector is None:
+            vector = np.asarray(next(iter(get_dense_model(model_name).embed([key[1]]))), dtype=np.float32)
+            self.put(key, vector)
+        return vector
+
+    def sparse(self, text, model_name=SPARSE_MODEL):
+        key = (model_name, normalize_text(text))
+        vector = self.get(key)
+        if vector is None:
+            embedding = next(iter(get_sparse_model(model_name).embed([key[1]])))
+            vector = (
+                np.asarray(embedding.indices, dtype=np.int32),
+                np.asarray(embedding.values, dtype=np.float32),
+            )
+            self.put(key, vector)
+        return vector
+
+    def report(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+embedding_cache = EmbeddingCache(
+    max_bytes=int(float(os.getenv("EMBEDDING_CACHE_MAX_MB", 32)) * 1024 * 1024)
+)
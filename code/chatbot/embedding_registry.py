@@ -0,0 +1,57 @@
+import os
+import threading
+
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+from event_loops import per_event_loop
+
+DENSE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SPARSE_MODEL = "prithivida/Splade_PP_en_v1"
+# named vectors of the collections built through the fastembed integration
+DENSE_VECTOR_NAME = "fast-all-minilm-l6-v2"
+SPARSE_VECTOR_NAME = "fast-sparse-splade_pp_en_v1"
+
+# Process-wide singletons: every searcher, the intent fast path and the LLM cache share them
+_lock = threading.Lock()
+_dense_models = {}
+_sparse_models = {}
+_qdrant_client = None
+
+
+def get_dense_model(model_name=DENSE_MODEL):
+    with _lock:
+        if model_name not in _dense_models:
+            from fastembed import TextEmbedding
+
+            _dense_models[model_name] = TextEmbedding(model_name)
+        return _dense_models[model_name]
+
+
+def get_sparse_model(model_name=SPARSE_MODEL):
+    with _lock:
+        if model_name not in _sparse_models:
+            from fastembed import SparseTextEmbedding
+
+            _sparse_models[model_name] = SparseTextEmbedding(model_name)
+        return _sparse_models[model_name]
+
+
+def get_qdrant_client():
+    global _qdrant_client
+    with _lock:
+        if _qdrant_client is None:
+            _qdrant_client = QdrantClient(url=os.environ["QDRANT_URL"], api_key=os.environ["QDRANT_API_KEY"])
+        return _qdrant_client
+
+
+get_qdrant_client.loaded = lambda: _qdrant_client is not None
+
+
+@per_event_loop(close=lambda client: client.close())
+def get_async_qdrant_client():
+    return AsyncQdrantClient(url=os.environ["QDRANT_URL"], api_key=os.environ["QDRANT_API_KEY"])
+
+
+def loaded_models():
+    with _lock:
+        return {"dense": sorted(_dense_models), "sparse": sorted(_sparse_models)}
@@ -0,0 +1,717 @@
+"""LLM enrichment of the product catalog: keywords, attributes, summaries and use cases.
+
+    python enrichment.py run --products ../../data/products_0.001.csv --out-dir ../../data/enrichment \\
+        --stages keywords attributes summaries use_cases --concurrency 8 \\
+        --base-url http://gpu-1:11434 --base-url http://gpu-2:11434
+    python enrichment.py export --products ../../data/products_0.001.csv --out-dir ../../data/enrichment
+
+`run` sends up to --concurrency requests at a time to each Ollama server (start them with
+OLLAMA_NUM_PARALLEL of at least that much), retries and validates every answer, and appends
+results to one JSONL file per stage. Products already in a file are skipped, so an
+interrupted run continues where it stopped. `export` writes the files kg_loader.py reads.
+"""
+import asyncio
+import json
+import os
+import pickle
+import re
+import time
+from ast import literal_eval
+
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import FewShotPromptTemplate, PromptTemplate
+from pydantic import BaseModel, Field
+
+OLLAMA_MODEL = os.getenv("ENRICHMENT_MODEL", "mistral-nemo")
+
+KEYWORD_EXAMPLES = [
+    {
+        "product_title": "Hydrating Facial Serum",
+        "product_description": "A lightweight serum that deeply hydrates the skin, reducing the appearance of fine lines and wrinkles.",
+        "product_features": "Hydrating, anti-aging, lightweight, non-greasy, fast-absorbing",
+        "extractive_keywords": ["hydrating facial serum", "anti-aging serum", "lightweight serum"],
+        "abstractive_keywords": [
+            "deeply hydrating skincare",
+            "fine line reducer",
+            "non-greasy facial treatment",
+            "fast-absorbing serum",
+        ],
+    },
+    {
+        "product_title": "Organic Shea Butter Body Lotion",
+        "product_description": "Rich and nourishing body lotion made with organic shea butter to moisturize and soften the skin.",
+        "product_features": "Organic, shea butter, moisturizing, rich texture, skin-softening",
+        "extractive_keywords": ["organic shea butter lotion", "moisturizing body lotion"],
+        "abstractive_keywords": ["rich body moisturizer", "natural skin softener", "nourishing body cream"],
+    },
+    {
+        "product_title": "Vitamin C Brightening Moisturizer",
+        "product_description": "A daily moisturizer infused with Vitamin C to brighten the complexion and protect against environmental damage.",
+        "product_features": "Vitamin C, brightening, daily moisturizer, antioxidant, SPF protection",
+        "extractive_keywords": [
+            "Vitamin C moisturizer",
+            "brightening facial cream",
+            "daily antioxidant moisturizer",
+            "SPF protected moisturizer",
+        ],
+        "abstractive_keywords": ["complexion brightener", "environmental protection moisturizer", "daily skin defender"],
+    },
+    {
+        "product_title": "Matte Finish Lipstick",
+        "product_description": "Long-lasting lipstick with a matte finish, available in a variety of vibrant colors.",
+        "product_features": "Matte finish, long-lasting, vibrant colors, non-drying, cruelty-free",
+        "extractive_keywords": ["matte lipstick", "long-lasting lip color"],
+        "abstractive_keywords": [
+            "vibrant lipstick shades",
+            "non-drying makeup",
+            "cruelty-free lip products",
+            "bold color lipstick",
+        ],
+    },
+    {
+        "product_title": "Exfoliating Facial Scrub",
+        "product_description": "A gentle exfoliating scrub that removes dead skin cells and unclogs pores, leaving the skin smooth and refreshed.",
+        "product_features": "Exfoliating, gentle, unclogs pores, smooth skin, refreshing",
+        "extractive_keywords": ["exfoliating facial scrub", "gentle skin exfoliant", "smooth skin facial scrub"],
+        "abstractive_keywords": ["pore unclogging scrub", "refreshing exfoliator"],
+    },
+    {
+        "product_title": "Anti-Pollution Facial Mist",
+        "product_description": "A refreshing facial mist that protects skin from urban pollution and hydrates throughout the day.",
+        "product_features": "Anti-pollution, hydrating, refreshing, lightweight, convenient spray bottle",
+        "extractive_keywords": ["anti-pollution facial mist", "hydrating facial mist"],
+        "abstractive_keywords": [
+            "urban pollution protection",
+            "daily hydration spray",
+            "lightweight skin mist",
+            "refreshing skin mist",
+        ],
+    },
+    {
+        "product_title": "Organic Aloe Vera Gel",
+        "product_description": "Pure organic aloe vera gel to soothe and moisturize irritated skin.",
+        "product_features": "Organic, aloe vera, soothing, moisturizing, natural",
+        "extractive_keywords": ["organic aloe vera gel", "soothing skin gel", "moisturizing aloe gel"],
+        "abstractive_keywords": ["natural skin soother", "irritated skin moisturizer", "pure aloe treatment"],
+    },
+    {
+        "product_title": "Sunscreen SPF 50",
+        "product_description": "Broad-spectrum sunscreen with SPF 50 protection to shield skin from harmful UV rays.",
+        "product_features": "Broad-spectrum, SPF 50, water-resistant, lightweight, non-greasy",
+        "extractive_keywords": ["sunscreen SPF 50", "broad-spectrum sunscreen", "water-resistant sunscreen"],
+        "abstractive_keywords": ["UV protection cream", "lightweight sunblock", "non-greasy sun protection"],
+    },
+    {
+        "product_title": "Retinol Night Cream",
+        "product_description": "A potent night cream enriched with retinol to promote skin renewal and reduce wrinkles.",
+        "product_features": "Retinol, night cream, skin renewal, wrinkle reduction, nourishing",
+        "extractive_keywords": ["retinol night cream", "skin renewal cream"],
+        "abstractive_keywords": [
+            "overnight wrinkle reducer",
+            "nourishing night moisturizer",
+            "retinol enriched cream",
+            "anti-aging night treatment",
+        ],
+    },
+    {
+        "product_title": "Clarifying Acne Spot Treatment",
+        "product_description": "Targeted spot treatment to reduce acne and prevent future breakouts.",
+        "product_features": "Clarifying, acne treatment, spot treatment, quick-drying, non-irritating",
+        "extractive_keywords": ["clarifying acne treatment", "spot treatment for acne", "acne spot treatment"],
+        "abstractive_keywords": ["breakout reducer", "quick-drying acne cream", "non-irritating blemish treatment"],
+    },
+]
+for example in KEYWORD_EXAMPLES:
+    example["product_features"] = example["product_features"].split(", ")
+
+keyword_prompt = FewShotPromptTemplate(
+    examples=KEYWORD_EXAMPLES,
+    example_prompt=PromptTemplate(
+        template="""Product:
+- Title: {product_title}
+- Description: {product_description}
+- Features: {product_features}
+Common Search Terms:
+{{{{
+"extractive_keywords": {extractive_keywords},
+"abstractive_keywords": {abstractive_keywords}
+}}}}
+""".strip(),
+        input_variables=[
+            "product_title",
+            "product_description",
+            "product_features",
+            "extractive_keywords",
+            "abstractive_keywords",
+        ],
+    ),
+    prefix="""You are an expert in SEO-optimized keyword extraction. Your task is to extract common search terms that will make the product more discoverable in search engines.
+Instructions:
+
+Extract two types of keywords
+
+1. extractive_keywords: List[str] = 'List of extractive SEO-optimized keywords (3-5). MUST be present in the product description.'
+2. abstractive_keywords: List[str] = '''List of abstractive SEO-optimized keywords/phrases (3-5) AND
+    MUST NOT be present in the product description BUT MUST BE related to the product AND
+    MUST BE diverse AND NOT overlapping with the extractive keywords OR each other.'''
+
+Guidelines:
+1. **Relevance**: Extract keywords that are commonly used by potential customers searching for this product. Ensure the keywords are highly relevant to the product's features, use cases, and audience.
+2. **Avoid Keyword Overlap**: If there are multiple synonyms, choose only the most relevant keyword. For example, if the product description contains both "cheap laptop" and "affordable laptop," choose one to avoid overlap and dilution.
+3. **Edge Weighting (Priority)**: Consider how specific and unique the keyword is to the product. More specific and descriptive terms (e.g., "lightweight laptop" for a travel laptop) should be prioritized over generic terms (e.g., "device").
+
+Some examples are given below.
+""",
+    suffix="""
+Your task: Extract the common search terms for the following product only.
+Product:
+- Title: {product_title}
+- Description: {product_description}
+- Features: {product_features}
+Common Search Terms:
+""",
+    input_variables=["product_title", "product_description", "product_features"],
+)
+
+KEYWORD_FORMAT_PROMPT = """
+Please format the below AI response into the following format:
+{{
+    "extractive_keywords": ["keyword1", "keyword2", "keyword3"],
+    "abstractive_keywords": ["keyword4", "keyword5", "keyword6"]
+}}
+If there is more than one dictionary, just keep the first one.
+{content}
+""".strip()
+
+attribute_prompt = PromptTemplate(
+    template="""You are an advanced language model tasked with enhancing product catalogs by extracting key attributes from product titles and descriptions. You will be provided with an existing dictionary of attributes, which may sometimes be empty. Your goal is to analyze the product title and description to identify and add any missing attributes, or modify existing, ensuring the dictionary is accurate and comprehensive.
+
+Here is an example of how to process a product's information:
+
+**Product Title**: Swiffer Antibacterial Cleaner, Febreze Citrus & Light Scent, Refill
+**Product Description**: Kills 99.9% of bacteria (Kills 99.9% of staphylococcus aureus and enterobacter aerogenes). Helps eliminate odors in the air with a fresh scent. Great for vinyl, glazed ceramic, sealed marble, laminate, and finished wood floors. Do not use on unfinished, oiled, or waxed wooden boards, non-sealed tiles, or carpeted floors because they may be water sensitive. Good Housekeeping: Since 1909. Limited warranty to consumers. Replacement or refund if defective. Contains no phosphate, chlorine bleach or ammonia. Questions? 1–800–742–9220. www.swiffer.com. Bottle fits all Swiffer Wet Jet devices.
+
+**Key Attributes**:
+```json
+{{
+    "Antibacterial": true,
+    "Scent": "Febreze Citrus & Light",
+    "Suitable Floor Types": ["Vinyl", "Glazed Ceramic", "Sealed Marble", "Laminate", "Finished Wood"],
+    "Not Suitable Floor Types": ["Unfinished, Oiled, or Waxed Wooden Boards", "Non-Sealed Tiles", "Carpeted Floors"],
+    "Phosphate Free": true,
+    "Chlorine Bleach Free": true,
+    "Ammonia Free": true,
+    "Brand": "Swiffer",
+    "Compatibility": "Fits all Swiffer Wet Jet devices",
+    "Product Type": "Floor Cleaner",
+    "Package Type": "Refill"
+}}
+```
+
+Using this as a guide, analyze the product title and description provided below to extract relevant attributes and populate the existing dictionary accordingly. Add new attributes if necessary, but ensure that:
+
+- All values are either **primitive types** (strings, booleans, numbers) or **lists**.
+- Do not produce nested structures (like dictionaries or complex objects).
+- If you find a delimiter (e.g., comma) in the text or a value in the existing attributes, reformat it as a list instead.
+- Output the dictionary in JSON format with only primitive or list values. Do not include length 1 lists for single values. Use the primitives instead.
+- Keep the keys in the dictionary consistent with the existing attributes or simplify them. If you find a new attribute, add it to the dictionary with the correct key name.
+
+For example, this Key Attributes result is wrong
+```json
+{{
+    "Age Range (Description)": "Adult", # key should be simplified to "Age Range"
+    "Product": {{"Brand": "COVERGIRL", "Name": "Tone Rehab 2-in-1 Foundation"}} # dictionaries are not allowed
+    "Item Form": "Liquid",
+    "Package Dimensions": ["5.9", "2.3", "2 inches"],
+    "Scent": "Banana",
+    "Special Feature": ["Scented"], # value should be "Scented"
+    "UPC": "678634485830",
+    "Weight": ["4.8 Ounces"], # value should be "4.8 Ounces"
+}}
+```
+
+This is correct
+```json
+{{
+    "Age Range": "Adult",
+    "Brand": "COVERGIRL",
+    "Name": "Tone Rehab 2-in-1 Foundation",
+    "Item Form": "Liquid",
+    "Package Dimensions": ["5.9", "2.3", "2 inches"],
+    "Scent": "Banana",
+    "Special Feature": "Scented",
+    "UPC": "678634485830",
+    "Weight": "4.8 Ounces"
+}}
+```
+
+**Product Title**: {product_title}
+**Product Description**: {product_description}
+**Existing Attributes**: {product_details}
+
+Generate only the updated dictionary inside a json block as shown in the examples above.
+""",
+    input_variables=["product_title", "product_description", "product_details"],
+)
+
+
+class ProductSummary(BaseModel):
+    summary: str = Field(
+        title="summary",
+        description="A concise, holistic, and natural sounding summary of the product.",
+        min_length=10,
+    )
+
+
+summary_prompt = PromptTemplate(
+    template="""Rephrase the following product description to create a natural, human-friendly narrative while ensuring it provides detailed information for product research.
+The description should flow naturally, avoiding overly technical language or mechanical listing of features, but must still be comprehensive enough to allow for detailed product analysis.
+
+Ensure the description includes the following:
+- Product design, material, and functionality.
+- Key features and how they benefit the user.
+- Primary use cases and scenarios where the product excels.
+- Compatibility with related products or items in the same category.
+
+Guidelines:
+- Keep the tone neutral and informative, focusing on providing clear, useful information that would help in comparing this product with others.
+- Avoid using a salesy or promotional tone.
+- The description should feel natural and readable, but the completeness of information is the priority.
+- Do not generate the result using markdown
+
+Product Description: ```{description}```""",
+    input_variables=["description"],
+)
+
+usecase_prompt = PromptTemplate(
+    template="""
+Generate a list of use-cases for the following subcategory of products, given the subcategory title and the main category that it belongs to on an eCommerce website.
+Each use-case should include a **title** and a brief **explanation** of why it is suitable for that use-case.
+
+**Expected Output Format:**
+```json
+[
+    {{
+      "title": "Relaxation via aromatherapy,
+      "explanation": "It is commonly used in diffusers to promote relaxation and reduce stress due to its natural calming properties."
+    }},
+    {{
+      "title": "Sleep aid",
+      "explanation": "It is known to promote sleep, making it an effective natural remedy for people with insomnia or sleep disorders when diffused at night."
+    }},
+    {{
+      "title": "Skincare",
+      "explanation": "It has antimicrobial properties, making it useful as a topical treatment for minor skin irritations and acne."
+    }},
+    ...
+]
+```
+The goal is to provide a comprehensive list of common scenarios where the subcategory of products is used, along with a succinct explanation of why this use case exists.
+It is recommended to generate at least 5 use-cases. Do not generate less than 2 or exceed 10 use-cases.
+
+Subcategory: {subcategory}
+Main Category: {main_category}
+""".strip(),
+    input_variables=["subcategory", "main_category"],
+)
+
+# everything between ```json and ```
+json_pattern = re.compile(r"(?<=```json)(.*?)(?=```)", re.DOTALL)
+dict_pattern = re.compile(r"\{[^\}]+\}")
+
+
+def parse_literal(text):
+    try:
+        return literal_eval(text)
+    except (ValueError, SyntaxError):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return None
+
+
+def json_block_parser(message: AIMessage):
+    match = json_pattern.search(message.content)
+    return parse_literal(match.group(0).strip()) if match else None
+
+
+def validate_output(output):
+    for key in output:
+        if type(output[key]) not in (str, bool, int, float, list):
+            return False
+        if type(output[key]) == list:
+            for element in output[key]:
+                if type(element) not in (str, bool, int, float):
+                    return False
+    return True
+
+
+def preprocess_string(input_str):
+    """Extract and escape the "summary" field of a raw [TOOL_CALLS] answer; None if it is not one."""
+    PREFIX = "[TOOL_CALLS]"
+    if not input_str.startswith(PREFIX):
+        return None
+    json_str = input_str[len(PREFIX):]
+
+    # the summary value may contain unescaped quotes, so find its bounds by hand
+    summary_key = '"summary": "'
+    start_idx = json_str.find(summary_key)
+    if start_idx == -1:
+        return None
+    start_idx += len(summary_key)
+    end_idx = json_str.rfind('"}}]')
+    if end_idx == -1:
+        return None
+
+    summary_text = json_str[start_idx:end_idx]
+    summary_text = summary_text.replace("\\", "\\\\")
+    summary_text = summary_text.replace('"', '\\"')
+    summary_text = summary_text.replace("\n", "\\n")
+    return summary_text
+
+
+def generate_product_description(row):
+    """Template description of a product row, the input of the summary stage."""
+    details = row.get("details") or {}
+    features = [feature.strip("'\"") for feature in row.get("features") or [] if feature]
+    categories = row.get("categories") or []
+    material, color = details.get("Material"), details.get("Color")
+    product_dimensions = details.get("Package Dimensions") or details.get("Product Dimensions")
+    weight = details.get("Item Weight")
+    used_keys = {"Material", "Color", "Package Dimensions", "Product Dimensions", "Item Weight", "Brand"}
+    additional_details = [f"{key} - {value}" for key, value in details.items() if key not in used_keys]
+
+    description_parts = [
+        f"{row.get('title', 'N/A')} is a product under the {row.get('main_category', 'N/A')} category.",
+        f"Manufactured by {row.get('store', 'N/A')}, it is priced at ${row.get('price', 'N/A')}.",
+    ]
+    if material or color:
+        description_parts.append(f"The product features {' and '.join(filter(None, [material, color]))}.")
+    if product_dimensions or weight:
+        dimensions_weight = " and ".join(
+            filter(
+                None,
+                [
+                    f"dimensions of {product_dimensions}" if product_dimensions else None,
+                    f"weighs {weight}" if weight else None,
+                ],
+            )
+        )
+        description_parts.append(f"It has {dimensions_weight}.")
+    description_parts.append(f"Key features include {'; '.join(features) if features else 'N/A'}.")
+    description_parts.append(
+        f"It has an average rating of {row.get('average_rating', 'N/A')} stars based on {row.get('rating_number', 'N/A')} reviews."
+    )
+    description_parts.append(f"It falls under the subcategories: {', '.join(categories) if categories else 'N/A'}.")
+    description_parts.append(
+        f"Additional details: {', '.join(additional_details) if additional_details else 'N/A'}."
+    )
+    return " ".join(description_parts)
+
+
+class EnrichmentChains:
+    """The four enrichment chains bound to one Ollama server."""
+
+    def __init__(self, base_url=None, model=OLLAMA_MODEL):
+        from langchain_ollama import ChatOllama
+
+        self.base_url = base_url
+        self.llm = ChatOllama(model=model, temperature=0.3, base_url=base_url)
+        self.keywords = keyword_prompt | self.llm
+        self.attributes = attribute_prompt | self.llm | json_block_parser
+        self.summary = summary_prompt | self.llm.with_structured_output(ProductSummary, include_raw=True)
+        self.use_cases = usecase_prompt | self.llm | json_block_parser
+
+
+def keyword_lists(parsed):
+    if not isinstance(parsed, dict):
+        return None
+    keywords = {}
+    for name in ["extractive", "abstractive"]:
+        values = parsed.get(f"{name}_keywords")
+        # some answers nest the lists in a dict
+        if isinstance(values, dict):
+            values = [item for sublist in values.values() for item in sublist]
+        if not isinstance(values, list) or not all(isinstance(value, str) and len(value) >= 2 for value in values):
+            return None
+        keywords[name] = values
+    return keywords
+
+
+async def enrich_keywords(chains, product):
+    inputs = {
+        "product_title": product["title"],
+        "product_description": " ".join(product["description"])[:5000] or "No description available.",
+        "product_features": product["features"],
+    }
+    output = await chains.keywords.ainvoke(inputs)
+    match = dict_pattern.search(output.content)
+    keywords = keyword_lists(parse_literal(match.group().replace("'s ", "s "))) if match else None
+    if keywords is None:
+        # let the model reformat its own answer, as the notebook did for every product
+        formatted = await chains.llm.ainvoke(KEYWORD_FORMAT_PROMPT.format(content=output.content))
+        match = dict_pattern.search(formatted.content)
+        keywords = keyword_lists(parse_literal(match.group().replace("'s ", "s "))) if match else None
+    if keywords is None:
+        raise ValueError("Could not parse keywords")
+    return keywords
+
+
+async def enrich_attributes(chains, product):
+    details = dict(product["details"])
+    details["store"] = product["store"]
+    attributes = await chains.attributes.ainvoke(
+        {
+            "product_title": product["title"],
+            "product_description": " ".join(product["description"]),
+            "product_details": details,
+        }
+    )
+    if not attributes or not isinstance(attributes, dict) or not validate_output(attributes):
+        raise ValueError("Invalid attributes")
+    return attributes
+
+
+async def enrich_summary(chains, product):
+    result = await chains.summary.ainvoke({"description": generate_product_description(product)})
+    if result["parsed"] is not None:
+        return result["parsed"].summary
+    escaped = preprocess_string(result["raw"].content)
+    if escaped is None:
+        raise ValueError("Could not parse summary")
+    summary = json.loads(f'"{escaped}"')
+    if len(summary) < 10:
+        raise ValueError("Summary too short")
+    return summary
+
+
+async def enrich_use_cases(chains, subcategory):
+    use_cases = await chains.use_cases.ainvoke(subcategory)
+    if (
+        not isinstance(use_cases, list)
+        or not 2 <= len(use_cases) <= 10
+        or not all(isinstance(use_case, dict) and use_case.get("title") and use_case.get("explanation") for use_case in use_cases)
+    ):
+        raise ValueError("Invalid use cases")
+    return [{"title": use_case["title"], "explanation": use_case["explanation"]} for use_case in use_cases]
+
+
+def product_items(products):
+    for product in products:
+        yield {"parent_asin": product["parent_asin"]}, product
+
+
+def subcategory_items(products):
+    pairs = sorted({(product["main_category"], subcategory) for product in products for subcategory in product["categories"]})
+    for main_category, subcategory in pairs:
+        item = {"main_category": main_category, "subcategory": subcategory}
+        yield item, item
+
+
+# stage: (checkpoint key fields, items, enrichment)
+STAGES = {
+    "keywords": (["parent_asin"], product_items, enrich_keywords),
+    "attributes": (["parent_asin"], product_items, enrich_attributes),
+    "summaries": (["parent_asin"], product_items, enrich_summary),
+    "use_cases": (["main_category", "subcategory"], subcategory_items, enrich_use_cases),
+}
+
+
+class JsonlCheckpoint:
+    """Append-only results of one stage; a record is written as soon as its answer is valid."""
+
+    def __init__(self, path, key_fields):
+        self.path = path
+        self.key_fields = key_fields
+        self.results = {}
+        ends_with_newline = True
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    ends_with_newline = line.endswith("\n")
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a line cut short by a crash; that item is simply redone
+                        continue
+                    self.results[self.key(record)] = record["result"]
+        self.file = open(path, "a")
+        if not ends_with_newline:
+            # start after the cut line instead of gluing the next record onto it
+            self.file.write("\n")
+            self.file.flush()
+
+    def key(self, record):
+        return tuple(record[field] for field in self.key_fields)
+
+    def append(self, keys, result):
+        self.file.write(json.dumps({**keys, "result": result}) + "\n")
+        self.file.flush()
+        self.results[self.key(keys)] = result
+
+    def close(self):
+        self.file.close()
+
+
+def load_products(path):
+    import pandas as pd
+
+    products_df = pd.read_csv(path)
+    for column in ["categories", "details", "description", "features"]:
+        products_df[column] = products_df[column].apply(literal_eval)
+    return products_df.to_dict("records")
+
+
+async def run_stage(stage, products, servers, out_dir, retries=3, workers_per_server=8, backoff=1.0, log_every=50):
+    key_fields, items, enrich = STAGES[stage]
+    checkpoint = JsonlCheckpoint(os.path.join(out_dir, f"{stage}.jsonl"), key_fields)
+    pending = [(keys, item) for keys, item in items(products) if checkpoint.key(keys) not in checkpoint.results]
+    print(f"{stage}: {len(checkpoint.results)} done, {len(pending)} to go")
+    errors_path = os.path.join(out_dir, f"{stage}.errors.jsonl")
+    start = time.perf_counter()
+    done = failed = 0
+    # a fixed pool of workers per server pulls from a bounded queue, whatever the catalog size
+    queue = asyncio.Queue(maxsize=2 * workers_per_server * len(servers))
+
+    async def enrich_one(chains, semaphore, keys, item):
+        nonlocal done, failed
+        error = None
+        for attempt in range(retries):
+            if attempt:
+                # back off without holding the server's slot
+                await asyncio.sleep(backoff * 2 ** (attempt - 1))
+            try:
+                # the semaphore bounds requests in flight per server across stages
+                async with semaphore:
+                    result = await enrich(chains, item)
+            except Exception as e:
+                error = e
+                continue
+            checkpoint.append(keys, result)
+            done += 1
+            break
+        else:
+            failed += 1
+            with open(errors_path, "a") as f:
+                f.write(json.dumps({**keys, "error": str(error)}) + "\n")
+        if (done + failed) % log_every == 0:
+            rate = (done + failed) / (time.perf_counter() - start)
+            remaining = (len(pending) - done - failed) / rate
+            print(f"{stage}: {done + failed}/{len(pending)} ({rate:.2f}/s, ~{remaining / 3600:.1f}h left, {failed} failed)")
+
+    async def worker(chains, semaphore):
+        while True:
+            entry = await queue.get()
+            try:
+                if entry is None:
+                    return
+                await enrich_one(chains, semaphore, *entry)
+            finally:
+                queue.task_done()
+
+    workers = [
+        asyncio.create_task(worker(chains, semaphore))
+        for chains, semaphore in servers
+        for _ in range(workers_per_server)
+    ]
+
+    async def produce():
+        for entry in pending:
+            await queue.put(entry)
+        for _ in workers:
+            await queue.put(None)
+
+    tasks = workers + [asyncio.create_task(produce())]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        checkpoint.close()
+    seconds = time.perf_counter() - start
+    print(f"{stage}: enriched {done} in {seconds:.0f}s")
+    if failed:
+        print(f"{stage}: {failed} failed after {retries} attempts, rerun to retry them (see {errors_path})")
+    return done, failed
+
+
+async def run(products_path, out_dir, stages, base_urls, concurrency=8, retries=3, model=OLLAMA_MODEL):
+    os.makedirs(out_dir, exist_ok=True)
+    products = load_products(products_path)
+    servers = [(EnrichmentChains(base_url, model), asyncio.Semaphore(concurrency)) for base_url in base_urls]
+    # stages are independent, so they share the servers
+    return await asyncio.gather(
+        *[run_stage(stage, products, servers, out_dir, retries, workers_per_server=concurrency) for stage in stages]
+    )
+
+
+def export(products_path, out_dir, target_dir=None):
+    """Write the enrichment results in the formats kg_loader.py reads, aligned with the product rows."""
+    target_dir = target_dir or out_dir
+    products = load_products(products_path)
+
+    def results(stage):
+        path = os.path.join(out_dir, f"{stage}.jsonl")
+        return JsonlCheckpoint(path, STAGES[stage][0]).results if os.path.exists(path) else {}
+
+    keywords, attributes, summaries = results("keywords"), results("attributes"), results("summaries")
+    with open(os.path.join(target_dir, "keywords.pkl"), "wb") as f:
+        pickle.dump([keywords.get((product["parent_asin"],)) for product in products], f)
+    with open(os.path.join(target_dir, "product_attributes.json"), "w") as f:
+        json.dump([attributes.get((product["parent_asin"],)) for product in products], f)
+    with open(os.path.join(target_dir, "summaries.json"), "w") as f:
+        json.dump(
+            [
+                {"index": index, "summary": summaries[(product["parent_asin"],)]}
+                for index, product in enumerate(products)
+                if (product["parent_asin"],) in summaries
+            ],
+            f,
+        )
+    with open(os.path.join(target_dir, "use_cases.json"), "w") as f:
+        json.dump(
+            [
+                {**use_case, "subcategory": subcategory, "main_category": main_category}
+                for (main_category, subcategory), use_cases in results("use_cases").items()
+                for use_case in use_cases
+            ],
+            f,
+            indent=2,
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Enrich the product catalog with an LLM")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--products", required=True)
+    run_parser.add_argument("--out-dir", required=True)
+    run_parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    run_parser.add_argument(
+        "--base-url", action="append", help="Ollama server, repeat to spread the work over several"
+    )
+    run_parser.add_argument("--model", default=OLLAMA_MODEL)
+    run_parser.add_argument("--concurrency", type=int, default=8, help="requests in flight per server")
+    run_parser.add_argument("--retries", type=int, default=3)
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("--products", required=True)
+    export_parser.add_argument("--out-dir", required=True)
+    export_parser.add_argument("--target-dir")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        asyncio.run(
+            run(
+                args.products,
+                args.out_dir,
+                args.stages,
+                args.base_url or [None],
+                concurrency=args.concurrency,
+                retries=args.retries,
+                model=args.model,
+            )
+        )
+    else:
+        export(args.products, args.out_dir, args.target_dir)
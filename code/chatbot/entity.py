@@ -5,6 +5,7 @@ from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 
 from utils2 import llm_precise
+from llm_cache import LAST_LINE_QUERY, cached
 
 class Product(BaseModel):
     category: str = Field(
@@ -47,4 +48,4 @@ prompt = PromptTemplate(
     partial_variables={"format_instructions": parser.get_format_instructions()},
 )
 
-entity_identification_chain = prompt | llm_precise | parser
\ No newline at end of file
+entity_identification_chain = prompt | cached(llm_precise, "entity", LAST_LINE_QUERY) | parser
\ No newline at end of file
@@ -0,0 +1,43 @@
+"""asyncio clients (httpx, Qdrant, the Neo4j async driver) bind to the event loop they
+are first used on, so each running loop gets its own instance."""
+import asyncio
+import threading
+import weakref
+from functools import wraps
+
+_lock = threading.Lock()
+# (instances by loop, close coroutine function) for every decorated factory
+_registry = []
+
+
+def per_event_loop(close):
+    """Create the object once per running event loop; `close(instance)` is awaited on shutdown."""
+
+    def decorate(factory):
+        instances = weakref.WeakKeyDictionary()
+
+        @wraps(factory)
+        def get():
+            loop = asyncio.get_running_loop()
+            with _lock:
+                if loop not in instances:
+                    instances[loop] = factory()
+                return instances[loop]
+
+        _registry.append((instances, close))
+        return get
+
+    return decorate
+
+
+async def close_event_loop_resources():
+    """Close every per-loop instance created on the running loop, e.g. at the end of a lifespan."""
+    loop = asyncio.get_running_loop()
+    for instances, close in _registry:
+        with _lock:
+            instance = instances.pop(loop, None)
+        if instance is not None:
+            try:
+                await close(instance)
+            except Exception as e:
+                print("Closing an event loop resource failed:", e)
@@ -0,0 +1,143 @@
+import asyncio
+import random
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from embedding_registry import DENSE_MODEL, get_dense_model
+
+
+class EmbeddingIntentClassifier:
+    """Nearest-centroid intent classifier over MiniLM embeddings of the labelled few-shot examples."""
+
+    def __init__(
+        self,
+        examples,
+        threshold=0.7,
+        temperature=0.05,
+        shadow_rate=0.05,
+        max_observations=5000,
+        model_name=DENSE_MODEL,
+    ):
+        self.threshold = threshold
+        self.temperature = temperature
+        # fraction of fast-path answers that are also labelled by the LLM in the background
+        self.shadow_rate = shadow_rate
+        self.model = get_dense_model(model_name)
+
+        texts = [example["input"] for example in examples]
+        labels = [example["output"] for example in examples]
+        embeddings = self._embed(texts)
+        self.labels = sorted(set(labels))
+        label_array = np.array(labels)
+        centroids = np.stack(
+            [embeddings[label_array == label].mean(axis=0) for label in self.labels]
+        )
+        self.centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+        self.counts = Counter()
+        # (confidence, fast label, LLM label, weight) for every message the LLM also labelled;
+        # shadowed answers stand for 1 / shadow_rate fast-path messages each
+        self.observations = deque(maxlen=max_observations)
+        self._lock = threading.Lock()
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1)
+        self._shadow_tasks = set()
+
+    def _embed(self, texts):
+        embeddings = np.array(list(self.model.embed(texts)), dtype=np.float32)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    def predict(self, text):
+        similarities = self.centroids @ self._embed([text])[0]
+        logits = similarities / self.temperature
+        probabilities = np.exp(logits - logits.max())
+        probabilities /= probabilities.sum()
+        best = int(np.argmax(probabilities))
+        return self.labels[best], float(probabilities[best])
+
+    def classify(self, text, llm_classify):
+        """Answer from the centroids when confident enough, otherwise ask `llm_classify`."""
+        label, confidence = self.predict(text)
+        if confidence >= self.threshold:
+            with self._lock:
+                self.counts["fast_path"] += 1
+            if random.random() < self.shadow_rate:
+                self._shadow_executor.submit(self._shadow, text, label, confidence, llm_classify)
+            return label
+
+        with self._lock:
+            self.counts["llm_fallback"] += 1
+        llm_label = llm_classify(text)
+        self.record(label, confidence, llm_label)
+        return llm_label
+
+    async def aclassify(self, text, allm_classify):
+        """Async variant of `classify`; `allm_classify` is a coroutine function."""
+        label, confidence = await asyncio.to_thread(self.predict, text)
+        if confidence >= self.threshold:
+            with self._lock:
+                self.counts["fast_path"] += 1
+            if random.random() < self.shadow_rate:
+                task = asyncio.create_task(self._ashadow(text, label, confidence, allm_classify))
+                # keep a reference until the task is done so it is not garbage collected
+                self._shadow_tasks.add(task)
+                task.add_done_callback(self._shadow_tasks.discard)
+            return label
+
+        with self._lock:
+            self.counts["llm_fallback"] += 1
+        llm_label = await allm_classify(text)
+        self.record(label, confidence, llm_label)
+        return llm_label
+
+    async def _ashadow(self, text, label, confidence, allm_classify):
+        try:
+            self.record(label, confidence, await allm_classify(text), weight=1 / self.shadow_rate)
+        except Exception as e:
+            print("Shadow intent classification failed:", e)
+
+    def _shadow(self, text, label, confidence, llm_classify):
+        try:
+            self.record(label, confidence, llm_classify(text), weight=1 / self.shadow_rate)
+        except Exception as e:
+            print("Shadow intent classification failed:", e)
+
+    def record(self, label, confidence, llm_label, weight=1.0):
+        with self._lock:
+            self.observations.append((confidence, label, llm_label, weight))
+
+    def report(self, thresholds=(0.5, 0.6, 0.7, 0.8, 0.9, 0.95)):
+        with self._lock:
+            counts = Counter(self.counts)
+            observations = list(self.observations)
+        total = counts["fast_path"] + counts["llm_fallback"]
+        shadowed = [obs for obs in observations if obs[0] >= self.threshold]
+
+        def weight(rows):
+            return sum(row[3] for row in rows)
+
+        def agreement(rows):
+            if not rows:
+                return None
+            return sum(row[3] for row in rows if row[1] == row[2]) / weight(rows)
+
+        # How a different threshold would have behaved on the messages the LLM also labelled,
+        # with the sampled fast-path answers weighted back up to the traffic they stand for
+        sweep = {}
+        for threshold in thresholds:
+            above = [obs for obs in observations if obs[0] >= threshold]
+            sweep[threshold] = {
+                "coverage": weight(above) / weight(observations) if observations else None,
+                "accuracy": agreement(above),
+            }
+        return {
+            "threshold": self.threshold,
+            "messages": total,
+            "fast_path": counts["fast_path"],
+            "llm_fallback": counts["llm_fallback"],
+            "fast_path_rate": counts["fast_path"] / total if total else 0.0,
+            "fast_path_accuracy": agreement(shadowed),
+            "labelled_observations": len(observations),
+            "threshold_sweep": sweep,
+        }
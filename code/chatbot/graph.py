@@ -1,33 +1,43 @@
+import os
+
 from langgraph.graph import START, StateGraph, MessagesState, END
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from langchain_core.runnables import RunnableLambda
 
-from utils2 import OverallState
-from intent import get_intent
+from utils2 import OverallState, resource
+from intent import get_intent, async_get_intent
 from entity import entity_identification_chain
-from others import product_reference_chain, product_reference_list_chain, explain_product, explain_reviews, compare_products
-from product_search import product_search
-from recommendation import recommendation
-
+from others import (
+    product_reference_chain,
+    product_reference_list_chain,
+    explain_product,
+    aexplain_product,
+    explain_reviews,
+    aexplain_reviews,
+    compare_products,
+    acompare_products,
+)
+from product_search import product_search, aproduct_search
+from recommendation import recommendation, arecommendation
+from speculation import SpeculativeRouter
+from checkpoint import BoundedMemorySaver, SQLiteCheckpointSaver
+from instrumentation import timed_node
 
-def intent_router(state: MessagesState) -> OverallState:
-    user_input = state["messages"][-1]
-    return {"intent": get_intent(user_input)}
-
-def entity_identification(state: OverallState) -> OverallState:        
-    user_input = state["messages"][-1]
-    entities = entity_identification_chain.invoke({"query": user_input})
-    return {"entities": entities}
+# Comma-separated speculative calls to run alongside intent classification, e.g.
+# "entity_identification,product_reference,product_list_reference". Empty disables it.
+speculative_targets = [
+    target.strip()
+    for target in os.getenv("SPECULATIVE_ROUTING", "").split(",")
+    if target.strip()
+]
+speculative_router = SpeculativeRouter(speculative_targets) if speculative_targets else None
 
-def hello(state: OverallState) -> MessagesState:
-    greeting = "Welcome! You can ask me to help you find products, answer questions about a product, or explore related items. Just describe what you're looking for (e.g., I need a nutrient rich moisturizer), and I'll assist!"
-    return {"messages": AIMessage(greeting)}
+# Messages kept in the thread state after each turn. The reference chains only read the
+# last couple of messages, and product_ids is replaced by every new listing.
+conversation_window = int(os.getenv("CONVERSATION_WINDOW", "6"))
 
-def bye(state: OverallState) -> MessagesState:
-    return {"messages": AIMessage("Goodbye!")}
 
-def product_reference(state: OverallState) -> OverallState:
-    user_input = state["messages"][-1]
+def reference_history(state: OverallState):
     # remove metadata from the last 3 messages
     history = []
     for message in state["messages"][-3:-1]:
@@ -35,33 +45,138 @@ def product_reference(state: OverallState) -> OverallState:
             history.append(HumanMessage(message.content))
         else:
             history.append(AIMessage(message.content))
-    # last 3 messages are the product details
-    product_index = product_reference_chain.invoke(
-        {"history": history, "query": user_input}
+    return history
+
+
+def identify_entities(user_input):
+    # the message text only; its repr carries a per-message id that defeats the LLM cache
+    return entity_identification_chain.invoke({"query": getattr(user_input, "content", user_input)})
+
+async def aidentify_entities(user_input):
+    return await entity_identification_chain.ainvoke({"query": getattr(user_input, "content", user_input)})
+
+def resolve_product_index(history, user_input):
+    return product_reference_chain.invoke(
+        {"history": history, "query": getattr(user_input, "content", user_input)}
     ).product_index
-    
+
+async def aresolve_product_index(history, user_input):
+    return (await product_reference_chain.ainvoke(
+        {"history": history, "query": getattr(user_input, "content", user_input)}
+    )).product_index
+
+def resolve_product_indices(history, user_input):
+    return product_reference_list_chain.invoke(
+        {"history": history, "query": getattr(user_input, "content", user_input)}
+    ).product_references
+
+async def aresolve_product_indices(history, user_input):
+    return (await product_reference_list_chain.ainvoke(
+        {"history": history, "query": getattr(user_input, "content", user_input)}
+    )).product_references
+
+def speculative_calls(state: OverallState, asynchronous=False):
+    user_input = state["messages"][-1]
+    if asynchronous:
+        identify, resolve_index, resolve_indices = aidentify_entities, aresolve_product_index, aresolve_product_indices
+    else:
+        identify, resolve_index, resolve_indices = identify_entities, resolve_product_index, resolve_product_indices
+    calls = {"entity_identification": lambda: identify(user_input)}
+    # references only make sense once products have been listed in this thread
+    if state.get("product_ids"):
+        history = reference_history(state)
+        calls["product_reference"] = lambda: resolve_index(history, user_input)
+        calls["product_list_reference"] = lambda: resolve_indices(history, user_input)
+    return calls
+
+def keep_previous_index(state: OverallState, product_index):
     if product_index == -1:
         if "product_index" in state and state["product_index"] is not None:
             product_index = state["product_index"]
-    return {"product_index": product_index}
+    return product_index
 
-def product_list_reference(state: OverallState) -> OverallState:
-    user_input = state["messages"][-1]
-    # remove metadata from the last 3 messages
-    history = []
-    for message in state["messages"][-3:-1]:
-        if isinstance(message, HumanMessage):
-            history.append(HumanMessage(message.content))
-        else:
-            history.append(AIMessage(message.content))
-    # last 3 messages are the product details
-    product_indices = product_reference_list_chain.invoke(
-        {"history": history, "query": user_input}
-    ).product_references
+def keep_previous_indices(state: OverallState, product_indices):
     if product_indices == []:
         if "product_indices" in state and state["product_indices"] is not None:
             product_indices = state["product_indices"]
-    return {"product_indices": product_indices}
+    return product_indices
+
+def intent_router(state: OverallState) -> OverallState:
+    user_input = state["messages"][-1]
+    if speculative_router is None:
+        return {"intent": get_intent(user_input), "speculative": None}
+    intent, results = speculative_router.route(
+        lambda: get_intent(user_input), speculative_calls(state)
+    )
+    return {"intent": intent, "speculative": results}
+
+async def aintent_router(state: OverallState) -> OverallState:
+    user_input = state["messages"][-1]
+    if speculative_router is None:
+        return {"intent": await async_get_intent(user_input), "speculative": None}
+    intent, results = await speculative_router.aroute(
+        lambda: async_get_intent(user_input), speculative_calls(state, asynchronous=True)
+    )
+    return {"intent": intent, "speculative": results}
+
+def entity_identification(state: OverallState) -> OverallState:
+    speculative = state.get("speculative") or {}
+    if "entity_identification" in speculative:
+        return {"entities": speculative["entity_identification"]}
+    return {"entities": identify_entities(state["messages"][-1])}
+
+async def aentity_identification(state: OverallState) -> OverallState:
+    speculative = state.get("speculative") or {}
+    if "entity_identification" in speculative:
+        return {"entities": speculative["entity_identification"]}
+    return {"entities": await aidentify_entities(state["messages"][-1])}
+
+def hello(state: OverallState) -> MessagesState:
+    greeting = "Welcome! You can ask me to help you find products, answer questions about a product, or explore related items. Just describe what you're looking for (e.g., I need a nutrient rich moisturizer), and I'll assist!"
+    return {"messages": AIMessage(greeting)}
+
+async def ahello(state: OverallState) -> MessagesState:
+    return hello(state)
+
+def bye(state: OverallState) -> MessagesState:
+    return {"messages": AIMessage("Goodbye!")}
+
+async def abye(state: OverallState) -> MessagesState:
+    return bye(state)
+
+def product_reference(state: OverallState) -> OverallState:
+    speculative = state.get("speculative") or {}
+    if "product_reference" in speculative:
+        product_index = speculative["product_reference"]
+    else:
+        # last 3 messages are the product details
+        product_index = resolve_product_index(reference_history(state), state["messages"][-1])
+    return {"product_index": keep_previous_index(state, product_index)}
+
+async def aproduct_reference(state: OverallState) -> OverallState:
+    speculative = state.get("speculative") or {}
+    if "product_reference" in speculative:
+        product_index = speculative["product_reference"]
+    else:
+        product_index = await aresolve_product_index(reference_history(state), state["messages"][-1])
+    return {"product_index": keep_previous_index(state, product_index)}
+
+def product_list_reference(state: OverallState) -> OverallState:
+    speculative = state.get("speculative") or {}
+    if "product_list_reference" in speculative:
+        product_indices = speculative["product_list_reference"]
+    else:
+        # last 3 messages are the product details
+        product_indices = resolve_product_indices(reference_history(state), state["messages"][-1])
+    return {"product_indices": keep_previous_indices(state, product_indices)}
+
+async def aproduct_list_reference(state: OverallState) -> OverallState:
+    speculative = state.get("speculative") or {}
+    if "product_list_reference" in speculative:
+        product_indices = speculative["product_list_reference"]
+    else:
+        product_indices = await aresolve_product_indices(reference_history(state), state["messages"][-1])
+    return {"product_indices": keep_previous_indices(state, product_indices)}
 
 def information_retrieval(state: OverallState) -> MessagesState:
     query = state["messages"][-1].content
@@ -70,12 +185,24 @@ def information_retrieval(state: OverallState) -> MessagesState:
     response = explain_product(query, product_id)
     return {"messages": response}
 
+async def ainformation_retrieval(state: OverallState) -> MessagesState:
+    query = state["messages"][-1].content
+    product_id = state["product_ids"][state["product_index"]]
+    response = await aexplain_product(query, product_id)
+    return {"messages": response}
+
 def reviews(state: OverallState) -> MessagesState:
     query = state["messages"][-1].content
     product_id = state["product_ids"][state["product_index"]]
     response = explain_reviews(query, product_id)
     return {"messages": response}
 
+async def areviews(state: OverallState) -> MessagesState:
+    query = state["messages"][-1].content
+    product_id = state["product_ids"][state["product_index"]]
+    response = await aexplain_reviews(query, product_id)
+    return {"messages": response}
+
 def comparison(state: OverallState) -> MessagesState:
     query = state["messages"][-1].content
     product_indices = state["product_indices"]
@@ -83,48 +210,90 @@ def comparison(state: OverallState) -> MessagesState:
     response = compare_products(query, product_ids)
     return {"messages": response}
 
+async def acomparison(state: OverallState) -> MessagesState:
+    query = state["messages"][-1].content
+    product_ids = [state["product_ids"][index] for index in state["product_indices"]]
+    response = await acompare_products(query, product_ids)
+    return {"messages": response}
+
+def compact(state: OverallState) -> OverallState:
+    # drop old messages and per-turn data so the saved checkpoint stays small
+    stale = state["messages"][:-conversation_window]
+    return {
+        "messages": [RemoveMessage(id=message.id) for message in stale],
+        "entities": None,
+        "speculative": None,
+    }
+
+async def acompact(state: OverallState) -> OverallState:
+    return compact(state)
+
 
 # Graph
-builder = StateGraph(OverallState, input=MessagesState, output=MessagesState)
-
-# Define nodes: these do the work
-builder.add_node("intent_router", intent_router)
-builder.add_node("entity_identification", entity_identification)
-builder.add_node("product_reference", product_reference)
-builder.add_node("product_list_reference", product_list_reference)
-builder.add_node("greetings", hello)
-builder.add_node("product_search", product_search)
-builder.add_node("information_retrieval", information_retrieval)
-builder.add_node("reviews", reviews)
-builder.add_node("comparison", comparison)
-builder.add_node("recommendation", recommendation)
-builder.add_node("bye", bye)
-
-# Define edges: these determine how the control flow moves
-builder.add_edge(START, "intent_router")
-# edge from intent_router to each intent node
-intent_dict = {
-    "greetings": "greetings",
-    "product_search": "entity_identification",
-    "information_retrieval": "product_reference",
-    "reviews": "product_reference",
-    "comparison": "product_list_reference",
-    "recommendation": "entity_identification",
-    "bye": "bye",
-    "noclass": "greetings"
-}
-builder.add_conditional_edges("intent_router", lambda state: state["intent"], intent_dict)
-builder.add_conditional_edges("entity_identification", lambda state: state["intent"], ["product_search", "recommendation"])
-builder.add_conditional_edges("product_reference", lambda state: state["intent"], ["information_retrieval", "reviews"])
-builder.add_conditional_edges("product_list_reference", lambda state: state["intent"], ["comparison"])
-builder.add_edge("greetings", END)
-builder.add_edge("product_search", END)
-builder.add_edge("information_retrieval", END)
-builder.add_edge("reviews", END)
-builder.add_edge("comparison", END)
-builder.add_edge("recommendation", END)
-builder.add_edge("bye", END)
-
-# Writes the state in every step of the graph
-memory = MemorySaver()
-react_graph = builder.compile(checkpointer=memory)
\ No newline at end of file
+def build_graph():
+    builder = StateGraph(OverallState, input=MessagesState, output=MessagesState)
+
+    # Define nodes: these do the work. Each node has a sync and an async implementation,
+    # so graph.invoke runs the blocking path and graph.ainvoke the asyncio one.
+    nodes = {
+        "intent_router": (intent_router, aintent_router),
+        "entity_identification": (entity_identification, aentity_identification),
+        "product_reference": (product_reference, aproduct_reference),
+        "product_list_reference": (product_list_reference, aproduct_list_reference),
+        "greetings": (hello, ahello),
+        "product_search": (product_search, aproduct_search),
+        "information_retrieval": (information_retrieval, ainformation_retrieval),
+        "reviews": (reviews, areviews),
+        "comparison": (comparison, acomparison),
+        "recommendation": (recommendation, arecommendation),
+        "bye": (bye, abye),
+        "compact": (compact, acompact),
+    }
+    for name, (func, afunc) in nodes.items():
+        func, afunc = timed_node(name, func, afunc)
+        builder.add_node(name, RunnableLambda(func, afunc=afunc, name=name))
+
+    # Define edges: these determine how the control flow moves
+    builder.add_edge(START, "intent_router")
+    # edge from intent_router to each intent node
+    intent_dict = {
+        "greetings": "greetings",
+        "product_search": "entity_identification",
+        "information_retrieval": "product_reference",
+        "reviews": "product_reference",
+        "comparison": "product_list_reference",
+        "recommendation": "entity_identification",
+        "bye": "bye",
+        "noclass": "greetings"
+    }
+    builder.add_conditional_edges("intent_router", lambda state: state["intent"], intent_dict)
+    builder.add_conditional_edges("entity_identification", lambda state: state["intent"], ["product_search", "recommendation"])
+    builder.add_conditional_edges("product_reference", lambda state: state["intent"], ["information_retrieval", "reviews"])
+    builder.add_conditional_edges("product_list_reference", lambda state: state["intent"], ["comparison"])
+    # every answer goes through compaction before the turn ends
+    for node in ["greetings", "product_search", "information_retrieval", "reviews", "comparison", "recommendation", "bye"]:
+        builder.add_edge(node, "compact")
+    builder.add_edge("compact", END)
+
+    return builder
+
+
+def create_checkpointer():
+    retention = dict(
+        keep_checkpoints=int(os.getenv("CHECKPOINT_KEEP", "2")),
+        ttl_seconds=float(os.getenv("CHECKPOINT_TTL_SECONDS", "3600")),
+        max_threads=int(os.getenv("CHECKPOINT_MAX_THREADS", "1000")),
+    )
+    # A database path lets several worker processes on this host share conversations
+    checkpoint_db = os.getenv("PASA_CHECKPOINT_DB")
+    if checkpoint_db:
+        return SQLiteCheckpointSaver(checkpoint_db, **retention)
+    return BoundedMemorySaver(
+        max_bytes=int(float(os.getenv("CHECKPOINT_MAX_MB", "256")) * 1024 * 1024), **retention
+    )
+
+
+@resource
+def get_react_graph():
+    # Writes the state in every step of the graph; old checkpoints and idle threads are dropped
+    return build_graph().compile(checkpointer=create_checkpointer())
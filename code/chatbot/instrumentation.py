@@ -0,0 +1,133 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import Counter, Histogram
+
+# Prometheus metrics, aggregated over all turns of the process
+TURN_SECONDS = Histogram("pasa_turn_seconds", "Wall time of a full graph turn")
+NODE_SECONDS = Histogram("pasa_node_seconds", "Wall time of a graph node", ["node"])
+NEO4J_SECONDS = Histogram("pasa_neo4j_query_seconds", "Neo4j query time", ["statement"])
+NEO4J_ROWS = Counter("pasa_neo4j_rows", "Rows returned by Neo4j queries", ["statement"])
+NEO4J_FAILURES = Counter("pasa_neo4j_failures", "Failed Neo4j queries", ["statement"])
+QDRANT_SECONDS = Histogram("pasa_qdrant_search_seconds", "Qdrant hybrid search time", ["collection"])
+QDRANT_HITS = Counter("pasa_qdrant_hits", "Points returned by Qdrant searches", ["collection"])
+RERANK_SECONDS = Histogram("pasa_rerank_seconds", "Rerank call time", ["backend"])
+LLM_TOKENS = Counter("pasa_llm_tokens", "LLM tokens", ["model", "kind"])
+
+# the trace of the turn being served; nodes running in worker threads or tasks inherit it
+current_trace = ContextVar("current_trace", default=None)
+
+
+class TurnTrace:
+    """Spans and token counts of one graph turn, in the order they finished."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self.tokens = {"prompt": 0, "completion": 0}
+
+    def add(self, kind, name, seconds, **attributes):
+        # list.append is atomic, so spans from worker threads need no lock
+        self.spans.append({"kind": kind, "name": name, "ms": round(seconds * 1000, 1), **attributes})
+
+    def summary(self):
+        return {
+            "total_ms": round((time.perf_counter() - self.start) * 1000, 1),
+            "tokens": dict(self.tokens),
+            "spans": list(self.spans),
+        }
+
+
+@contextmanager
+def start_turn():
+    trace = TurnTrace()
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+        TURN_SECONDS.observe(time.perf_counter() - trace.start)
+
+
+def _trace(kind, name, seconds, **attributes):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(kind, name, seconds, **attributes)
+
+
+def record_node(node, seconds):
+    NODE_SECONDS.labels(node).observe(seconds)
+    _trace("node", node, seconds)
+
+
+def record_neo4j(statement, rows, seconds, success=True):
+    NEO4J_SECONDS.labels(statement).observe(seconds)
+    if success:
+        NEO4J_ROWS.labels(statement).inc(rows)
+    else:
+        NEO4J_FAILURES.labels(statement).inc()
+    _trace("neo4j", statement, seconds, rows=rows, success=success)
+
+
+def record_qdrant(collection, hits, seconds):
+    QDRANT_SECONDS.labels(collection).observe(seconds)
+    QDRANT_HITS.labels(collection).inc(hits)
+    _trace("qdrant", collection, seconds, hits=hits)
+
+
+def record_rerank(backend, documents, seconds):
+    RERANK_SECONDS.labels(backend).observe(seconds)
+    _trace("rerank", backend, seconds, documents=documents)
+
+
+def timed_node(name, func, afunc):
+    """Wrap the sync and async implementation of a graph node so each run is timed."""
+
+    @wraps(func)
+    def run(state):
+        start = time.perf_counter()
+        try:
+            return func(state)
+        finally:
+            record_node(name, time.perf_counter() - start)
+
+    @wraps(afunc)
+    async def arun(state):
+        start = time.perf_counter()
+        try:
+            return await afunc(state)
+        finally:
+            record_node(name, time.perf_counter() - start)
+
+    return run, arun
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Counts prompt and completion tokens of every chat model call."""
+
+    def on_llm_end(self, response, **kwargs):
+        model = (response.llm_output or {}).get("model_name", "unknown")
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+        if not prompt_tokens and not completion_tokens:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+
+        LLM_TOKENS.labels(model, "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(model, "completion").inc(completion_tokens)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.tokens["prompt"] += prompt_tokens
+            trace.tokens["completion"] += completion_tokens
+
+
+token_usage_callback = TokenUsageCallback()
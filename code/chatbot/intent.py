@@ -1,11 +1,14 @@
 import json
+import os
 import re
-from typing import Literal
+from typing import Literal, get_args
 
 from pydantic import BaseModel, Field, field_validator
 from langchain_core.prompts import PromptTemplate, FewShotPromptTemplate
 
-from utils2 import llm_precise
+from utils2 import llm_precise, resource
+from fast_intent import EmbeddingIntentClassifier
+from llm_cache import cached
 
 class MessageClassification(BaseModel):
     
@@ -37,9 +40,13 @@ class MessageClassification(BaseModel):
             raise ValueError(f"Category must be one of {valid_categories}")
         return value
     
-examples_path = "/project/data/examples-intent-classification.json"
-with open(examples_path) as f:
-    intent_examples = json.load(f)
+examples_path = os.getenv("INTENT_EXAMPLES_PATH", "/project/data/examples-intent-classification.json")
+
+
+@resource
+def get_intent_examples():
+    with open(examples_path) as f:
+        return json.load(f)
 
 prompt_prefix = """
 <context>
@@ -99,20 +106,55 @@ example_prompt_template = PromptTemplate(
     output_variables=["output"]
 ) 
 
-few_shot_template = FewShotPromptTemplate(
-    examples=intent_examples,
-    example_prompt=example_prompt_template,
-    prefix=prompt_prefix,
-    suffix=prompt_suffix,
-)
-intent_classifier = few_shot_template | llm_precise
+@resource
+def get_intent_classifier():
+    few_shot_template = FewShotPromptTemplate(
+        examples=get_intent_examples(),
+        example_prompt=example_prompt_template,
+        prefix=prompt_prefix,
+        suffix=prompt_suffix,
+    )
+    return few_shot_template | cached(llm_precise, "intent", r"(?s).*<input>(.*?)</input>")
 
-async def async_get_intent(user_input: str) -> str:
-    output = intent_classifier.invoke(user_input).content
+def llm_get_intent(user_input: str) -> str:
+    output = get_intent_classifier().invoke(user_input).content
     category = re.search(r"<output>(.*?)</output>", output).group(1)
     return MessageClassification(category=category).category
 
-def get_intent(user_input: str) -> str:
-    output = intent_classifier.invoke(user_input).content
+# Local fast path: answer confidently classified messages from example centroids
+# and only send the rest to the LLM. It is off until INTENT_FAST_PATH_THRESHOLD is set,
+# chosen from the report's threshold_sweep; a threshold above 1 sends every message to
+# the LLM and records them all, to calibrate.
+fast_path_threshold = os.getenv("INTENT_FAST_PATH_THRESHOLD")
+
+@resource
+def get_fast_intent_classifier():
+    if fast_path_threshold is None:
+        return None
+    valid_categories = get_args(MessageClassification.model_fields["category"].annotation)
+    return EmbeddingIntentClassifier(
+        [example for example in get_intent_examples() if example["output"] in valid_categories],
+        threshold=float(fast_path_threshold),
+        shadow_rate=float(os.getenv("INTENT_FAST_PATH_SHADOW_RATE", "0.05")),
+    )
+
+async def allm_get_intent(user_input: str) -> str:
+    output = (await get_intent_classifier().ainvoke(user_input)).content
     category = re.search(r"<output>(.*?)</output>", output).group(1)
-    return MessageClassification(category=category).category
\ No newline at end of file
+    return MessageClassification(category=category).category
+
+async def async_get_intent(user_input: str) -> str:
+    text = getattr(user_input, "content", user_input)
+    fast_intent_classifier = get_fast_intent_classifier()
+    if fast_intent_classifier is None:
+        return await allm_get_intent(text)
+    category = await fast_intent_classifier.aclassify(text, allm_get_intent)
+    return MessageClassification(category=category).category
+
+def get_intent(user_input: str) -> str:
+    text = getattr(user_input, "content", user_input)
+    fast_intent_classifier = get_fast_intent_classifier()
+    if fast_intent_classifier is None:
+        return llm_get_intent(text)
+    category = fast_intent_classifier.classify(text, llm_get_intent)
+    return MessageClassification(category=category).category
@@ -0,0 +1,374 @@
+"""Load the product knowledge graph from the prepared data files.
+
+    python kg_loader.py --products ../../data/products_0.001.csv \\
+        --attributes ../../data/product_attributes.json --summaries ../../data/summaries.json \\
+        --keywords ../../data/keywords.pkl --use-cases ../../data/use_cases.json \\
+        --reviews ../../data/reviews_0.001.json
+
+Every statement is an `UNWIND $rows` MERGE, so reruns are idempotent. Node types are
+loaded in parallel, then the relationships. Progress is saved after each committed
+batch, and after a crash the same command resumes from the checkpoint. Near-duplicate
+keywords and use-case titles are merged first, as the notebook does with reduce_keys.
+"""
+import json
+import os
+import threading
+import time
+from ast import literal_eval
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# the same intervals the in-process catalog index computes for the price filter
+from catalog_index import get_price_range
+
+NODE_STATEMENTS = {
+    "categories": "UNWIND $rows AS row MERGE (:Category {name: row.name})",
+    "subcategories": "UNWIND $rows AS row MERGE (:Subcategory {name: row.name})",
+    "products": """
+UNWIND $rows AS row
+MERGE (p:Product {product_id: row.product_id})
+SET p += row
+""".strip(),
+    "price_ranges": """
+UNWIND $rows AS row
+MERGE (:PriceRange {lower_limit: row.lower_limit, upper_limit: row.upper_limit})
+""".strip(),
+    "attributes": "UNWIND $rows AS row MERGE (:Attribute {name: row.name, value: row.value})",
+    "keywords": "UNWIND $rows AS row MERGE (:Keyword {name: row.name})",
+    "use_cases": "UNWIND $rows AS row MERGE (:UseCase {title: row.title})",
+    "reviewers": "UNWIND $rows AS row MERGE (:Reviewer {user_id: row.user_id})",
+    "reviews": """
+UNWIND $rows AS row
+MERGE (r:Review {review_id: row.review_id})
+SET r += row
+""".strip(),
+}
+
+RELATIONSHIP_STATEMENTS = {
+    "subcategory_category": """
+UNWIND $rows AS row
+MATCH (sc:Subcategory {name: row.subcategory})
+MATCH (c:Category {name: row.category})
+MERGE (sc)-[:BELONGS_TO]->(c)
+""".strip(),
+    "product_subcategory": """
+UNWIND $rows AS row
+MATCH (p:Product {product_id: row.product_id})
+MATCH (sc:Subcategory {name: row.subcategory})
+MERGE (p)-[:BELONGS_TO]->(sc)
+""".strip(),
+    "product_price_range": """
+UNWIND $rows AS row
+MATCH (p:Product {product_id: row.product_id})
+MATCH (r:PriceRange {lower_limit: row.lower_limit, upper_limit: row.upper_limit})
+MERGE (p)-[:AROUND_PRICE]->(r)
+""".strip(),
+    "product_attribute": """
+UNWIND $rows AS row
+MATCH (p:Product {product_id: row.product_id})
+MATCH (a:Attribute {name: row.name, value: row.value})
+MERGE (p)-[:HAS_ATTRIBUTE]->(a)
+""".strip(),
+    "product_keyword": """
+UNWIND $rows AS row
+MATCH (p:Product {product_id: row.product_id})
+MATCH (k:Keyword {name: row.keyword})
+MERGE (p)-[:HAS_KEYWORD]->(k)
+""".strip(),
+    "use_case_subcategory": """
+UNWIND $rows AS row
+MATCH (u:UseCase {title: row.title})
+MATCH (sc:Subcategory {name: row.subcategory})
+MERGE (u)-[e:USED_FOR]->(sc)
+SET e.explanation = row.explanation
+""".strip(),
+    "review_product": """
+UNWIND $rows AS row
+MATCH (r:Review {review_id: row.review_id})
+MATCH (p:Product {product_id: row.product_id})
+MERGE (r)-[:REVIEWS]->(p)
+""".strip(),
+    "reviewer_review": """
+UNWIND $rows AS row
+MATCH (r:Review {review_id: row.review_id})
+MATCH (rv:Reviewer {user_id: row.user_id})
+MERGE (rv)-[:WROTE]->(r)
+""".strip(),
+}
+
+
+def simplify_images(images):
+    images_simple = defaultdict(list)
+    for key in images:
+        for link in images[key]:
+            if link and link.startswith("https://"):
+                images_simple[key].append(link)
+    return images_simple
+
+
+def attribute_pairs(attributes):
+    for name, value in attributes.items():
+        for element in value if isinstance(value, list) else [value]:
+            if element is not None:
+                yield name, element
+
+
+def build_rows(
+    products=None,
+    attributes=None,
+    summaries=None,
+    keywords=None,
+    use_cases=None,
+    reviews=None,
+    similarity_threshold=90,
+):
+    """Turn the notebook's data files into {step: rows}, in a stable order so offsets can be resumed.
+
+    Near-duplicate keywords and use-case titles are merged as in the notebook, unless
+    `similarity_threshold` is None.
+    """
+    import pandas as pd
+
+    from reduce_keys import reduce_keys_blocked
+
+    rows = defaultdict(list)
+    product_ids = []
+    if products:
+        products_df = pd.read_csv(products)
+        for column in ["categories", "description", "features", "images"]:
+            products_df[column] = products_df[column].apply(literal_eval)
+        product_ids = list(products_df["parent_asin"])
+        summary_by_index = {}
+        if summaries:
+            with open(summaries) as f:
+                summary_by_index = {entry["index"]: entry["summary"] for entry in json.load(f)}
+
+        categories, subcategories, pairs, price_ranges = set(), set(), set(), set()
+        for index, row in enumerate(products_df.itertuples()):
+            lower_limit, upper_limit = get_price_range(float(row.price))
+            product = {
+                "product_id": row.parent_asin,
+                "title": row.title,
+                "average_rating": float(row.average_rating),
+                "rating_number": int(row.rating_number),
+                "price": float(row.price),
+                "images": json.dumps(simplify_images(row.images)),
+                "store": row.store,
+                "description": list(row.description),
+                "features": list(row.features),
+            }
+            if index in summary_by_index:
+                product["summary"] = summary_by_index[index]
+            rows["products"].append(product)
+            categories.add(row.main_category)
+            price_ranges.add((lower_limit, upper_limit))
+            rows["product_price_range"].append(
+                {"product_id": row.parent_asin, "lower_limit": lower_limit, "upper_limit": upper_limit}
+            )
+            for subcategory in row.categories:
+                subcategories.add(subcategory)
+                pairs.add((subcategory, row.main_category))
+                rows["product_subcategory"].append({"product_id": row.parent_asin, "subcategory": subcategory})
+
+        rows["categories"] = [{"name": name} for name in sorted(categories)]
+        rows["subcategories"] = [{"name": name} for name in sorted(subcategories)]
+        rows["subcategory_category"] = [
+            {"subcategory": subcategory, "category": category} for subcategory, category in sorted(pairs)
+        ]
+        rows["price_ranges"] = [
+            {"lower_limit": lower, "upper_limit": upper} for lower, upper in sorted(price_ranges)
+        ]
+
+    if attributes and product_ids:
+        # one attribute dict per product row, as written by the enrichment step
+        with open(attributes) as f:
+            product_attributes = json.load(f)
+        unique = {}
+        for product_id, entry in zip(product_ids, product_attributes):
+            for name, value in attribute_pairs(entry or {}):
+                unique.setdefault((name, repr(value)), {"name": name, "value": value})
+                rows["product_attribute"].append({"product_id": product_id, "name": name, "value": value})
+        rows["attributes"] = list(unique.values())
+
+    if keywords and product_ids:
+        import pickle
+
+        # per product row: {"extractive": [...], "abstractive": [...]}
+        with open(keywords, "rb") as f:
+            product_keywords = pickle.load(f)
+        product_keyword = [
+            {"product_id": product_id, "keyword": keyword}
+            for product_id, entry in zip(product_ids, product_keywords)
+            for keyword in dict.fromkeys((entry or {}).get("extractive", []) + (entry or {}).get("abstractive", []))
+        ]
+        if similarity_threshold is not None:
+            product_keyword, _ = reduce_keys_blocked(product_keyword, "keyword", similarity_threshold)
+        # a product can list two keywords that were merged into one
+        unique_pairs = dict.fromkeys((row["product_id"], row["keyword"]) for row in product_keyword)
+        rows["product_keyword"] = [{"product_id": product_id, "keyword": keyword} for product_id, keyword in unique_pairs]
+        rows["keywords"] = [{"name": name} for name in sorted({keyword for _, keyword in unique_pairs})]
+
+    if use_cases:
+        with open(use_cases) as f:
+            entries = json.load(f)
+        if similarity_threshold is not None:
+            entries, _ = reduce_keys_blocked(entries, "title", similarity_threshold)
+        rows["use_cases"] = [{"title": title} for title in sorted({entry["title"] for entry in entries})]
+        rows["use_case_subcategory"] = [
+            {"title": entry["title"], "subcategory": entry["subcategory"], "explanation": entry["explanation"]}
+            for entry in entries
+        ]
+
+    if reviews:
+        reviews_df = pd.read_json(reviews)
+        reviews_df.reset_index(inplace=True)
+        reviewers = set()
+        for row in reviews_df.itertuples():
+            if not isinstance(row.title, str) or not isinstance(row.text, str):
+                continue
+            # review ids follow the row order of the reviews file
+            review_id = int(row.index)
+            rows["reviews"].append(
+                {
+                    "review_id": review_id,
+                    "rating": float(row.rating),
+                    "title": row.title,
+                    "text": row.text,
+                    "helpful_vote": int(row.helpful_vote),
+                    "timestamp": pd.Timestamp(row.timestamp).strftime("%Y-%m-%d %H:%M:%S"),
+                }
+            )
+            reviewers.add(row.user_id)
+            rows["review_product"].append({"review_id": review_id, "product_id": row.parent_asin})
+            rows["reviewer_review"].append({"review_id": review_id, "user_id": row.user_id})
+        rows["reviewers"] = [{"user_id": user_id} for user_id in sorted(reviewers)]
+
+    return rows
+
+
+class LoadCheckpoint:
+    """Rows committed per step, saved as JSON after every batch."""
+
+    def __init__(self, path, inputs):
+        self.path = path
+        self.inputs = inputs
+        self.done = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved["inputs"] != inputs:
+                raise SystemExit(f"{path} was written for other input files; remove it or pass --restart")
+            self.done = saved["done"]
+
+    def rows_done(self, step):
+        return self.done.get(step, 0)
+
+    def commit(self, step, rows_done):
+        with self._lock:
+            self.done[step] = rows_done
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"inputs": self.inputs, "done": self.done}, f)
+            os.replace(tmp_path, self.path)
+
+
+def input_fingerprint(paths):
+    # resuming is only safe if the files, and so the row order, have not changed
+    return {
+        name: [path, os.path.getsize(path), int(os.path.getmtime(path))]
+        for name, path in paths.items()
+        if path
+    }
+
+
+def load_step(graphdb, step, statement, rows, checkpoint, batch_size):
+    start_row = checkpoint.rows_done(step)
+    if start_row >= len(rows):
+        print(f"{step}: already loaded ({len(rows)} rows)")
+        return 0, 0.0
+    start = time.perf_counter()
+    for offset in range(start_row, len(rows), batch_size):
+        batch = rows[offset:offset + batch_size]
+        _, success = graphdb.write_query(statement, rows=batch)
+        if not success:
+            raise RuntimeError(f"{step}: batch at row {offset} failed, rerun to resume from here")
+        checkpoint.commit(step, offset + len(batch))
+    loaded = len(rows) - start_row
+    seconds = time.perf_counter() - start
+    print(f"{step}: {loaded} rows in {seconds:.1f}s ({loaded / max(seconds, 1e-9):.0f} rows/s)")
+    return loaded, seconds
+
+
+def load_graph(graphdb, rows, checkpoint, batch_size=1000, workers=4):
+    """MERGE every node type in parallel, then every relationship type in turn."""
+    start = time.perf_counter()
+    loaded = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(load_step, graphdb, step, statement, rows[step], checkpoint, batch_size)
+            for step, statement in NODE_STATEMENTS.items()
+            if rows.get(step)
+        ]
+        loaded += sum(future.result()[0] for future in futures)
+    # relationships lock both end nodes, so they run one type at a time to avoid deadlocks
+    for step, statement in RELATIONSHIP_STATEMENTS.items():
+        if rows.get(step):
+            loaded += load_step(graphdb, step, statement, rows[step], checkpoint, batch_size)[0]
+    seconds = time.perf_counter() - start
+    print(f"Loaded {loaded} rows in {seconds:.1f}s ({loaded / max(seconds, 1e-9):.0f} rows/s)")
+    return loaded
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from Neo4jConnection import Neo4jConnection
+    from schema import apply_schema
+
+    parser = argparse.ArgumentParser(description="Load the product knowledge graph into Neo4j")
+    parser.add_argument("--products", help="products CSV, e.g. ../../data/products_0.001.csv")
+    parser.add_argument("--attributes", help="product_attributes.json, one entry per product row")
+    parser.add_argument("--summaries", help="summaries.json with the product row index")
+    parser.add_argument("--keywords", help="keywords.pkl, one entry per product row")
+    parser.add_argument("--use-cases", help="use_cases.json")
+    parser.add_argument("--reviews", help="reviews JSON, e.g. ../../data/reviews_0.001.json")
+    parser.add_argument(
+        "--similarity-threshold", type=int, default=90, help="merge keywords and use cases this similar (0-100)"
+    )
+    parser.add_argument("--no-reduce", action="store_true", help="load keywords and use cases verbatim")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4, help="node types loaded at once")
+    parser.add_argument("--checkpoint", default="kg_loader.checkpoint.json")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--database", default="neo4j")
+    args = parser.parse_args()
+
+    paths = {
+        "products": args.products,
+        "attributes": args.attributes,
+        "summaries": args.summaries,
+        "keywords": args.keywords,
+        "use_cases": args.use_cases,
+        "reviews": args.reviews,
+    }
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    similarity_threshold = None if args.no_reduce else args.similarity_threshold
+    # the merged keys decide the rows, so a checkpoint only resumes with the same setting
+    checkpoint = LoadCheckpoint(
+        args.checkpoint, {**input_fingerprint(paths), "similarity_threshold": similarity_threshold}
+    )
+
+    graphdb = Neo4jConnection(
+        uri=os.environ["NEO4J_URI"], user="neo4j", password=os.environ["NEO4J_PASSWORD"], db=args.database
+    )
+    if not graphdb.is_alive:
+        raise SystemExit("Neo4j Instance is not running. Please start the Neo4j Instance.")
+    # MERGE needs the uniqueness constraints to look nodes up by index
+    apply_schema(graphdb)
+    start = time.perf_counter()
+    rows = build_rows(**paths, similarity_threshold=similarity_threshold)
+    print(f"Prepared {sum(len(step_rows) for step_rows in rows.values())} rows in {time.perf_counter() - start:.1f}s")
+    load_graph(graphdb, rows, checkpoint, batch_size=args.batch_size, workers=args.workers)
+    graphdb.close()
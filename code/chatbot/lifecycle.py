@@ -0,0 +1,63 @@
+import time
+
+from embedding_registry import (
+    DENSE_MODEL,
+    SPARSE_MODEL,
+    get_dense_model,
+    get_qdrant_client,
+    get_sparse_model,
+    loaded_models,
+)
+from graph import get_react_graph
+from intent import get_fast_intent_classifier, get_intent_classifier
+from utils2 import get_catalog_index, get_graphdb, get_reranker
+
+# Everything the chatbot creates lazily, in dependency order. The asyncio clients are
+# left out: each event loop creates its own on first use.
+WARM_UP_STEPS = [
+    ("neo4j", get_graphdb),
+    ("catalog_index", get_catalog_index),
+    ("qdrant", get_qdrant_client),
+    ("dense_model", get_dense_model),
+    ("sparse_model", get_sparse_model),
+    ("reranker", get_reranker),
+    ("intent_classifier", get_intent_classifier),
+    ("fast_intent_classifier", get_fast_intent_classifier),
+    ("graph", get_react_graph),
+]
+
+
+def warm_up():
+    """Create every lazy resource now instead of on the first request; returns seconds per step."""
+    timings = {}
+    for name, factory in WARM_UP_STEPS:
+        start = time.perf_counter()
+        factory()
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def readiness():
+    """Check that warm-up has run and the databases answer. Never loads anything itself."""
+    models = loaded_models()
+    checks = {
+        "graph": get_react_graph.loaded(),
+        "intent_classifier": get_intent_classifier.loaded() and get_fast_intent_classifier.loaded(),
+        "models": DENSE_MODEL in models["dense"] and SPARSE_MODEL in models["sparse"],
+        "neo4j": get_graphdb.loaded() and get_graphdb().query("RETURN 1")[1],
+    }
+    checks["qdrant"] = False
+    if get_qdrant_client.loaded():
+        try:
+            get_qdrant_client().get_collections()
+            checks["qdrant"] = True
+        except Exception as e:
+            print("Qdrant readiness check failed:", e)
+    return {"ready": all(checks.values()), "checks": checks}
+
+
+if __name__ == "__main__":
+    from pprint import pprint
+
+    pprint(warm_up())
+    pprint(readiness())
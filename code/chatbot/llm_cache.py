@@ -0,0 +1,258 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+from embedding_registry import get_dense_model
+
+
+def normalize_prompt(prompt):
+    return " ".join(prompt.split()).casefold()
+
+
+def prompt_text(prompt):
+    # Chat model prompts arrive as serialized message lists; keep only the message text
+    try:
+        messages = json.loads(prompt)
+        return "\n".join(message["kwargs"]["content"] for message in messages)
+    except (ValueError, TypeError, KeyError):
+        return prompt
+
+
+# Where the user query sits in a rendered prompt, for chains that end with it on its own line
+LAST_LINE_QUERY = r"\n([^\n]+)\n?\Z"
+
+
+def split_query(prompt, query_pattern):
+    """Split a prompt into (user query, everything else) with the pattern's first group.
+
+    Returns None when the chain has no pattern or it does not match, which disables
+    semantic lookups for that prompt.
+    """
+    if query_pattern is None:
+        return None
+    text = prompt_text(prompt)
+    match = re.search(query_pattern, text)
+    if match is None or not match.group(1).strip():
+        return None
+    start, end = match.span(1)
+    return match.group(1), text[:start] + "\x00" + text[end:]
+
+
+class ResponseCacheStore:
+    """SQLite-backed LLM response store with TTL, size-bounded LRU eviction and optional semantic lookup."""
+
+    def __init__(
+        self,
+        path,
+        ttl_seconds=7 * 24 * 3600,
+        max_bytes=256 * 1024 * 1024,
+        semantic_threshold=None,
+        semantic_candidates=256,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # cosine similarity between user queries above which a cached answer for the same
+        # context counts as a hit; None disables it
+        self.semantic_threshold = semantic_threshold
+        # most recently used entries compared per semantic lookup
+        self.semantic_candidates = semantic_candidates
+        self.counts = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                chain TEXT NOT NULL,
+                llm_hash TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                embedding BLOB,
+                context_hash TEXT
+            )
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        if "context_hash" not in columns:
+            # stores created before semantic lookups were keyed on the context
+            self._conn.execute("ALTER TABLE responses ADD COLUMN context_hash TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_chain ON responses(chain, llm_hash)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_context ON responses(chain, llm_hash, context_hash, accessed_at)"
+        )
+
+    @staticmethod
+    def _embed(query):
+        embedding = np.array(next(iter(get_dense_model().embed([normalize_prompt(query)]))), dtype=np.float32)
+        return embedding / np.linalg.norm(embedding)
+
+    @staticmethod
+    def _hash(*parts):
+        return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+    def lookup(self, chain, prompt, llm_string, query_pattern=None):
+        llm_hash = self._hash(llm_string)
+        key = self._hash(chain, llm_hash, normalize_prompt(prompt))
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] <= self.ttl_seconds:
+                self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self.counts[chain]["hits"] += 1
+                return loads(row[0])
+            if row is not None:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+        split = split_query(prompt, query_pattern) if self.semantic_threshold is not None else None
+        if split is not None:
+            value = self._semantic_lookup(chain, llm_hash, *split, now)
+            if value is not None:
+                with self._lock:
+                    self.counts[chain]["semantic_hits"] += 1
+                return value
+
+        with self._lock:
+            self.counts[chain]["misses"] += 1
+        return None
+
+    def _semantic_lookup(self, chain, llm_hash, query, context, now):
+        # only answers given for exactly the same products, reviews and instructions qualify
+        context_hash = self._hash(normalize_prompt(context))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value, embedding FROM responses "
+                "WHERE chain = ? AND llm_hash = ? AND context_hash = ? AND created_at >= ? "
+                "AND embedding IS NOT NULL ORDER BY accessed_at DESC LIMIT ?",
+                (chain, llm_hash, context_hash, now - self.ttl_seconds, self.semantic_candidates),
+            ).fetchall()
+        if not rows:
+            return None
+        query = self._embed(query)
+        embeddings = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+        similarities = embeddings @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.semantic_threshold:
+            return None
+        with self._lock:
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, rows[best][0]))
+        return loads(rows[best][1])
+
+    def update(self, chain, prompt, llm_string, return_val, query_pattern=None):
+        llm_hash = self._hash(llm_string)
+        key = self._hash(chain, llm_hash, normalize_prompt(prompt))
+        value = dumps(return_val)
+        embedding = context_hash = None
+        split = split_query(prompt, query_pattern) if self.semantic_threshold is not None else None
+        if split is not None:
+            query, context = split
+            embedding = self._embed(query).tobytes()
+            context_hash = self._hash(normalize_prompt(context))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, chain, llm_hash, value, len(value), now, now, embedding, context_hash),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # drop least recently used entries until we are back under budget
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+        ).fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self, chain=None):
+        with self._lock:
+            if chain is None:
+                self._conn.execute("DELETE FROM responses")
+            else:
+                self._conn.execute("DELETE FROM responses WHERE chain = ?", (chain,))
+
+    def report(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            counts = {chain: dict(counter) for chain, counter in self.counts.items()}
+        for chain_counts in counts.values():
+            lookups = sum(chain_counts.values())
+            hits = chain_counts.get("hits", 0) + chain_counts.get("semantic_hits", 0)
+            chain_counts["hit_rate"] = hits / lookups if lookups else 0.0
+        return {"entries": entries, "bytes": size, "chains": counts}
+
+
+class ChainResponseCache(BaseCache):
+    """LangChain cache adapter that scopes a shared store to one chain."""
+
+    def __init__(self, store, chain, query_pattern=None):
+        self.store = store
+        self.chain = chain
+        self.query_pattern = query_pattern
+
+    def lookup(self, prompt, llm_string):
+        return self.store.lookup(self.chain, prompt, llm_string, self.query_pattern)
+
+    def update(self, prompt, llm_string, return_val):
+        self.store.update(self.chain, prompt, llm_string, return_val, self.query_pattern)
+
+    def clear(self, **kwargs):
+        self.store.clear(self.chain)
+
+
+# Chains opt in by name through LLM_CACHE_CHAINS, e.g. "product_search,recommendation,intent"
+enabled_chains = {
+    chain.strip() for chain in os.getenv("LLM_CACHE_CHAINS", "").split(",") if chain.strip()
+}
+response_cache_store = None
+
+
+def get_response_cache_store():
+    global response_cache_store
+    if response_cache_store is None:
+        semantic_threshold = os.getenv("LLM_CACHE_SEMANTIC_THRESHOLD")
+        response_cache_store = ResponseCacheStore(
+            os.getenv("LLM_CACHE_PATH", "/project/data/scratch/llm_cache.sqlite"),
+            ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+            max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", 256)) * 1024 * 1024),
+            semantic_threshold=float(semantic_threshold) if semantic_threshold else None,
+            semantic_candidates=int(os.getenv("LLM_CACHE_SEMANTIC_CANDIDATES", 256)),
+        )
+    return response_cache_store
+
+
+def cached(llm, chain, query_pattern=None):
+    """Return `llm` with the response cache attached when `chain` is enabled, else `llm` itself.
+
+    `query_pattern` is a regex whose first group is the user query in the rendered prompt.
+    Without it the chain only gets exact hits.
+    """
+    if chain not in enabled_chains:
+        return llm
+    cache = ChainResponseCache(get_response_cache_store(), chain, query_pattern)
+    return llm.model_copy(update={"cache": cache})
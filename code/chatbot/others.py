@@ -3,7 +3,17 @@ from typing import List
 from langchain_core.prompts import PromptTemplate
 from pydantic import BaseModel, Field, field_validator
 
-from utils2 import llm_precise, graphdb
+from utils2 import llm_precise
+from llm_cache import LAST_LINE_QUERY, cached
+from product_cache import product_cache
+from review_index import retrieve_reviews, aretrieve_reviews
+
+# the product details or reviews before the query must match exactly for a semantic hit
+explanation_llm = cached(llm_precise, "explanation", LAST_LINE_QUERY)
+reviews_llm = cached(llm_precise, "reviews", LAST_LINE_QUERY)
+comparison_llm = cached(llm_precise, "comparison", LAST_LINE_QUERY)
+# the history is the context of the reference chains
+QUERY_TAG = r"(?s).*<query>(.*?)</query>"
 
 prompt_template = PromptTemplate(
     template="""
@@ -41,7 +51,7 @@ class ProductReference(BaseModel):
         return value
 
 
-product_reference_chain = prompt_template | llm_precise.with_structured_output(
+product_reference_chain = prompt_template | cached(llm_precise, "product_reference", QUERY_TAG).with_structured_output(
     ProductReference
 )
 
@@ -75,57 +85,94 @@ Return a list of atleast two or more integers representing the index of the prod
 """.strip(),
     input_variables=["history", "query"],
 )
-product_reference_list_chain = prompt_template | llm_precise.with_structured_output(
+product_reference_list_chain = prompt_template | cached(llm_precise, "product_list_reference", QUERY_TAG).with_structured_output(
     ProductReferenceList
 )
 
 
 
-def get_product_explanation(product_id):
-    product = graphdb.run_query(f"MATCH (p:Product) WHERE p.product_id = '{product_id}' RETURN p")[0]['p']
+def format_product_explanation(product):
     title = product["title"]
     rating_info = f"Rating: {product['average_rating']}/5 from {product['rating_number']} reviews"
     features = product["features"]
     description = product["description"]
-    attribute_nodes = graphdb.run_query(f"MATCH (a:Attribute)<-[:HAS_ATTRIBUTE]-(p:Product) WHERE p.product_id = '{product_id}' RETURN a")
-    attributes = [node["a"] for node in attribute_nodes]
-    attributes = "\n".join([f"{attr['name']}: {attr['value']}" for attr in attributes])
+    attributes = "\n".join([f"{attr['name']}: {attr['value']}" for attr in product["attributes"]])
     total_description = (
         f"{title}\n{rating_info}\n{features}\n{description}\n{attributes}"
     )
     return total_description
 
 
+def format_reviews(product_reviews):
+    formatted_reviews = []
+    for review in product_reviews:
+        formatted_reviews.append(
+            f"{review['title']}\nRating: {review['rating']}\n{review['text']}"
+        )
+    return "\n\n".join(formatted_reviews)
+
+
+def get_product_explanation(product_id):
+    product = product_cache.get_many([product_id])[product_id]
+    return format_product_explanation(product)
+
+
+async def aget_product_explanation(product_id):
+    product = (await product_cache.aget_many([product_id]))[product_id]
+    return format_product_explanation(product)
+
+
 def explain_product(query, product_id):
     total_description = get_product_explanation(product_id)
-    response = llm_precise(
+    response = explanation_llm.invoke(
+        f"Answer the user query based on the product details provided.\n{total_description}\n{query}"
+    )
+    return response
+
+
+async def aexplain_product(query, product_id):
+    total_description = await aget_product_explanation(product_id)
+    response = await explanation_llm.ainvoke(
         f"Answer the user query based on the product details provided.\n{total_description}\n{query}"
     )
     return response
 
 
 def explain_reviews(query, product_id):
-    product_reviews = graphdb.run_query(
-        f"MATCH (p:Product {{product_id: '{product_id}'}})<-[:REVIEWS]-(r:Review) RETURN r.title as title, r.rating as rating, r.text as text"
+    # only the reviews relevant to the question, within a token budget
+    product_reviews = retrieve_reviews(query, product_id)
+    reviews_str = format_reviews(product_reviews)
+    response = reviews_llm.invoke(
+        f"Answer the user query based on the product reviews provided.\n{reviews_str}\n{query}"
     )
-    formatted_reviews = []
-    for review in product_reviews:
-        formatted_reviews.append(
-            f"{review['title']}\nRating: {review['rating']}\n{review['text']}"
-        )
-    reviews_str = "\n\n".join(formatted_reviews)
-    response = llm_precise.invoke(
+    return response
+
+
+async def aexplain_reviews(query, product_id):
+    product_reviews = await aretrieve_reviews(query, product_id)
+    reviews_str = format_reviews(product_reviews)
+    response = await reviews_llm.ainvoke(
         f"Answer the user query based on the product reviews provided.\n{reviews_str}\n{query}"
     )
     return response
 
 
 def compare_products(query, product_ids):
-    product_explanations = [
-        get_product_explanation(product_id) for product_id in product_ids
-    ]
+    # one query for every product not already cached
+    products = product_cache.get_many(product_ids)
+    product_explanations = [format_product_explanation(product) for product in products.values()]
+    product_descriptions = "\n\n".join(product_explanations)
+    response = comparison_llm.invoke(
+        f"Compare the products based on the details provided and answer the user query. Format your answer as a Markdown table.\n{product_descriptions}\n{query}"
+    )
+    return response
+
+
+async def acompare_products(query, product_ids):
+    products = await product_cache.aget_many(product_ids)
+    product_explanations = [format_product_explanation(product) for product in products.values()]
     product_descriptions = "\n\n".join(product_explanations)
-    response = llm_precise.invoke(
+    response = await comparison_llm.ainvoke(
         f"Compare the products based on the details provided and answer the user query. Format your answer as a Markdown table.\n{product_descriptions}\n{query}"
     )
     return response
@@ -1,8 +1,14 @@
+import os
+import time
+
 import streamlit as st
+from prometheus_client import start_http_server
 from streamlit.logger import get_logger
 
-from langchain_core.messages import HumanMessage
-from graph import react_graph
+from graph import get_react_graph
+from instrumentation import start_turn
+from lifecycle import warm_up
+from streaming import stream_turn
 
 # App configuration
 st.set_page_config(page_title="PASA", page_icon="💬")
@@ -10,6 +16,19 @@ st.header('Personalisation-aware eCommerce Shopping Assistant')
 st.write('Enhancing Chatbot Interactions through Context Awareness')
 logger = get_logger('Langchain-Chatbot')
 
+@st.cache_resource(show_spinner="Loading the shopping assistant...")
+def load_graph():
+    # runs once per server process; later reruns and sessions reuse the graph
+    timings = warm_up()
+    logger.info(f"Warm-up finished in {sum(timings.values()):.2f}s: {timings}")
+    metrics_port = os.getenv("PASA_METRICS_PORT")
+    if metrics_port:
+        # Prometheus scrape endpoint for this Streamlit process
+        start_http_server(int(metrics_port))
+    return get_react_graph()
+
+react_graph = load_graph()
+
 def print_qa(cls, question, answer):
     log_str = "\nUsecase: {}\nQuestion: {}\nAnswer: {}\n" + "------"*10
     logger.info(log_str.format(cls, question, answer))
@@ -35,22 +54,43 @@ for message in st.session_state.messages:
         st.write(message["content"])
 
 def clear_chat_history():
+    # the old conversation can no longer be reached, free its checkpoints
+    react_graph.checkpointer.delete_thread(str(st.session_state.thread_id))
     st.session_state.thread_id += 1
     st.session_state.messages = [{"role": "assistant", "content": greeting}]
 
 st.sidebar.button("Clear Chat History", on_click=clear_chat_history)
+show_trace = st.sidebar.toggle("Show turn trace", value=False)
 
 def generate_chatbot_response(prompt_input):
     config = {"configurable": {"thread_id": str(st.session_state.thread_id)}}
-    try:
-        result = react_graph.invoke(
-            {"messages": [HumanMessage(prompt_input)]}, config=config
-        )
-        response = result["messages"][-1].content
-    except Exception as e:
-        response = "I'm sorry, but I encountered an error while processing your request."
-        logger.error(f"Error generating response: {e}")
-
+    status = st.status("Fetching products from catalog...")
+    start = time.perf_counter()
+    timings = {"first_token": None}
+
+    def tokens():
+        try:
+            for kind, text in stream_turn(react_graph, prompt_input, config):
+                if kind == "stage":
+                    status.update(label=text)
+                    status.write(text)
+                    continue
+                if timings["first_token"] is None:
+                    timings["first_token"] = time.perf_counter() - start
+                yield text
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            yield "I'm sorry, but I encountered an error while processing your request."
+
+    with start_turn() as trace:
+        response = st.write_stream(tokens())
+    timings["total"] = time.perf_counter() - start
+    if show_trace:
+        st.sidebar.markdown("### Last turn")
+        st.sidebar.json(trace.summary(), expanded=False)
+    status.update(label="Done", state="complete", expanded=False)
+    logger.info(f"Time to first token: {timings['first_token']}s, total: {timings['total']:.2f}s")
+    logger.info(f"Checkpointer memory: {react_graph.checkpointer.report()}")
     return response
 
 suggestions = [
@@ -70,9 +110,7 @@ def handle_suggestion(suggestion):
     
     # Generate and append assistant response
     with st.chat_message("assistant"):
-        with st.spinner("Fetching products from catalog..."):
-            full_response = generate_chatbot_response(suggestion)
-            st.write(full_response)
+        full_response = generate_chatbot_response(suggestion)
     st.session_state.messages.append({"role": "assistant", "content": full_response})
     
     # Log the question and answer
@@ -97,9 +135,7 @@ if user_input:
     
     # Generate and append assistant response
     with st.chat_message("assistant"):
-        with st.spinner("Fetching products from catalog..."):
-            full_response = generate_chatbot_response(user_input)
-            st.write(full_response)
+        full_response = generate_chatbot_response(user_input)
     st.session_state.messages.append({"role": "assistant", "content": full_response})
     
     # Log the question and answer
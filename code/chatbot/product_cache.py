@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils2 import get_agraphdb, get_graphdb
+
+
+def load_product_documents(product_ids):
+    records = get_graphdb().run_prepared("product_documents", product_ids=list(product_ids)) or []
+    return {record["product_id"]: dict(record) for record in records}
+
+
+async def aload_product_documents(product_ids):
+    records = await get_agraphdb().run_prepared("product_documents", product_ids=list(product_ids)) or []
+    return {record["product_id"]: dict(record) for record in records}
+
+
+class ProductDocumentCache:
+    """TTL + LRU cache of the product fields and attributes used to explain and compare products.
+
+    Misses are fetched for all requested ids together with one UNWIND query.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=600, loader=load_product_documents, aloader=aload_product_documents):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.loader = loader
+        self.aloader = aloader
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # created on first prefetch
+        self._executor = None
+
+    def _lookup(self, product_ids):
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for product_id in dict.fromkeys(product_ids):
+                entry = self._entries.get(product_id)
+                if entry is not None and now - entry[0] < self.ttl_seconds:
+                    self._entries.move_to_end(product_id)
+                    found[product_id] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.append(product_id)
+                    self.misses += 1
+        return found, missing
+
+    def _store(self, documents):
+        now = time.monotonic()
+        with self._lock:
+            for product_id, document in documents.items():
+                self._entries[product_id] = (now, document)
+                self._entries.move_to_end(product_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_many(self, product_ids):
+        """Return {product_id: document} for the ids that exist, in the requested order."""
+        found, missing = self._lookup(product_ids)
+        if missing:
+            loaded = self.loader(missing)
+            self._store(loaded)
+            found.update(loaded)
+        return {product_id: found[product_id] for product_id in dict.fromkeys(product_ids) if product_id in found}
+
+    async def aget_many(self, product_ids):
+        found, missing = self._lookup(product_ids)
+        if missing:
+            loaded = await self.aloader(missing)
+            self._store(loaded)
+            found.update(loaded)
+        return {product_id: found[product_id] for product_id in dict.fromkeys(product_ids) if product_id in found}
+
+    def prefetch(self, product_ids):
+        """Load the products just shown in the background, ready for follow-up questions."""
+        now = time.monotonic()
+        with self._lock:
+            missing = [
+                product_id
+                for product_id in dict.fromkeys(product_ids)
+                if product_id not in self._entries or now - self._entries[product_id][0] >= self.ttl_seconds
+            ]
+            if not missing:
+                return None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="product-prefetch")
+        return self._executor.submit(self._prefetch, missing)
+
+    def _prefetch(self, product_ids):
+        try:
+            self._store(self.loader(product_ids))
+        except Exception as e:
+            print("Product prefetch failed:", e)
+
+    def invalidate(self, product_ids=None):
+        with self._lock:
+            if product_ids is None:
+                self._entries.clear()
+            for product_id in product_ids or []:
+                self._entries.pop(product_id, None)
+
+    def report(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+product_cache = ProductDocumentCache(
+    max_entries=int(os.getenv("PRODUCT_CACHE_MAX_ENTRIES", 1024)),
+    ttl_seconds=float(os.getenv("PRODUCT_CACHE_TTL_SECONDS", 600)),
+)
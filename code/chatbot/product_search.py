@@ -1,3 +1,5 @@
+import asyncio
+
 from langgraph.graph import MessagesState
 from langchain_core.messages import AIMessage
 from langchain_core.prompts import PromptTemplate
@@ -6,12 +8,20 @@ from utils2 import (
     ProductRankingList,
     subcategory_searcher,
     llm_precise,
-    graphdb,
+    get_graphdb,
+    get_agraphdb,
+    get_catalog_index,
     OverallState,
     summary_searcher,
     retrieve_and_rerank,
+    aretrieve_and_rerank,
     format_product_ranking_list,
+    aformat_product_ranking_list,
+    emit_stage,
 )
+from queries import price_filter_suffix
+from llm_cache import cached
+from product_cache import product_cache
 
 template = """
 Below is a list of products, with each product containing formatted details such as attributes and keywords. 
@@ -29,7 +39,7 @@ product_search_ranking_template = PromptTemplate(
     template=template, input_variables=["product_details", "query"]
 )
 
-product_search_llm = llm_precise.with_structured_output(ProductRankingList)
+product_search_llm = cached(llm_precise, "product_search", r"(?s).*<user>(.*?)</user>").with_structured_output(ProductRankingList)
 product_search_chain = product_search_ranking_template | product_search_llm
 
 
@@ -77,42 +87,41 @@ def create_product_details(final_products):
 
 
 def get_products_in_subcategories(included_categories, price_range=None, debug=False):
-    # Convert the list of categories into a comma-separated string for the query
-    categories_str = ", ".join(
-        f"\"{category['document']}\"" for category in included_categories
-    )
+    categories = [category["document"] for category in included_categories]
+    catalog_index = get_catalog_index()
+    if catalog_index is not None and catalog_index.ready():
+        return catalog_index.candidates(categories, price_range)
+    suffix, price = price_filter_suffix(price_range)
+    statement = f"products_in_subcategories{suffix}"
+    if debug:
+        print(statement, categories, price)
+    results = get_graphdb().run_prepared(statement, categories=categories, price=price)
+    return [record["p.product_id"] for record in results]
 
-    # Construct the Cypher query
-    cypher_query = "MATCH (p:Product)-[:BELONGS_TO]->(sc:Subcategory)"
-
-    if price_range:
-        if "lt" in price_range:
-            cypher_query += f"WHERE p.price < {price_range['lt']} "
-        elif "around" in price_range:
-            price = price_range["around"]
-            cypher_query += f""",\n (p)-[:AROUND_PRICE]->(pr:PriceRange)
-    WHERE {price} >= pr.lower_limit AND {price} <= pr.upper_limit """
-        cypher_query += f"AND sc.name IN [{categories_str}] RETURN p.product_id"
-    else:
-        cypher_query += f"WHERE sc.name IN [{categories_str}] RETURN p.product_id"
-    # Run the query and return the results
+
+async def aget_products_in_subcategories(included_categories, price_range=None, debug=False):
+    categories = [category["document"] for category in included_categories]
+    # loading the catalog is blocking; warm_up does it before the server takes requests
+    catalog_index = get_catalog_index() if get_catalog_index.loaded() else await asyncio.to_thread(get_catalog_index)
+    if catalog_index is not None:
+        catalog_index.refresh_in_background()
+        if catalog_index.loaded():
+            return catalog_index.candidates(categories, price_range)
+    suffix, price = price_filter_suffix(price_range)
+    statement = f"products_in_subcategories{suffix}"
     if debug:
-        print(cypher_query)
-    results = graphdb.run_query(cypher_query)
+        print(statement, categories, price)
+    results = await get_agraphdb().run_prepared(statement, categories=categories, price=price)
     return [record["p.product_id"] for record in results]
 
 
 def collect_attributes_and_keywords_for_products(product_ids):
-    cypher_query = f"""
-    MATCH (p:Product)
-    WHERE p.product_id IN {product_ids}
-    OPTIONAL MATCH (p)-[:HAS_ATTRIBUTE]->(a:Attribute)
-    OPTIONAL MATCH (p)-[:HAS_KEYWORD]->(k:Keyword)
-    RETURN p.product_id as product_id,
-           collect(DISTINCT {{attribute_name: a.name, attribute_value: a.value}}) AS attributes, 
-           collect(DISTINCT k.name) AS keywords
-    """.strip()
-    results = graphdb.run_query(cypher_query)
+    results = get_graphdb().run_prepared("attributes_and_keywords", product_ids=product_ids)
+    return results
+
+
+async def acollect_attributes_and_keywords_for_products(product_ids):
+    results = await get_agraphdb().run_prepared("attributes_and_keywords", product_ids=product_ids)
     return results
 
 
@@ -125,6 +134,7 @@ def product_search(state: OverallState) -> MessagesState:
     product_ids = get_products_in_subcategories(
         included_categories, price_range=entities.get("price_range")
     )
+    emit_stage("candidates_retrieved", count=len(product_ids))
     returned_product_ids = retrieve_and_rerank(
         query=query,
         limit_rerank=10,
@@ -132,6 +142,7 @@ def product_search(state: OverallState) -> MessagesState:
         searcher=summary_searcher,
         limit_retrieve=20,
     )
+    emit_stage("reranked", count=len(returned_product_ids))
     pid_attr_keywords = collect_attributes_and_keywords_for_products(
         returned_product_ids
     )
@@ -139,5 +150,40 @@ def product_search(state: OverallState) -> MessagesState:
     response = product_search_chain.invoke(
         {"query": create_user_query(entities), "product_details": product_details}
     )
-    output_message, final_product_ids = format_product_ranking_list(response)
+    titles = {product["product_id"]: product["title"] for product in pid_attr_keywords}
+    output_message, final_product_ids = format_product_ranking_list(response, titles)
+    # follow-up questions usually ask about the products just listed
+    product_cache.prefetch(final_product_ids)
+    return {"product_ids": final_product_ids, "messages": AIMessage(output_message)}
+
+
+async def aproduct_search(state: OverallState) -> MessagesState:
+    query = state["messages"][-1].content
+    entities = state["entities"]
+    included_categories = await subcategory_searcher.asearch(
+        entities["category"], threshold=0.9
+    )
+    product_ids = await aget_products_in_subcategories(
+        included_categories, price_range=entities.get("price_range")
+    )
+    emit_stage("candidates_retrieved", count=len(product_ids))
+    returned_product_ids = await aretrieve_and_rerank(
+        query=query,
+        limit_rerank=10,
+        product_ids=product_ids,
+        searcher=summary_searcher,
+        limit_retrieve=20,
+    )
+    emit_stage("reranked", count=len(returned_product_ids))
+    pid_attr_keywords = await acollect_attributes_and_keywords_for_products(
+        returned_product_ids
+    )
+    product_details = create_product_details(pid_attr_keywords)
+    response = await product_search_chain.ainvoke(
+        {"query": create_user_query(entities), "product_details": product_details}
+    )
+    titles = {product["product_id"]: product["title"] for product in pid_attr_keywords}
+    output_message, final_product_ids = await aformat_product_ranking_list(response, titles)
+    # follow-up questions usually ask about the products just listed
+    product_cache.prefetch(final_product_ids)
     return {"product_ids": final_product_ids, "messages": AIMessage(output_message)}
@@ -0,0 +1,148 @@
+# Named, parameterized Cypher statements used by the chatbot at runtime.
+# The statement text never changes between calls, so Neo4j can reuse the cached
+# query plan; all per-request values are passed as parameters.
+
+PRODUCTS_IN_SUBCATEGORIES = """
+MATCH (p:Product)-[:BELONGS_TO]->(sc:Subcategory)
+WHERE sc.name IN $categories
+RETURN p.product_id
+""".strip()
+
+PRODUCTS_IN_SUBCATEGORIES_BELOW_PRICE = """
+MATCH (p:Product)-[:BELONGS_TO]->(sc:Subcategory)
+WHERE p.price < $price AND sc.name IN $categories
+RETURN p.product_id
+""".strip()
+
+PRODUCTS_IN_SUBCATEGORIES_AROUND_PRICE = """
+MATCH (p:Product)-[:BELONGS_TO]->(sc:Subcategory),
+      (p)-[:AROUND_PRICE]->(pr:PriceRange)
+WHERE $price >= pr.lower_limit AND $price <= pr.upper_limit AND sc.name IN $categories
+RETURN p.product_id
+""".strip()
+
+ATTRIBUTES_AND_KEYWORDS = """
+MATCH (p:Product)
+WHERE p.product_id IN $product_ids
+OPTIONAL MATCH (p)-[:HAS_ATTRIBUTE]->(a:Attribute)
+OPTIONAL MATCH (p)-[:HAS_KEYWORD]->(k:Keyword)
+RETURN p.product_id as product_id,
+       p.title AS title,
+       collect(DISTINCT {attribute_name: a.name, attribute_value: a.value}) AS attributes,
+       collect(DISTINCT k.name) AS keywords
+""".strip()
+
+_MATCHING_PRODUCTS_HEAD = """
+// Step 1: Expand the list of subcategories using the UseCase nodes
+MATCH (u:UseCase)-[:USED_FOR]->(s:Subcategory)
+WHERE u.title IN $usecases
+WITH COLLECT(DISTINCT s.name) + $subcategories AS expanded_subcategories
+// Step 2: Find products using the expanded list of subcategories and the keyword clause
+MATCH (p:Product)-[:BELONGS_TO]->(s:Subcategory)
+WHERE s.name IN expanded_subcategories
+OPTIONAL MATCH (p)-[:HAS_KEYWORD]->(k:Keyword)
+WHERE k.name IN $keywords
+// Aggregation to count matches
+WITH p,
+    COUNT(DISTINCT k) AS keyword_matches,
+    COUNT(DISTINCT s) AS subcategory_matches
+""".strip()
+
+# Ranks on the server and returns a single row: the best products scoring above the
+# minimum, capped at $top_k, and a pool of at most $tied_pool products tied at the
+# minimum for the caller to rerank. Ties are broken by popularity.
+_MATCHING_PRODUCTS_TAIL = """
+WITH p,
+    keyword_matches,
+    subcategory_matches,
+    (keyword_matches * 3 + subcategory_matches * 2) AS score
+ORDER BY score DESC, keyword_matches DESC, subcategory_matches DESC, p.rating_number DESC
+WITH collect({product_id: p.product_id, score: score}) AS ranked, min(score) AS min_score
+RETURN size(ranked) AS total,
+    min_score,
+    [entry IN ranked WHERE entry.score > min_score | entry.product_id][..$top_k] AS top_products,
+    [entry IN ranked WHERE entry.score = min_score | entry.product_id][..$tied_pool] AS tied_products
+""".strip()
+
+MATCHING_PRODUCTS = f"{_MATCHING_PRODUCTS_HEAD}\n{_MATCHING_PRODUCTS_TAIL}"
+
+MATCHING_PRODUCTS_BELOW_PRICE = f"""
+{_MATCHING_PRODUCTS_HEAD}
+WHERE p.price < $price
+{_MATCHING_PRODUCTS_TAIL}
+""".strip()
+
+MATCHING_PRODUCTS_AROUND_PRICE = f"""
+{_MATCHING_PRODUCTS_HEAD}
+MATCH (p)-[:AROUND_PRICE]->(pr:PriceRange)
+WHERE $price >= pr.lower_limit AND $price <= pr.upper_limit
+{_MATCHING_PRODUCTS_TAIL}
+""".strip()
+
+PRODUCT_SUMMARIES = """
+MATCH (p:Product)
+WHERE p.product_id IN $product_ids
+RETURN p.product_id AS product_id, p.title AS title, p.summary AS summary
+""".strip()
+
+PRODUCT_DOCUMENTS = """
+UNWIND $product_ids AS product_id
+MATCH (p:Product {product_id: product_id})
+OPTIONAL MATCH (p)-[:HAS_ATTRIBUTE]->(a:Attribute)
+RETURN p.product_id AS product_id,
+       p.title AS title,
+       p.average_rating AS average_rating,
+       p.rating_number AS rating_number,
+       p.features AS features,
+       p.description AS description,
+       collect(a {.name, .value}) AS attributes
+""".strip()
+
+PRODUCT_REVIEWS = """
+MATCH (p:Product {product_id: $product_id})<-[:REVIEWS]-(r:Review)
+RETURN r.title as title, r.rating as rating, r.text as text, r.helpful_vote as helpful_vote
+ORDER BY r.helpful_vote DESC
+LIMIT $limit
+""".strip()
+
+PRODUCT_TITLES = """
+UNWIND $product_ids AS product_id
+MATCH (p:Product {product_id: product_id})
+RETURN p.product_id AS product_id, p.title AS title
+""".strip()
+
+CATALOG_PRODUCTS = """
+MATCH (p:Product)
+OPTIONAL MATCH (p)-[:BELONGS_TO]->(sc:Subcategory)
+OPTIONAL MATCH (p)-[:AROUND_PRICE]->(pr:PriceRange)
+RETURN p.product_id AS product_id,
+       p.price AS price,
+       collect(DISTINCT sc.name) AS subcategories,
+       min(pr.lower_limit) AS lower_limit,
+       max(pr.upper_limit) AS upper_limit
+""".strip()
+
+STATEMENTS = {
+    "products_in_subcategories": PRODUCTS_IN_SUBCATEGORIES,
+    "products_in_subcategories_below_price": PRODUCTS_IN_SUBCATEGORIES_BELOW_PRICE,
+    "products_in_subcategories_around_price": PRODUCTS_IN_SUBCATEGORIES_AROUND_PRICE,
+    "attributes_and_keywords": ATTRIBUTES_AND_KEYWORDS,
+    "matching_products": MATCHING_PRODUCTS,
+    "matching_products_below_price": MATCHING_PRODUCTS_BELOW_PRICE,
+    "matching_products_around_price": MATCHING_PRODUCTS_AROUND_PRICE,
+    "product_summaries": PRODUCT_SUMMARIES,
+    "product_documents": PRODUCT_DOCUMENTS,
+    "product_reviews": PRODUCT_REVIEWS,
+    "product_titles": PRODUCT_TITLES,
+    "catalog_products": CATALOG_PRODUCTS,
+}
+
+
+def price_filter_suffix(price_range):
+    """Return the statement-name suffix and the $price parameter for a price range entity."""
+    if price_range:
+        if "lt" in price_range:
+            return "_below_price", price_range["lt"]
+        if "around" in price_range:
+            return "_around_price", price_range["around"]
+    return "", None
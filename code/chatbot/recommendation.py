@@ -1,3 +1,6 @@
+import asyncio
+import os
+
 from langgraph.graph import MessagesState
 from langchain_core.prompts import PromptTemplate
 from langchain_core.messages import AIMessage
@@ -7,14 +10,22 @@ from utils2 import (
     subcategory_searcher,
     usecase_searcher,
     rerank,
+    arerank,
     keyword_searcher,
     retrieve_and_rerank,
+    aretrieve_and_rerank,
     summary_searcher,
     format_product_ranking_list,
-    graphdb,
+    aformat_product_ranking_list,
+    emit_stage,
+    get_graphdb,
+    get_agraphdb,
     ProductRankingList,
     llm_precise,
 )
+from queries import price_filter_suffix
+from llm_cache import cached
+from product_cache import product_cache
 
 recommendation_template = PromptTemplate(
     template="""
@@ -29,60 +40,79 @@ Bad Explanation: This product is a facial serum that is under $50, making it a g
 """.strip(),
     input_variables=["query", "products"],
 )
-recommender_llm = llm_precise.with_structured_output(ProductRankingList)
+# products scoring above the minimum that are kept, and how many products tied at the
+# minimum score the database hands back for reranking
+MATCHING_TOP_K = int(os.getenv("MATCHING_TOP_K", 10))
+MATCHING_TIED_POOL = int(os.getenv("MATCHING_TIED_POOL", 200))
+NO_MATCHES = {"total": 0, "min_score": None, "top_products": [], "tied_products": []}
+
+recommender_llm = cached(llm_precise, "recommendation", r'my query: "([^\n]*)"\.\n').with_structured_output(ProductRankingList)
 recommendation_chain = recommendation_template | recommender_llm
 
 
 def find_matching_products(
-    subcategories, usecases, keywords, price_range=None, debug=False
+    subcategories,
+    usecases,
+    keywords,
+    price_range=None,
+    top_k=MATCHING_TOP_K,
+    tied_pool=MATCHING_TIED_POOL,
+    debug=False,
 ):
-    # Build the initial Cypher query to expand subcategories based on use cases
-    cypher_query = f"""// Step 1: Expand the list of subcategories using the UseCase nodes
-MATCH (u:UseCase)-[:USED_FOR]->(s:Subcategory)
-WHERE u.title IN {usecases}
-WITH COLLECT(DISTINCT s.name) + {subcategories} AS expanded_subcategories
-// Step 2: Find products using the expanded list of subcategories and the keyword clause
-MATCH (p:Product)-[:BELONGS_TO]->(s:Subcategory)
-WHERE s.name IN expanded_subcategories
-OPTIONAL MATCH (p)-[:HAS_KEYWORD]->(k:Keyword)
-WHERE k.name IN {keywords}
-// Aggregation to count matches
-WITH p, 
-    COUNT(DISTINCT k) AS keyword_matches, 
-    COUNT(DISTINCT s) AS subcategory_matches
-    """
-
-    # Add price range filter if provided
-    if price_range:
-        if "lt" in price_range:
-            cypher_query += f" WHERE p.price < {price_range['lt']} "
-        elif "around" in price_range:
-            price = price_range["around"]
-            cypher_query += f"""
-            MATCH (p)-[:AROUND_PRICE]->(pr:PriceRange)
-            WHERE {price} >= pr.lower_limit AND {price} <= pr.upper_limit
-            """
-
-    # Continue with the RETURN and ORDER BY clauses for ranking products
-    cypher_query += f"""
-RETURN p.product_id AS product_id, 
-    keyword_matches, 
-    subcategory_matches,
-    (keyword_matches * 3 + subcategory_matches * 2) AS score
-ORDER BY score DESC, keyword_matches DESC, subcategory_matches DESC
-    """.strip()
-
+    suffix, price = price_filter_suffix(price_range)
+    statement = f"matching_products{suffix}"
     if debug:
-        print(cypher_query)
+        print(statement, subcategories, usecases, keywords, price)
+
+    matches = get_graphdb().run_prepared(
+        statement,
+        subcategories=subcategories,
+        usecases=usecases,
+        keywords=keywords,
+        price=price,
+        top_k=top_k,
+        tied_pool=tied_pool,
+    )
+    # the statement aggregates into a single row
+    return matches[0] if matches else NO_MATCHES
 
-    products = graphdb.run_query(cypher_query)
-    return products
 
+async def afind_matching_products(
+    subcategories,
+    usecases,
+    keywords,
+    price_range=None,
+    top_k=MATCHING_TOP_K,
+    tied_pool=MATCHING_TIED_POOL,
+    debug=False,
+):
+    suffix, price = price_filter_suffix(price_range)
+    statement = f"matching_products{suffix}"
+    if debug:
+        print(statement, subcategories, usecases, keywords, price)
 
-def format_product_details(product_ids):
-    required_products = graphdb.run_query(
-        f"MATCH (p:Product) WHERE p.product_id IN {product_ids} RETURN p.product_id AS product_id, p.summary AS summary"
+    matches = await get_agraphdb().run_prepared(
+        statement,
+        subcategories=subcategories,
+        usecases=usecases,
+        keywords=keywords,
+        price=price,
+        top_k=top_k,
+        tied_pool=tied_pool,
     )
+    # the statement aggregates into a single row
+    return matches[0] if matches else NO_MATCHES
+
+
+def get_product_summaries(product_ids):
+    return get_graphdb().run_prepared("product_summaries", product_ids=product_ids)
+
+
+async def aget_product_summaries(product_ids):
+    return await get_agraphdb().run_prepared("product_summaries", product_ids=product_ids)
+
+
+def format_product_details(required_products):
     formatted_products = [
         f"{product['product_id']}\n{product['summary']}"
         for product in required_products
@@ -90,15 +120,33 @@ def format_product_details(product_ids):
     return "\n\n".join(formatted_products)
 
 
-def recommendation(state: OverallState) -> MessagesState:
-    query = state["messages"][-1].content
-    entities = state["entities"]
+def add_attributes_to_keywords(entities):
     if "attributes" in entities and entities["attributes"]:
         for attribute in entities["attributes"]:
             entities["keywords"].append(
                 f"{attribute}:{entities['attributes'][attribute]}"
             )
 
+
+def select_candidates(matches, num_products_to_consider=MATCHING_TOP_K):
+    # products scoring above the minimum are kept in order; the rest of the slots
+    # are filled by reranking the products tied at the minimum score
+    relevant_products = matches["top_products"][:num_products_to_consider]
+
+    other_products = []
+    num_additional_products_required = max(
+        num_products_to_consider - len(relevant_products), 0
+    )
+    if num_additional_products_required != 0:
+        other_products = matches["tied_products"]
+    return relevant_products, other_products, num_additional_products_required
+
+
+def recommendation(state: OverallState) -> MessagesState:
+    query = state["messages"][-1].content
+    entities = state["entities"]
+    add_attributes_to_keywords(entities)
+
     price_range = None
     if "price_range" in entities and entities["price_range"]:
         price_range = entities["price_range"]
@@ -110,9 +158,7 @@ def recommendation(state: OverallState) -> MessagesState:
 
     included_usecases = usecase_searcher.search(query, threshold=0.9, limit=20)
     included_usecases = [document["document"] for document in included_usecases]
-    included_usecases_reranked = rerank(
-        query, included_usecases, limit=5, model="jina-reranker-v2-base-multilingual"
-    )
+    included_usecases_reranked = rerank(query, included_usecases, limit=5)
     included_usecases_reranked = [
         document["document"]["text"] for document in included_usecases_reranked
     ]
@@ -124,32 +170,20 @@ def recommendation(state: OverallState) -> MessagesState:
         expanded_keywords.update(new_keywords)
     expanded_keywords = list(expanded_keywords)
 
-    matching_products = find_matching_products(
+    matches = find_matching_products(
         included_categories,
         included_usecases_reranked,
         expanded_keywords,
         price_range=price_range,
         debug=False,
     )
-    min_score = min({entry["score"] for entry in matching_products})
-    relevant_products = [
-        entry["product_id"] for entry in matching_products if entry["score"] > min_score
-    ]
-    num_products_to_consider = 10
-    relevant_products = relevant_products[:num_products_to_consider]
-
-    other_products = []
-    num_additional_products_required = max(
-        num_products_to_consider - len(relevant_products), 0
+    emit_stage("candidates_retrieved", count=matches["total"])
+    relevant_products, other_products, num_additional_products_required = (
+        select_candidates(matches)
     )
 
     additional_product_ids = []
-    if num_additional_products_required != 0:
-        other_products = [
-            entry["product_id"]
-            for entry in matching_products
-            if entry["score"] == min_score
-        ]
+    if num_additional_products_required != 0 and other_products:
         additional_product_ids = retrieve_and_rerank(
             query,
             limit_rerank=num_additional_products_required,
@@ -158,10 +192,89 @@ def recommendation(state: OverallState) -> MessagesState:
         )
 
     final_product_ids = relevant_products + additional_product_ids
-    product_details = format_product_details(final_product_ids)
+    emit_stage("reranked", count=len(final_product_ids))
+    final_products = get_product_summaries(final_product_ids)
+    product_details = format_product_details(final_products)
     product_ranking = recommendation_chain.invoke(
         {"query": query, "products": product_details}
     )
-    output_message, final_product_ids = format_product_ranking_list(product_ranking)
+    titles = {product["product_id"]: product["title"] for product in final_products}
+    output_message, final_product_ids = format_product_ranking_list(
+        product_ranking, titles
+    )
+
+    # follow-up questions usually ask about the products just listed
+    product_cache.prefetch(final_product_ids)
+    return {"product_ids": final_product_ids, "messages": AIMessage(output_message)}
+
+
+async def arerank_usecases(query):
+    included_usecases = await usecase_searcher.asearch(query, threshold=0.9, limit=20)
+    included_usecases = [document["document"] for document in included_usecases]
+    included_usecases_reranked = await arerank(query, included_usecases, limit=5)
+    return [document["document"]["text"] for document in included_usecases_reranked]
+
+
+async def arecommendation(state: OverallState) -> MessagesState:
+    query = state["messages"][-1].content
+    entities = state["entities"]
+    add_attributes_to_keywords(entities)
+
+    price_range = None
+    if "price_range" in entities and entities["price_range"]:
+        price_range = entities["price_range"]
+
+    # the subcategory, use case and keyword lookups are independent, so run them together
+    included_categories, included_usecases_reranked, *keyword_documents = (
+        await asyncio.gather(
+            subcategory_searcher.asearch(entities["category"], limit=2, threshold=0.9),
+            arerank_usecases(query),
+            *[
+                keyword_searcher.asearch(keyword, threshold=0.9, limit=5)
+                for keyword in entities["keywords"]
+            ],
+        )
+    )
+    included_categories = [document["document"] for document in included_categories]
+
+    expanded_keywords = set()
+    for documents in keyword_documents:
+        expanded_keywords.update(document["document"] for document in documents)
+    expanded_keywords = list(expanded_keywords)
+
+    matches = await afind_matching_products(
+        included_categories,
+        included_usecases_reranked,
+        expanded_keywords,
+        price_range=price_range,
+        debug=False,
+    )
+    emit_stage("candidates_retrieved", count=matches["total"])
+    relevant_products, other_products, num_additional_products_required = (
+        select_candidates(matches)
+    )
+
+    additional_product_ids = []
+    if num_additional_products_required != 0 and other_products:
+        additional_product_ids = await aretrieve_and_rerank(
+            query,
+            limit_rerank=num_additional_products_required,
+            product_ids=other_products,
+            searcher=summary_searcher,
+        )
+
+    final_product_ids = relevant_products + additional_product_ids
+    emit_stage("reranked", count=len(final_product_ids))
+    final_products = await aget_product_summaries(final_product_ids)
+    product_details = format_product_details(final_products)
+    product_ranking = await recommendation_chain.ainvoke(
+        {"query": query, "products": product_details}
+    )
+    titles = {product["product_id"]: product["title"] for product in final_products}
+    output_message, final_product_ids = await aformat_product_ranking_list(
+        product_ranking, titles
+    )
 
+    # follow-up questions usually ask about the products just listed
+    product_cache.prefetch(final_product_ids)
     return {"product_ids": final_product_ids, "messages": AIMessage(output_message)}
@@ -0,0 +1,191 @@
+"""Merge near-duplicate keys (keywords, use-case titles) before they become graph nodes.
+
+`reduce_keys` compares every key with every key kept so far. `reduce_keys_blocked` gives the
+same result but only scores pairs that share a MinHash LSH bucket of character 3-grams, and
+scores them on all cores, so it stays fast on the full catalog's vocabulary.
+"""
+import os
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+
+# 2^31 - 1: with 32-bit shingle hashes every (a * h + b) stays within uint64
+MERSENNE_PRIME = (1 << 31) - 1
+# buckets above this size are split by further bands, so no bucket costs more than
+# MAX_BUCKET^2 / 2 pairs of memory
+MAX_BUCKET = 1000
+# below this many distinct keys the pairwise pass is faster than building the LSH index
+# and the worker pool (bench_reduce_keys.py: about 0.9x at 3.5k keys, 1.3x at 6.2k, 1.5x at 11.7k)
+PAIRWISE_BELOW = int(os.getenv("REDUCE_KEYS_PAIRWISE_BELOW", 5000))
+
+
+def unique_keys_in_order(entries, key_field):
+    return list(dict.fromkeys(entry[key_field] for entry in entries))
+
+
+def apply_mapping(entries, key_field, mapping):
+    return [{**entry, key_field: mapping[entry[key_field]]} for entry in entries]
+
+
+def reduce_keys(entries, key_field, similarity_threshold=90):
+    """Map each key to the most similar earlier kept key scoring at least `similarity_threshold`.
+
+    Returns (entries with their key replaced, set of kept keys). Cost grows with
+    keys x kept keys.
+    """
+    kept, mapping = [], {}
+    for key in unique_keys_in_order(entries, key_field):
+        match = process.extractOne(
+            key, kept, scorer=fuzz.ratio, processor=default_process, score_cutoff=similarity_threshold
+        )
+        if match is None:
+            kept.append(key)
+            mapping[key] = key
+        else:
+            mapping[key] = match[0]
+    return apply_mapping(entries, key_field, mapping), set(kept)
+
+
+def shingles(text, n=3):
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+
+def minhash_signatures(texts, num_perm=128, seed=0):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+    b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for row, text in enumerate(texts):
+        hashes = np.array([zlib.crc32(shingle.encode()) for shingle in shingles(text)], dtype=np.uint64)
+        signatures[row] = ((np.outer(hashes % MERSENNE_PRIME, a) + b) % MERSENNE_PRIME).min(axis=0)
+    return signatures
+
+
+def group(bucket_ids, members):
+    """Split `members` by bucket id, keeping only groups of two or more."""
+    order = np.argsort(bucket_ids, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(bucket_ids[order]) != 0])
+    ends = np.r_[starts[1:], len(order)]
+    return [members[order[start:end]] for start, end in zip(starts, ends) if end - start > 1]
+
+
+def bucket_pairs(signatures, members, band, bands, rows, multipliers, max_bucket, depth=0):
+    """Pairs within one bucket; an oversized bucket is re-banded on the following bands."""
+    if len(members) > max_bucket and depth < bands - 1:
+        next_band = (band + depth + 1) % bands
+        bucket_ids = signatures[members, next_band * rows:(next_band + 1) * rows] @ multipliers
+        for sub_members in group(bucket_ids, members):
+            yield from bucket_pairs(signatures, sub_members, band, bands, rows, multipliers, max_bucket, depth + 1)
+        return
+    if len(members) > max_bucket:
+        # identical on every band: pair each member with the next max_bucket ones only
+        for offset in range(1, max_bucket):
+            yield members[:-offset], members[offset:]
+        return
+    first, second = np.triu_indices(len(members), k=1)
+    yield members[first], members[second]
+
+
+def candidate_pairs(texts, similarity_threshold, num_perm=128, bands=32, max_bucket=MAX_BUCKET):
+    """Index pairs (i < j) sharing at least one LSH band that could reach the threshold."""
+    rows = num_perm // bands
+    signatures = minhash_signatures(texts, bands * rows)
+    # one 64-bit bucket id per band; uint64 arithmetic wraps, which is fine for hashing
+    multipliers = np.random.default_rng(1).integers(1, 2**63, rows, dtype=np.uint64) | np.uint64(1)
+    everyone = np.arange(len(texts))
+    codes = []
+    for band in range(bands):
+        bucket_ids = signatures[:, band * rows:(band + 1) * rows] @ multipliers
+        for members in group(bucket_ids, everyone):
+            for first, second in bucket_pairs(signatures, members, band, bands, rows, multipliers, max_bucket):
+                # one int64 per pair so duplicates across bands are dropped by np.unique
+                low, high = np.minimum(first, second), np.maximum(first, second)
+                codes.append(low * len(texts) + high)
+    if not codes:
+        return np.empty((0, 2), dtype=np.int64)
+    codes = np.unique(np.concatenate(codes))
+    pairs = np.stack([codes // len(texts), codes % len(texts)], axis=1)
+    # fuzz.ratio can only reach the threshold if the lengths are close enough
+    lengths = np.array([len(text) for text in texts])
+    short = np.minimum(lengths[pairs[:, 0]], lengths[pairs[:, 1]])
+    total = lengths[pairs[:, 0]] + lengths[pairs[:, 1]]
+    return pairs[200 * short >= similarity_threshold * total]
+
+
+_texts = None
+
+
+def _init_worker(texts):
+    global _texts
+    _texts = texts
+
+
+def _score_chunk(pairs, similarity_threshold):
+    scored = []
+    for i, j in pairs.tolist():
+        score = fuzz.ratio(_texts[i], _texts[j], score_cutoff=similarity_threshold)
+        if score:
+            scored.append((i, j, score))
+    return scored
+
+
+def score_pairs(texts, pairs, similarity_threshold, workers=None, chunk_size=20000):
+    workers = workers or os.cpu_count()
+    chunks = [pairs[start:start + chunk_size] for start in range(0, len(pairs), chunk_size)]
+    if workers == 1 or len(chunks) <= 1:
+        _init_worker(texts)
+        return [score for chunk in chunks for score in _score_chunk(chunk, similarity_threshold)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(texts,)) as executor:
+        results = executor.map(_score_chunk, chunks, [similarity_threshold] * len(chunks))
+        return [score for chunk in results for score in chunk]
+
+
+def reduce_keys_blocked(
+    entries, key_field, similarity_threshold=90, num_perm=128, bands=32, workers=None, pairwise_below=PAIRWISE_BELOW
+):
+    """Same contract as reduce_keys, comparing only LSH candidate pairs.
+
+    The greedy pass is the same as reduce_keys, so the outputs differ only where a
+    similar pair never shares a bucket; more bands raise recall and cost. Inputs with
+    fewer than `pairwise_below` distinct keys go through reduce_keys itself.
+    """
+    keys = unique_keys_in_order(entries, key_field)
+    if len(keys) < pairwise_below:
+        return reduce_keys(entries, key_field, similarity_threshold)
+    processed = [default_process(key) for key in keys]
+
+    # identical after processing: score 100, so they always follow the first of them
+    first_index = {}
+    leaders = []
+    for index, text in enumerate(processed):
+        if text not in first_index:
+            first_index[text] = index
+            leaders.append(index)
+    leader_texts = [processed[index] for index in leaders]
+
+    pairs = candidate_pairs(leader_texts, similarity_threshold, num_perm, bands)
+    earlier_matches = defaultdict(list)
+    for i, j, score in score_pairs(leader_texts, pairs, similarity_threshold, workers):
+        earlier_matches[max(i, j)].append((score, min(i, j)))
+
+    kept = set()
+    canonical = {}
+    for position, index in enumerate(leaders):
+        # best scoring kept key, the earliest one on ties, as extractOne picks it
+        matches = [(score, -earlier) for score, earlier in earlier_matches[position] if earlier in kept]
+        if matches:
+            canonical[position] = canonical[-max(matches)[1]]
+        else:
+            kept.add(position)
+            canonical[position] = keys[index]
+
+    leader_position = {index: position for position, index in enumerate(leaders)}
+    mapping = {
+        key: canonical[leader_position[first_index[text]]] for key, text in zip(keys, processed)
+    }
+    return apply_mapping(entries, key_field, mapping), {keys[leaders[position]] for position in kept}
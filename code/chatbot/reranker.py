@@ -0,0 +1,104 @@
+import asyncio
+import os
+
+import httpx
+import requests
+
+from event_loops import per_event_loop
+
+JINA_RERANK_URL = "https://api.jina.ai/v1/rerank"
+JINA_RERANK_MODEL = "jina-reranker-v2-base-multilingual"
+CROSS_ENCODER_MODEL = "Xenova/ms-marco-MiniLM-L-6-v2"
+
+
+@per_event_loop(close=lambda client: client.aclose())
+def get_async_http_client():
+    return httpx.AsyncClient()
+
+
+def jina_headers():
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f'Bearer {os.getenv("JINA_API_KEY")}',
+    }
+
+
+class JinaReranker:
+    """Reranks through the Jina API over one pooled HTTP connection per client."""
+
+    name = "jina"
+
+    def __init__(self, model=JINA_RERANK_MODEL, timeout=30.0):
+        self.model = model
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _payload(self, query, documents, limit):
+        return {"model": self.model, "query": query, "top_n": limit, "documents": documents}
+
+    def rerank(self, query, documents, limit=5):
+        if not documents:
+            return []
+        response = self.session.post(
+            JINA_RERANK_URL,
+            headers=jina_headers(),
+            json=self._payload(query, documents, limit),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()["results"]
+
+    async def arerank(self, query, documents, limit=5):
+        if not documents:
+            return []
+        response = await get_async_http_client().post(
+            JINA_RERANK_URL,
+            headers=jina_headers(),
+            json=self._payload(query, documents, limit),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()["results"]
+
+
+class CrossEncoderReranker:
+    """Scores query/document pairs in-process with a small ONNX cross-encoder on CPU."""
+
+    name = "local"
+
+    def __init__(self, model=CROSS_ENCODER_MODEL, batch_size=32):
+        from fastembed.rerank.cross_encoder import TextCrossEncoder
+
+        self.model = model
+        self.batch_size = batch_size
+        self.encoder = TextCrossEncoder(model_name=model)
+
+    def rerank(self, query, documents, limit=5):
+        if not documents:
+            return []
+        scores = list(self.encoder.rerank(query, documents, batch_size=self.batch_size))
+        ranked = sorted(range(len(documents)), key=lambda index: scores[index], reverse=True)
+        # same shape as the Jina API results
+        return [
+            {
+                "index": index,
+                "relevance_score": float(scores[index]),
+                "document": {"text": documents[index]},
+            }
+            for index in ranked[:limit]
+        ]
+
+    async def arerank(self, query, documents, limit=5):
+        # scoring is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(self.rerank, query, documents, limit)
+
+
+def create_reranker(backend):
+    if backend == "jina":
+        return JinaReranker(timeout=float(os.getenv("JINA_RERANK_TIMEOUT", 30.0)))
+    if backend == "local":
+        return CrossEncoderReranker(
+            model=os.getenv("RERANK_MODEL", CROSS_ENCODER_MODEL),
+            batch_size=int(os.getenv("RERANK_BATCH_SIZE", 32)),
+        )
+    raise ValueError(f"Unknown rerank backend: {backend}")
@@ -0,0 +1,146 @@
+import math
+import os
+
+from collection_builder import BATCH_SIZE, EMBED_PARALLEL, UPLOAD_PARALLEL, build_collection, print_report
+from embedding_registry import get_qdrant_client
+from utils2 import HybridSearcher, get_agraphdb, get_graphdb, product_id_filter
+
+REVIEWS_COLLECTION = "reviews"
+
+# How many reviews reach the prompt and how much text they may take
+REVIEWS_TOP_K = int(os.getenv("REVIEWS_TOP_K", "8"))
+REVIEWS_TOKEN_BUDGET = int(os.getenv("REVIEWS_TOKEN_BUDGET", "1500"))
+# Relevance is boosted by (1 + weight * log1p(helpful_vote))
+REVIEWS_HELPFUL_WEIGHT = float(os.getenv("REVIEWS_HELPFUL_WEIGHT", "0.3"))
+# Candidates fetched from Qdrant per review that ends up in the prompt
+CANDIDATE_FACTOR = 4
+
+reviews_searcher = HybridSearcher(collection_name=REVIEWS_COLLECTION)
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text, close enough for budgeting
+    return len(text) // 4 + 1
+
+
+def review_document(review):
+    return f"{review['title']}\n{review['text']}"
+
+
+def select_reviews(reviews, top_k=REVIEWS_TOP_K, token_budget=REVIEWS_TOKEN_BUDGET):
+    """Order reviews by retrieval rank boosted by helpful votes and keep what fits the budget.
+
+    `reviews` must be in relevance order, best first.
+    """
+    scored = []
+    for rank, review in enumerate(reviews):
+        # reciprocal rank: a well-voted review can overtake a slightly more relevant one
+        relevance = 1 / (1 + rank)
+        helpful = 1 + REVIEWS_HELPFUL_WEIGHT * math.log1p(review.get("helpful_vote") or 0)
+        scored.append((relevance * helpful, rank, review))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+
+    selected, used = [], 0
+    for _, _, review in scored:
+        cost = estimate_tokens(review_document(review))
+        if used + cost > token_budget:
+            continue
+        selected.append(review)
+        used += cost
+        if len(selected) == top_k:
+            break
+    return selected
+
+
+def retrieve_reviews(query, product_id, top_k=REVIEWS_TOP_K, token_budget=REVIEWS_TOKEN_BUDGET):
+    try:
+        reviews = reviews_searcher.search(
+            query, query_filter=product_id_filter([product_id]), limit=top_k * CANDIDATE_FACTOR, threshold=0.0
+        )
+    except Exception as e:
+        print("Review search failed, falling back to Neo4j:", e)
+        reviews = []
+    if not reviews:
+        # most helpful reviews first, capped so the prompt stays bounded
+        reviews = get_graphdb().run_prepared(
+            "product_reviews", product_id=product_id, limit=top_k * CANDIDATE_FACTOR
+        ) or []
+    return select_reviews(reviews, top_k, token_budget)
+
+
+async def aretrieve_reviews(query, product_id, top_k=REVIEWS_TOP_K, token_budget=REVIEWS_TOKEN_BUDGET):
+    try:
+        reviews = await reviews_searcher.asearch(
+            query, query_filter=product_id_filter([product_id]), limit=top_k * CANDIDATE_FACTOR, threshold=0.0
+        )
+    except Exception as e:
+        print("Review search failed, falling back to Neo4j:", e)
+        reviews = []
+    if not reviews:
+        reviews = await get_agraphdb().run_prepared(
+            "product_reviews", product_id=product_id, limit=top_k * CANDIDATE_FACTOR
+        ) or []
+    return select_reviews(reviews, top_k, token_budget)
+
+
+def load_reviews(path):
+    import pandas as pd
+
+    # review ids follow the row order, as for the Review nodes in the knowledge graph
+    reviews_df = pd.read_json(path)
+    reviews_df.reset_index(inplace=True)
+    reviews = []
+    for row in reviews_df.itertuples():
+        if not isinstance(row.title, str) or not isinstance(row.text, str):
+            continue
+        reviews.append(
+            {
+                "review_id": int(row.index),
+                "product_id": row.parent_asin,
+                "title": row.title,
+                "text": row.text,
+                "rating": float(row.rating),
+                "helpful_vote": int(row.helpful_vote),
+            }
+        )
+    return reviews
+
+
+def build_reviews_collection(path, client=None, recreate=False, **options):
+    """Embed every review in `path` and upload it into the reviews collection.
+
+    Goes through collection_builder, so the reviews get the same on-disk storage,
+    quantization, parallel embedding and upload, and product_id payload index as the
+    other collections. Point ids are derived from the review id.
+    """
+    reviews = load_reviews(path)
+    payloads = [{"document": review_document(review), **review} for review in reviews]
+    report = build_collection(
+        client or get_qdrant_client(), REVIEWS_COLLECTION, payloads, recreate=recreate, key_field="review_id", **options
+    )
+    print_report(report)
+    return report["documents"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the Qdrant reviews collection")
+    parser.add_argument("path", help="e.g. ../../data/reviews_0.001.json")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--parallel", type=int, default=EMBED_PARALLEL, help="embedding processes, 0 for all cores")
+    parser.add_argument("--upload-parallel", type=int, default=UPLOAD_PARALLEL)
+    parser.add_argument("--in-memory", action="store_true", help="keep vectors and indexes in RAM")
+    parser.add_argument("--no-quantization", action="store_true")
+    parser.add_argument("--recreate", action="store_true", help="drop the existing collection first")
+    args = parser.parse_args()
+
+    build_reviews_collection(
+        args.path,
+        recreate=args.recreate,
+        batch_size=args.batch_size,
+        parallel=args.parallel,
+        upload_parallel=args.upload_parallel,
+        on_disk=not args.in_memory,
+        quantization=not args.no_quantization,
+    )
@@ -0,0 +1,163 @@
+"""Create the constraints and indexes the runtime statements rely on, and check their plans.
+
+    python schema.py              # apply the schema, then verify
+    python schema.py --verify     # only verify
+    python schema.py --apply      # only apply
+
+Verification runs every statement in queries.STATEMENTS under PROFILE with parameters
+sampled from the graph and fails if a plan still scans a whole label or goes over the
+db-hits budget. To try it locally against a throwaway database:
+
+    docker run --rm -p 7687:7687 -e NEO4J_AUTH=neo4j/password neo4j:5
+    NEO4J_URI=bolt://localhost:7687 NEO4J_PASSWORD=password python schema.py
+"""
+import os
+import sys
+
+from queries import STATEMENTS
+
+# Uniqueness constraints also give a range index on the property
+CONSTRAINTS = {
+    "product_id_unique": "FOR (p:Product) REQUIRE p.product_id IS UNIQUE",
+    "category_name_unique": "FOR (c:Category) REQUIRE c.name IS UNIQUE",
+    "subcategory_name_unique": "FOR (s:Subcategory) REQUIRE s.name IS UNIQUE",
+    "keyword_name_unique": "FOR (k:Keyword) REQUIRE k.name IS UNIQUE",
+    "usecase_title_unique": "FOR (u:UseCase) REQUIRE u.title IS UNIQUE",
+    "review_id_unique": "FOR (r:Review) REQUIRE r.review_id IS UNIQUE",
+    # only used by kg_loader to link reviews to their authors
+    "reviewer_user_id_unique": "FOR (r:Reviewer) REQUIRE r.user_id IS UNIQUE",
+}
+
+RANGE_INDEXES = {
+    "pricerange_limits": "FOR (r:PriceRange) ON (r.lower_limit, r.upper_limit)",
+    "pricerange_upper_limit": "FOR (r:PriceRange) ON (r.upper_limit)",
+    "attribute_name_value": "FOR (a:Attribute) ON (a.name, a.value)",
+}
+
+FULLTEXT_INDEXES = {
+    "product_text": "FOR (p:Product) ON EACH [p.title, p.description]",
+}
+
+# Single-property range indexes created by kg_generation.ipynb. A constraint cannot be
+# added over an existing index on the same property, so these are dropped first; add
+# attribute_range_name here if Attribute.name ever gets a constraint.
+LEGACY_INDEXES = [
+    "product_range_productid",
+    "subcategory_range_name",
+    "review_range_reviewid",
+    "reviewer_range_userid",
+]
+
+# Statements that read every product on purpose (the in-process catalog index)
+FULL_SCAN_STATEMENTS = {"catalog_products"}
+
+DB_HITS_BUDGET = int(os.getenv("SCHEMA_DB_HITS_BUDGET", 50000))
+
+SAMPLE_PARAMETERS = """
+MATCH (p:Product)
+WITH p LIMIT 5
+MATCH (p)-[:BELONGS_TO]->(s:Subcategory)
+OPTIONAL MATCH (p)-[:HAS_KEYWORD]->(k:Keyword)
+OPTIONAL MATCH (u:UseCase)-[:USED_FOR]->(s)
+RETURN collect(DISTINCT p.product_id) AS product_ids,
+       avg(p.price) AS price,
+       collect(DISTINCT s.name)[..2] AS subcategories,
+       collect(DISTINCT k.name)[..5] AS keywords,
+       collect(DISTINCT u.title)[..3] AS usecases
+""".strip()
+
+
+def schema_statements():
+    statements = [f"DROP INDEX {name} IF EXISTS" for name in LEGACY_INDEXES]
+    statements += [f"CREATE CONSTRAINT {name} IF NOT EXISTS {body}" for name, body in CONSTRAINTS.items()]
+    statements += [f"CREATE RANGE INDEX {name} IF NOT EXISTS {body}" for name, body in RANGE_INDEXES.items()]
+    statements += [f"CREATE FULLTEXT INDEX {name} IF NOT EXISTS {body}" for name, body in FULLTEXT_INDEXES.items()]
+    return statements
+
+
+def apply_schema(graphdb, timeout=300):
+    """Create every constraint and index, then wait for them to come online."""
+    for statement in schema_statements():
+        _, success = graphdb.query(statement)
+        if not success:
+            raise RuntimeError(f"Schema statement failed: {statement}")
+    graphdb.query(f"CALL db.awaitIndexes({timeout})")
+
+
+def sample_parameters(graphdb):
+    sample, success = graphdb.query(SAMPLE_PARAMETERS)
+    if not success or not sample or not sample[0]["product_ids"]:
+        raise RuntimeError("The graph has no products to profile the statements with")
+    sample = dict(sample[0])
+    # one superset of parameters; each statement only uses its own
+    return {
+        "product_ids": sample["product_ids"],
+        "product_id": sample["product_ids"][0],
+        "categories": sample["subcategories"],
+        "subcategories": sample["subcategories"],
+        "usecases": sample["usecases"],
+        "keywords": sample["keywords"],
+        "price": sample["price"],
+        "limit": 32,
+        "top_k": 10,
+        "tied_pool": 200,
+    }
+
+
+def plan_operators(plan):
+    yield plan
+    for child in plan.get("children", []):
+        yield from plan_operators(child)
+
+
+def check_plan(name, plan, db_hits_budget=DB_HITS_BUDGET):
+    """Return the problems found in a PROFILE plan, empty when it is fine."""
+    if name in FULL_SCAN_STATEMENTS:
+        return []
+    operators = list(plan_operators(plan))
+    problems = [
+        f"label scan: {operator['operatorType']} {operator.get('args', {}).get('Details', '')}".strip()
+        for operator in operators
+        if operator["operatorType"].startswith(("NodeByLabelScan", "AllNodesScan"))
+    ]
+    db_hits = sum(operator.get("dbHits", 0) for operator in operators)
+    if db_hits > db_hits_budget:
+        problems.append(f"{db_hits} db hits, budget is {db_hits_budget}")
+    return problems
+
+
+def verify_schema(graphdb, db_hits_budget=DB_HITS_BUDGET):
+    """PROFILE every runtime statement; returns {statement name: problems}."""
+    parameters = sample_parameters(graphdb)
+    failures = {}
+    for name, statement in STATEMENTS.items():
+        plan = graphdb.profile(statement, **parameters)
+        db_hits = sum(operator.get("dbHits", 0) for operator in plan_operators(plan))
+        problems = check_plan(name, plan, db_hits_budget)
+        print(f"{'FAIL' if problems else 'ok':>4}  {name}: {db_hits} db hits")
+        for problem in problems:
+            print(f"      {problem}")
+        if problems:
+            failures[name] = problems
+    return failures
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from utils2 import get_graphdb
+
+    parser = argparse.ArgumentParser(description="Apply and verify the Neo4j schema")
+    parser.add_argument("--apply", action="store_true", help="only create constraints and indexes")
+    parser.add_argument("--verify", action="store_true", help="only profile the runtime statements")
+    parser.add_argument("--budget", type=int, default=DB_HITS_BUDGET, help="db hits allowed per statement")
+    args = parser.parse_args()
+
+    graphdb = get_graphdb()
+    if not args.verify:
+        apply_schema(graphdb)
+        print("Schema applied")
+    if not args.apply:
+        failures = verify_schema(graphdb, args.budget)
+        if failures:
+            sys.exit(f"{len(failures)} statement(s) failed verification")
@@ -0,0 +1,211 @@
+"""HTTP API for the shopping assistant graph.
+
+    uvicorn --factory server:create_app --port 8000
+
+POST /threads/{thread_id}/messages          answer as JSON
+POST /threads/{thread_id}/messages/stream   stage markers and tokens as server-sent events
+GET  /healthz, /readyz                      liveness and readiness probes
+GET  /metrics                               Prometheus metrics
+"""
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from langchain_core.messages import HumanMessage
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel
+
+from event_loops import close_event_loop_resources
+from instrumentation import start_turn
+from streaming import astream_turn
+
+
+class MessageRequest(BaseModel):
+    content: str
+
+
+class MessageResponse(BaseModel):
+    thread_id: str
+    content: str
+    elapsed_s: float
+    # per-turn spans and token counts, only when requested with ?trace=true
+    trace: Optional[Dict[str, Any]] = None
+
+
+class TurnSlots:
+    """Bounds how many graph turns run at once; callers beyond that are rejected, not queued forever."""
+
+    def __init__(self, max_concurrency, queue_timeout=0.0):
+        self.max_concurrency = max_concurrency
+        # how long a request may wait for a free slot before it gets a 429
+        self.queue_timeout = queue_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        if self.semaphore.locked() and self.queue_timeout <= 0:
+            self.rejected += 1
+            return False
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self.semaphore.release()
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def create_app(graph=None, readiness=None, max_concurrency=None, request_timeout=None, queue_timeout=None):
+    """Build the API around `graph`; by default the chatbot graph, warmed up on startup."""
+    max_concurrency = max_concurrency or int(os.getenv("PASA_MAX_CONCURRENCY", "16"))
+    request_timeout = request_timeout or float(os.getenv("PASA_REQUEST_TIMEOUT", "60"))
+    if queue_timeout is None:
+        queue_timeout = float(os.getenv("PASA_QUEUE_TIMEOUT", "0"))
+
+    @asynccontextmanager
+    async def lifespan(app):
+        nonlocal graph, readiness
+        if graph is None:
+            # imported here so a stub graph does not pull in the models and databases
+            from graph import get_react_graph
+            from lifecycle import readiness as lifecycle_readiness, warm_up
+
+            await asyncio.to_thread(warm_up)
+            graph = get_react_graph()
+            readiness = readiness or lifecycle_readiness
+        app.state.slots = TurnSlots(max_concurrency, queue_timeout)
+        yield
+        # the async Neo4j, Qdrant and HTTP clients were created on this loop
+        await close_event_loop_resources()
+
+    app = FastAPI(title="PASA shopping assistant", lifespan=lifespan)
+
+    async def acquire_slot():
+        if not await app.state.slots.acquire():
+            raise HTTPException(status_code=429, detail="Too many requests in flight, retry shortly")
+
+    @app.post("/threads/{thread_id}/messages", response_model=MessageResponse)
+    async def post_message(thread_id: str, request: MessageRequest, trace: bool = False):
+        await acquire_slot()
+        start = time.perf_counter()
+        try:
+            with start_turn() as turn_trace:
+                result = await asyncio.wait_for(
+                    graph.ainvoke(
+                        {"messages": [HumanMessage(request.content)]},
+                        config={"configurable": {"thread_id": thread_id}},
+                    ),
+                    timeout=request_timeout,
+                )
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="The assistant took too long to answer")
+        finally:
+            app.state.slots.release()
+        return MessageResponse(
+            thread_id=thread_id,
+            content=result["messages"][-1].content,
+            elapsed_s=time.perf_counter() - start,
+            trace=turn_trace.summary() if trace else None,
+        )
+
+    @app.post("/threads/{thread_id}/messages/stream")
+    async def stream_message(thread_id: str, request: MessageRequest):
+        await acquire_slot()
+        config = {"configurable": {"thread_id": thread_id}}
+        released = False
+
+        def release():
+            # called when the body finishes and again by the background task, which also
+            # runs when the client left before the body started
+            nonlocal released
+            if not released:
+                released = True
+                app.state.slots.release()
+
+        async def run_turn(queue):
+            # the whole turn runs in this task, so context set inside the graph carries
+            # from one step to the next
+            turn = astream_turn(graph, request.content, config)
+            try:
+                with start_turn():
+                    async for event in turn:
+                        await queue.put(event)
+                await queue.put(None)
+            except Exception as e:
+                await queue.put(e)
+            finally:
+                await turn.aclose()
+
+        async def events():
+            queue = asyncio.Queue()
+            producer = asyncio.create_task(run_turn(queue))
+            loop = asyncio.get_running_loop()
+            # one deadline for the whole turn, applied only while waiting on the graph so
+            # it never spans a yield back to the server
+            deadline = loop.time() + request_timeout
+            try:
+                while True:
+                    event = await asyncio.wait_for(queue.get(), deadline - loop.time())
+                    if event is None:
+                        break
+                    if isinstance(event, Exception):
+                        raise event
+                    kind, text = event
+                    yield sse(kind, {"text": text})
+                yield sse("done", {})
+            except asyncio.TimeoutError:
+                yield sse("error", {"detail": "The assistant took too long to answer"})
+            except Exception as e:
+                print("Streaming turn failed:", e)
+                yield sse("error", {"detail": "The assistant failed to answer"})
+            finally:
+                producer.cancel()
+                try:
+                    await producer
+                except asyncio.CancelledError:
+                    pass
+                release()
+
+        return StreamingResponse(events(), media_type="text/event-stream", background=BackgroundTask(release))
+
+    @app.get("/healthz")
+    async def healthz():
+        slots = app.state.slots
+        return {
+            "status": "ok",
+            "active_turns": slots.active,
+            "max_concurrency": slots.max_concurrency,
+            "rejected": slots.rejected,
+        }
+
+    @app.get("/metrics")
+    async def metrics():
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+    @app.get("/readyz")
+    async def readyz():
+        status = await asyncio.to_thread(readiness) if readiness else {"ready": True, "checks": {}}
+        return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(create_app(), host=os.getenv("PASA_HOST", "0.0.0.0"), port=int(os.getenv("PASA_PORT", "8000")))
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+# Speculative call -> intents whose branch consumes its result
+SPECULATION_TARGETS = {
+    "entity_identification": {"product_search", "recommendation"},
+    "product_reference": {"information_retrieval", "reviews"},
+    "product_list_reference": {"comparison"},
+}
+
+
+class SpeculativeRouter:
+    """Runs downstream LLM calls in parallel with intent classification and keeps only the one the intent needs."""
+
+    def __init__(self, targets, max_workers=8):
+        unknown = set(targets) - set(SPECULATION_TARGETS)
+        if unknown:
+            raise ValueError(f"Unknown speculation targets: {sorted(unknown)}")
+        self.targets = set(targets)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, key, target):
+        with self._lock:
+            self.counts[key] += 1
+            self.counts[f"{target}.{key}"] += 1
+
+    def route(self, classify, calls):
+        """Run `classify` while the enabled `calls` run speculatively; return (intent, used results)."""
+        futures = {}
+        for target, call in calls.items():
+            if target in self.targets:
+                # copy the context so callbacks and tracing see the graph run
+                futures[target] = self.executor.submit(copy_context().run, call)
+                self._count("launched", target)
+
+        try:
+            intent = classify()
+        except BaseException:
+            for future in futures.values():
+                future.cancel()
+            raise
+
+        results = {}
+        for target, future in futures.items():
+            if intent in SPECULATION_TARGETS[target]:
+                try:
+                    results[target] = future.result()
+                except Exception as e:
+                    # the node falls back to making the call itself
+                    print(f"Speculative {target} failed:", e)
+                    self._count("failed", target)
+                else:
+                    self._count("used", target)
+            elif future.cancel():
+                self._count("cancelled", target)
+            else:
+                # already running or finished: the tokens are spent, discard the result
+                self._count("wasted", target)
+        return intent, results
+
+    async def aroute(self, classify, calls):
+        """Async variant of `route`: `classify` and `calls` are coroutine functions."""
+        tasks = {}
+        for target, call in calls.items():
+            if target in self.targets:
+                tasks[target] = asyncio.create_task(call())
+                self._count("launched", target)
+
+        try:
+            intent = await classify()
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        results = {}
+        for target, task in tasks.items():
+            if intent in SPECULATION_TARGETS[target]:
+                try:
+                    results[target] = await task
+                except Exception as e:
+                    print(f"Speculative {target} failed:", e)
+                    self._count("failed", target)
+                else:
+                    self._count("used", target)
+            elif task.done():
+                if not task.cancelled():
+                    # retrieve the outcome so a failure is not reported as never retrieved
+                    task.exception()
+                self._count("wasted", target)
+            else:
+                # aborts the in-flight request; prompt tokens may already be billed
+                task.cancel()
+                self._count("cancelled", target)
+        return intent, results
+
+    def report(self):
+        with self._lock:
+            counts = dict(self.counts)
+        launched = counts.get("launched", 0)
+        discarded = counts.get("wasted", 0) + counts.get("cancelled", 0)
+        return {
+            "targets": sorted(self.targets),
+            "counts": counts,
+            # calls that ran to completion and were thrown away
+            "wasted_rate": counts.get("wasted", 0) / launched if launched else 0.0,
+            "discarded_rate": discarded / launched if launched else 0.0,
+        }
@@ -0,0 +1,85 @@
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+
+# Nodes whose answer is free text generated token by token; the product_search and
+# recommendation answers come from structured output and arrive in one piece.
+STREAMED_NODES = {"information_retrieval", "reviews", "comparison"}
+
+STAGE_MESSAGES = {
+    "candidates_retrieved": "Found {count} candidate products",
+    "reranked": "Reranked down to {count} products",
+}
+
+NODE_MESSAGES = {
+    "entity_identification": "Understood what you are looking for",
+    "product_reference": "Found the product you mean",
+    "product_list_reference": "Found the products you mean",
+}
+
+STREAM_MODES = ["updates", "messages", "custom"]
+
+
+def last_message_content(update):
+    messages = update.get("messages")
+    if isinstance(messages, list):
+        messages = messages[-1] if messages else None
+    # the compaction step only emits RemoveMessage markers
+    return messages.content if isinstance(messages, AIMessage) else None
+
+
+class TurnEvents:
+    """Turns raw graph stream chunks into ("stage", text) and ("token", text) events."""
+
+    def __init__(self):
+        self.streamed = False
+        self.final = None
+
+    def handle(self, mode, chunk):
+        if mode == "messages":
+            message, metadata = chunk
+            if (
+                metadata.get("langgraph_node") in STREAMED_NODES
+                and isinstance(message, AIMessageChunk)
+                and message.content
+            ):
+                self.streamed = True
+                yield "token", message.content
+        elif mode == "custom":
+            template = STAGE_MESSAGES.get(chunk.get("stage"))
+            if template:
+                yield "stage", template.format(**chunk)
+        elif mode == "updates":
+            for node, update in chunk.items():
+                if not isinstance(update, dict):
+                    continue
+                if node == "intent_router":
+                    yield "stage", f"Intent: {update['intent'].replace('_', ' ')}"
+                elif node in NODE_MESSAGES:
+                    yield "stage", NODE_MESSAGES[node]
+                content = last_message_content(update)
+                if content is not None:
+                    self.final = content
+
+    def finish(self):
+        # answers that were not streamed token by token are sent as a single chunk
+        if not self.streamed and self.final:
+            yield "token", self.final
+
+
+def stream_turn(graph, prompt_input, config):
+    events = TurnEvents()
+    for mode, chunk in graph.stream(
+        {"messages": [HumanMessage(prompt_input)]}, config=config, stream_mode=STREAM_MODES
+    ):
+        yield from events.handle(mode, chunk)
+    yield from events.finish()
+
+
+async def astream_turn(graph, prompt_input, config):
+    events = TurnEvents()
+    async for mode, chunk in graph.astream(
+        {"messages": [HumanMessage(prompt_input)]}, config=config, stream_mode=STREAM_MODES
+    ):
+        for event in events.handle(mode, chunk):
+            yield event
+    for event in events.finish():
+        yield event
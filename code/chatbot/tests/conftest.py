@@ -0,0 +1,9 @@
+import os
+import sys
+
+# the chatbot modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "neo4j: needs a running Neo4j, set NEO4J_TEST_URI to run")
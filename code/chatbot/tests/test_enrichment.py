@@ -0,0 +1,141 @@
+"""run_stage and export against fake chains that stand in for the Ollama servers."""
+import asyncio
+import json
+import pickle
+
+import pandas as pd
+import pytest
+
+from enrichment import JsonlCheckpoint, ProductSummary, export, run_stage
+
+PRODUCTS = [
+    {"parent_asin": f"B0{index}", "title": f"Product {index}", "main_category": "Beauty", "categories": ["Face"]}
+    for index in range(6)
+]
+
+
+class FakeChains:
+    """Only the summary chain is used by these tests; it answers with the product title."""
+
+    def __init__(self, fail_first=0, slow=0.0):
+        self.failures = {}
+        self.fail_first = fail_first
+        self.slow = slow
+        self.in_flight = self.max_in_flight = 0
+        self.summary = self
+
+    async def ainvoke(self, inputs):
+        title = inputs["description"].split(" is a product")[0]
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.slow)
+            if self.failures.get(title, 0) < self.fail_first:
+                self.failures[title] = self.failures.get(title, 0) + 1
+                raise ConnectionError("server busy")
+            return {"parsed": ProductSummary(summary=f"A summary of {title}."), "raw": None}
+        finally:
+            self.in_flight -= 1
+
+
+def run_summaries(tmp_path, chains, concurrency=2, retries=3):
+    servers = [(chains, asyncio.Semaphore(concurrency))]
+    return asyncio.run(
+        run_stage(
+            "summaries", PRODUCTS, servers, str(tmp_path), retries=retries, workers_per_server=concurrency, backoff=0
+        )
+    )
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_retries_until_the_answer_is_valid(tmp_path):
+    chains = FakeChains(fail_first=2)
+    assert run_summaries(tmp_path, chains, retries=3) == (len(PRODUCTS), 0)
+    records = read_jsonl(tmp_path / "summaries.jsonl")
+    assert sorted(record["parent_asin"] for record in records) == [product["parent_asin"] for product in PRODUCTS]
+    assert all(count == 2 for count in chains.failures.values())
+
+
+def test_gives_up_after_the_last_attempt(tmp_path):
+    chains = FakeChains(fail_first=5)
+    assert run_summaries(tmp_path, chains, retries=2) == (0, len(PRODUCTS))
+    errors = read_jsonl(tmp_path / "summaries.errors.jsonl")
+    assert len(errors) == len(PRODUCTS) and errors[0]["error"] == "server busy"
+    assert all(count == 2 for count in chains.failures.values())
+
+
+def test_bounds_requests_in_flight(tmp_path):
+    chains = FakeChains(slow=0.01)
+    run_summaries(tmp_path, chains, concurrency=2)
+    assert chains.max_in_flight == 2
+
+
+def test_resume_skips_products_already_done(tmp_path):
+    with open(tmp_path / "summaries.jsonl", "w") as f:
+        for product in PRODUCTS[:4]:
+            f.write(json.dumps({"parent_asin": product["parent_asin"], "result": "done before"}) + "\n")
+    chains = FakeChains()
+    assert run_summaries(tmp_path, chains) == (2, 0)
+    assert chains.failures == {}
+    results = JsonlCheckpoint(str(tmp_path / "summaries.jsonl"), ["parent_asin"]).results
+    assert results[("B00",)] == "done before"
+    assert results[("B05",)] == "A summary of Product 5."
+
+
+def test_checkpoint_starts_a_new_line_after_a_truncated_one(tmp_path):
+    path = tmp_path / "summaries.jsonl"
+    path.write_text(json.dumps({"parent_asin": "B00", "result": "ok"}) + "\n" + '{"parent_asin": "B01", "res')
+    checkpoint = JsonlCheckpoint(str(path), ["parent_asin"])
+    assert list(checkpoint.results) == [("B00",)]
+    checkpoint.append({"parent_asin": "B01"}, "redone")
+    checkpoint.close()
+    assert JsonlCheckpoint(str(path), ["parent_asin"]).results == {("B00",): "ok", ("B01",): "redone"}
+
+
+@pytest.fixture
+def products_csv(tmp_path):
+    rows = [
+        {
+            "parent_asin": product["parent_asin"],
+            "title": product["title"],
+            "main_category": product["main_category"],
+            "categories": repr(product["categories"]),
+            "details": "{}",
+            "description": "[]",
+            "features": "[]",
+        }
+        for product in PRODUCTS
+    ]
+    path = tmp_path / "products.csv"
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return str(path)
+
+
+def test_export_aligns_results_with_product_rows(tmp_path, products_csv):
+    def write(stage, records):
+        with open(tmp_path / f"{stage}.jsonl", "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    # results arrive out of order and some products have none
+    write("keywords", [{"parent_asin": "B03", "result": {"extractive": ["c"], "abstractive": []}},
+                       {"parent_asin": "B00", "result": {"extractive": ["a"], "abstractive": []}}])
+    write("attributes", [{"parent_asin": "B01", "result": {"Color": "red"}}])
+    write("summaries", [{"parent_asin": "B04", "result": "four"}, {"parent_asin": "B02", "result": "two"}])
+    write("use_cases", [{"main_category": "Beauty", "subcategory": "Face", "result": [{"title": "t", "explanation": "e"}]}])
+
+    export(products_csv, str(tmp_path))
+
+    with open(tmp_path / "keywords.pkl", "rb") as f:
+        keywords = pickle.load(f)
+    assert [entry and entry["extractive"] for entry in keywords] == [["a"], None, None, ["c"], None, None]
+    with open(tmp_path / "product_attributes.json") as f:
+        assert json.load(f) == [None, {"Color": "red"}, None, None, None, None]
+    with open(tmp_path / "summaries.json") as f:
+        assert json.load(f) == [{"index": 2, "summary": "two"}, {"index": 4, "summary": "four"}]
+    with open(tmp_path / "use_cases.json") as f:
+        assert json.load(f) == [{"title": "t", "explanation": "e", "subcategory": "Face", "main_category": "Beauty"}]
@@ -0,0 +1,183 @@
+"""Plan checks against stand-in PROFILE plans and a fake connection.
+
+The `neo4j` tests run the real PROFILE path against a throwaway database:
+
+    docker run --rm -p 7687:7687 -e NEO4J_AUTH=neo4j/password neo4j:5
+    NEO4J_TEST_URI=bolt://localhost:7687 NEO4J_TEST_PASSWORD=password pytest tests/test_schema.py
+"""
+import os
+import re
+
+import pytest
+
+import schema
+from queries import STATEMENTS
+
+
+def operator(operator_type, db_hits=0, children=(), details=""):
+    return {"operatorType": operator_type, "dbHits": db_hits, "args": {"Details": details}, "children": list(children)}
+
+
+SEEK_PLAN = operator(
+    "ProduceResults@neo4j",
+    children=[operator("NodeUniqueIndexSeek@neo4j", db_hits=2, details="p:Product(product_id)")],
+)
+SCAN_PLAN = operator(
+    "ProduceResults@neo4j",
+    children=[operator("Filter@neo4j", db_hits=10, children=[operator("NodeByLabelScan@neo4j", db_hits=100, details="p:Product")])],
+)
+
+SAMPLE = {
+    "product_ids": ["B01", "B02"],
+    "price": 12.5,
+    "subcategories": ["Face", "Skin Care"],
+    "keywords": ["serum"],
+    "usecases": ["night routine"],
+}
+
+
+class FakeConnection:
+    def __init__(self, plans=None, failing=(), sample=SAMPLE):
+        self.plans = plans or {}
+        self.failing = set(failing)
+        self.sample = sample
+        self.statements = []
+        self.profiled = []
+
+    def query(self, statement, **parameters):
+        self.statements.append(statement)
+        if statement in self.failing:
+            return None, False
+        if statement == schema.SAMPLE_PARAMETERS:
+            return ([self.sample] if self.sample else []), True
+        return [], True
+
+    def profile(self, statement, **parameters):
+        self.profiled.append((statement, parameters))
+        return self.plans.get(statement, SEEK_PLAN)
+
+
+def test_plan_operators_walks_every_operator():
+    types = [op["operatorType"] for op in schema.plan_operators(SCAN_PLAN)]
+    assert types == ["ProduceResults@neo4j", "Filter@neo4j", "NodeByLabelScan@neo4j"]
+
+
+def test_check_plan_accepts_index_seek():
+    assert schema.check_plan("product_titles", SEEK_PLAN) == []
+
+
+def test_check_plan_reports_label_scan():
+    problems = schema.check_plan("product_titles", SCAN_PLAN)
+    assert problems == ["label scan: NodeByLabelScan@neo4j p:Product"]
+
+
+def test_check_plan_reports_all_nodes_scan():
+    plan = operator("ProduceResults@neo4j", children=[operator("AllNodesScan@neo4j")])
+    assert len(schema.check_plan("product_titles", plan)) == 1
+
+
+def test_check_plan_reports_db_hits_over_budget():
+    assert schema.check_plan("product_titles", SEEK_PLAN, db_hits_budget=2) == []
+    assert schema.check_plan("product_titles", SEEK_PLAN, db_hits_budget=1) == ["2 db hits, budget is 1"]
+
+
+def test_check_plan_exempts_full_scan_statements():
+    for name in schema.FULL_SCAN_STATEMENTS:
+        assert schema.check_plan(name, SCAN_PLAN, db_hits_budget=0) == []
+
+
+def test_apply_schema_runs_every_statement_then_waits():
+    graphdb = FakeConnection()
+    schema.apply_schema(graphdb, timeout=5)
+    assert graphdb.statements[:-1] == schema.schema_statements()
+    assert graphdb.statements[-1] == "CALL db.awaitIndexes(5)"
+    # legacy indexes are dropped before the constraints that replace them are created
+    assert graphdb.statements[0].startswith("DROP INDEX")
+
+
+NOTEBOOK = os.path.join(os.path.dirname(__file__), "..", "..", "kg_generation.ipynb")
+
+
+def test_apply_schema_drops_legacy_indexes_under_every_constraint():
+    # the range indexes the notebook creates, by label and property
+    with open(NOTEBOOK) as f:
+        notebook_indexes = {
+            (label, prop): name
+            for name, label, prop in re.findall(r"CREATE INDEX (\w+) FOR \(\w+:(\w+)\) ON \(\w+\.(\w+)\)", f.read())
+        }
+    assert notebook_indexes
+    graphdb = FakeConnection()
+    schema.apply_schema(graphdb)
+    for name, body in schema.CONSTRAINTS.items():
+        label, prop = re.match(r"FOR \(\w+:(\w+)\) REQUIRE \w+\.(\w+) IS UNIQUE", body).groups()
+        if (label, prop) not in notebook_indexes:
+            continue
+        drop = f"DROP INDEX {notebook_indexes[label, prop]} IF EXISTS"
+        create = f"CREATE CONSTRAINT {name} IF NOT EXISTS {body}"
+        assert drop in graphdb.statements, f"{label}.{prop} keeps its notebook index"
+        assert graphdb.statements.index(drop) < graphdb.statements.index(create)
+
+
+def test_apply_schema_stops_on_failure():
+    failing = schema.schema_statements()[3]
+    graphdb = FakeConnection(failing=[failing])
+    with pytest.raises(RuntimeError, match="Schema statement failed"):
+        schema.apply_schema(graphdb)
+    assert graphdb.statements[-1] == failing
+
+
+def test_verify_schema_profiles_every_statement():
+    graphdb = FakeConnection()
+    assert schema.verify_schema(graphdb) == {}
+    assert [statement for statement, _ in graphdb.profiled] == list(STATEMENTS.values())
+    parameters = graphdb.profiled[0][1]
+    assert parameters["product_id"] == "B01"
+    assert parameters["categories"] == SAMPLE["subcategories"]
+
+
+def test_verify_schema_collects_failures():
+    name = next(name for name in STATEMENTS if name not in schema.FULL_SCAN_STATEMENTS)
+    exempt = next(iter(schema.FULL_SCAN_STATEMENTS))
+    graphdb = FakeConnection(plans={STATEMENTS[name]: SCAN_PLAN, STATEMENTS[exempt]: SCAN_PLAN})
+    failures = schema.verify_schema(graphdb)
+    assert list(failures) == [name]
+
+
+def test_verify_schema_needs_products():
+    with pytest.raises(RuntimeError, match="no products"):
+        schema.verify_schema(FakeConnection(sample=None))
+
+
+FIXTURE_GRAPH = """
+MERGE (c:Category {name: 'Beauty'})
+MERGE (s:Subcategory {name: 'Face'})-[:BELONGS_TO]->(c)
+MERGE (p:Product {product_id: 'TEST01'})
+SET p.title = 'Night serum', p.description = 'A serum', p.price = 20.0, p.rating_number = 3, p.average_rating = 4.5
+MERGE (p)-[:BELONGS_TO]->(s)
+MERGE (k:Keyword {name: 'serum'})
+MERGE (p)-[:HAS_KEYWORD]->(k)
+MERGE (u:UseCase {title: 'night routine'})-[:USED_FOR]->(s)
+MERGE (r:PriceRange {lower_limit: 17, upper_limit: 23})
+MERGE (p)-[:AROUND_PRICE]->(r)
+"""
+
+
+@pytest.fixture
+def neo4j_connection():
+    uri = os.getenv("NEO4J_TEST_URI")
+    if not uri:
+        pytest.skip("NEO4J_TEST_URI is not set")
+    pytest.importorskip("neo4j")
+    from Neo4jConnection import Neo4jConnection
+
+    graphdb = Neo4jConnection(uri=uri, user="neo4j", password=os.getenv("NEO4J_TEST_PASSWORD", "password"), db="neo4j")
+    yield graphdb
+    graphdb.close()
+
+
+@pytest.mark.neo4j
+def test_schema_on_neo4j(neo4j_connection):
+    schema.apply_schema(neo4j_connection)
+    _, success = neo4j_connection.query(FIXTURE_GRAPH)
+    assert success
+    assert schema.verify_schema(neo4j_connection) == {}
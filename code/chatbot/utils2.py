@@ -1,15 +1,31 @@
+import asyncio
 import os
+import threading
+import time
+from functools import wraps
 
-import requests
 from typing import Literal, List, Dict, Any, Optional
 from pydantic import BaseModel, Field
-from qdrant_client import QdrantClient, models
+from qdrant_client import models
 from langchain_nvidia_ai_endpoints import ChatNVIDIA
 from langchain_openai import ChatOpenAI
+from langgraph.config import get_stream_writer
 from langgraph.graph import MessagesState
 from dotenv import load_dotenv, find_dotenv
 
-from Neo4jConnection import Neo4jConnection
+from Neo4jConnection import AsyncNeo4jConnection, Neo4jConnection
+from catalog_index import CatalogIndex
+from embedding_cache import embedding_cache
+from event_loops import per_event_loop
+from embedding_registry import (
+    DENSE_VECTOR_NAME,
+    SPARSE_VECTOR_NAME,
+    get_async_qdrant_client,
+    get_qdrant_client,
+)
+from instrumentation import record_qdrant, record_rerank, token_usage_callback
+from queries import STATEMENTS
+from reranker import create_reranker
 
 load_dotenv(find_dotenv())
 
@@ -29,14 +45,62 @@ llm_precise = ChatOpenAI(
     top_p=0.7,
     max_tokens=2048,
     streaming=True,
+    # report token usage on streamed responses too, for the token metrics
+    stream_usage=True,
+    callbacks=[token_usage_callback],
 )
 
 
-graphdb = Neo4jConnection(
-    uri=os.environ["NEO4J_URI"], user="neo4j", password=os.environ["NEO4J_PASSWORD"], db="neo4j"
-)
-if not graphdb.is_alive:
-    raise Exception("Neo4j Instance is not running. Please start the Neo4j Instance.")
+def resource(factory):
+    """Create the object on the first call and return the same one afterwards, from any thread."""
+    lock = threading.Lock()
+    instances = []
+
+    @wraps(factory)
+    def get():
+        if not instances:
+            with lock:
+                if not instances:
+                    instances.append(factory())
+        return instances[0]
+
+    get.loaded = lambda: bool(instances)
+    return get
+
+
+@resource
+def get_graphdb():
+    graphdb = Neo4jConnection(
+        uri=os.environ["NEO4J_URI"], user="neo4j", password=os.environ["NEO4J_PASSWORD"], db="neo4j"
+    )
+    if not graphdb.is_alive:
+        raise Exception("Neo4j Instance is not running. Please start the Neo4j Instance.")
+    graphdb.prepare(STATEMENTS)
+    return graphdb
+
+
+@per_event_loop(close=lambda agraphdb: agraphdb.close())
+def get_agraphdb():
+    # asyncio counterpart used by the ainvoke path of the graph; the driver is bound to its loop
+    agraphdb = AsyncNeo4jConnection(
+        uri=os.environ["NEO4J_URI"], user="neo4j", password=os.environ["NEO4J_PASSWORD"], db="neo4j"
+    )
+    agraphdb.prepare(STATEMENTS)
+    return agraphdb
+
+
+@resource
+def get_catalog_index():
+    # Subcategory/price pre-filtering runs against an in-process copy of the catalog.
+    # CATALOG_INDEX_SOURCE is "graph" (default), a path to a products_*.csv dump, or "off".
+    # CATALOG_INDEX_MAX_AGE reloads it every that many seconds to pick up catalog updates.
+    catalog_source = os.getenv("CATALOG_INDEX_SOURCE", "graph")
+    if catalog_source == "off":
+        return None
+    max_age = float(os.getenv("CATALOG_INDEX_MAX_AGE", 0))
+    if catalog_source == "graph":
+        return CatalogIndex.from_graph(get_graphdb(), max_age=max_age)
+    return CatalogIndex.from_csv(catalog_source, max_age=max_age)
 
 
 class OverallState(MessagesState):
@@ -54,6 +118,8 @@ class OverallState(MessagesState):
     product_ids: Optional[List[str]]
     product_index: Optional[int]
     product_indices: Optional[List[int]]
+    # results of calls started speculatively alongside intent classification in this turn
+    speculative: Optional[Dict[str, Any]]
 
 
 class ProductRanking(BaseModel):
@@ -94,43 +160,99 @@ class ProductRankingList(BaseModel):
         return self.rankings[index]
 
 
+def emit_stage(stage, **data):
+    # Progress marker for the UI, delivered through the graph's "custom" stream mode.
+    # Outside of a graph run (e.g. calling a node function directly) it is a no-op.
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        return
+    writer({"stage": stage, **data})
+
+
 def create_amazon_link(product_id):
     return f"https://www.amazon.com/dp/{product_id}"
 
 
-def format_product_ranking_list(ranking) -> str:
+def get_product_titles(product_ids):
+    results = get_graphdb().run_prepared("product_titles", product_ids=product_ids)
+    return {record["product_id"]: record["title"] for record in results}
+
+
+async def aget_product_titles(product_ids):
+    results = await get_agraphdb().run_prepared("product_titles", product_ids=product_ids)
+    return {record["product_id"]: record["title"] for record in results}
+
+
+def missing_title_ids(ranking, titles):
+    return [
+        product.product_id
+        for product in ranking
+        if product.keep and product.product_id not in titles
+    ]
+
+
+def render_product_ranking_list(ranking, titles):
     output_message = []
     keep_ids = []
     for product in ranking:
-        if product.keep:
-            product_id = product.product_id
-            explanation = product.explanation
-            product_title = graphdb.run_query(
-                f"MATCH (p:Product) WHERE p.product_id = '{product_id}' RETURN p.title"
-            )[0]["p.title"]
-            output_message.append(
-                f"[{product_title}]({create_amazon_link(product_id)}): {explanation}"
-            )
-            keep_ids.append(product_id)
+        if not product.keep:
+            continue
+        product_id = product.product_id
+        if product_id not in titles:
+            # the LLM returned an id that does not exist in the catalog
+            continue
+        explanation = product.explanation
+        output_message.append(
+            f"[{titles[product_id]}]({create_amazon_link(product_id)}): {explanation}"
+        )
+        keep_ids.append(product_id)
     output_message = "\n\n".join(output_message)
     return output_message, keep_ids
 
 
-def rerank(query, documents, limit=5, model="jina-colbert-v2"):
-    url = "https://api.jina.ai/v1/rerank"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f'Bearer {os.getenv("JINA_API_KEY")}',
-    }
-    data = {"model": model, "query": query, "top_n": limit, "documents": documents}
+def format_product_ranking_list(ranking, titles=None) -> str:
+    # titles maps product_id -> title for the products retrieved earlier in the turn,
+    # so the database is only hit for ids the LLM returned that we have not seen
+    titles = dict(titles or {})
+    missing_ids = missing_title_ids(ranking, titles)
+    if missing_ids:
+        titles.update(get_product_titles(missing_ids))
+    return render_product_ranking_list(ranking, titles)
 
-    response = requests.post(url, headers=headers, json=data)
-    data = response.json()["results"]
-    return data
 
+async def aformat_product_ranking_list(ranking, titles=None) -> str:
+    titles = dict(titles or {})
+    missing_ids = missing_title_ids(ranking, titles)
+    if missing_ids:
+        titles.update(await aget_product_titles(missing_ids))
+    return render_product_ranking_list(ranking, titles)
 
-def retrieve_and_rerank(query, limit_rerank, product_ids, searcher, limit_retrieve=20):
-    query_filter = models.Filter(
+
+@resource
+def get_reranker():
+    # "jina" calls the hosted API, "local" scores with an in-process cross-encoder
+    return create_reranker(os.getenv("RERANK_BACKEND", "jina"))
+
+
+def rerank(query, documents, limit=5):
+    reranker = get_reranker()
+    start = time.perf_counter()
+    results = reranker.rerank(query, documents, limit)
+    record_rerank(reranker.name, len(documents), time.perf_counter() - start)
+    return results
+
+
+async def arerank(query, documents, limit=5):
+    reranker = get_reranker()
+    start = time.perf_counter()
+    results = await reranker.arerank(query, documents, limit)
+    record_rerank(reranker.name, len(documents), time.perf_counter() - start)
+    return results
+
+
+def product_id_filter(product_ids):
+    return models.Filter(
         must=[
             models.FieldCondition(
                 key="product_id",
@@ -139,52 +261,108 @@ def retrieve_and_rerank(query, limit_rerank, product_ids, searcher, limit_retrie
         ]
     )
 
+
+def retrieve_and_rerank(query, limit_rerank, product_ids, searcher, limit_retrieve=20):
     retrieved_documents = searcher.search(
-        query, query_filter=query_filter, limit=limit_retrieve, threshold=0.9
+        query, query_filter=product_id_filter(product_ids), limit=limit_retrieve, threshold=0.9
     )
     documents = [document["document"] for document in retrieved_documents]
     sorted_product_ids = [document["product_id"] for document in retrieved_documents]
 
-    reranked_documents = rerank(
-        query, documents, limit_rerank, model="jina-reranker-v2-base-multilingual"
-    )
+    reranked_documents = rerank(query, documents, limit_rerank)
     reranked_product_ids = [
         sorted_product_ids[entry["index"]] for entry in reranked_documents
     ]
     return reranked_product_ids
 
 
-class HybridSearcher:
-    DENSE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
-    SPARSE_MODEL = "prithivida/Splade_PP_en_v1"
+async def aretrieve_and_rerank(query, limit_rerank, product_ids, searcher, limit_retrieve=20):
+    retrieved_documents = await searcher.asearch(
+        query, query_filter=product_id_filter(product_ids), limit=limit_retrieve, threshold=0.9
+    )
+    documents = [document["document"] for document in retrieved_documents]
+    sorted_product_ids = [document["product_id"] for document in retrieved_documents]
 
-    def __init__(self, collection_name):
-        self.collection_name = collection_name
-        # initialize Qdrant client
-        self.qdrant_client = QdrantClient(url=os.environ["QDRANT_URL"], api_key=os.environ["QDRANT_API_KEY"])
-        self.qdrant_client.set_model("sentence-transformers/all-MiniLM-L6-v2")
-        self.qdrant_client.set_sparse_model("prithivida/Splade_PP_en_v1")
+    reranked_documents = await arerank(query, documents, limit_rerank)
+    reranked_product_ids = [
+        sorted_product_ids[entry["index"]] for entry in reranked_documents
+    ]
+    return reranked_product_ids
 
-        vector_params = self.qdrant_client.get_fastembed_vector_params()
-        vector_params["fast-all-minilm-l6-v2"].on_disk = True
-        sparse_vector_params = self.qdrant_client.get_fastembed_sparse_vector_params()
-        sparse_vector_params["fast-sparse-splade_pp_en_v1"].index.on_disk = True
 
-    def search(self, text: str, query_filter=None, limit=3, threshold=0.5):
-        # `search_result` contains found vector ids with similarity scores
-        # along with the stored payload (metadata)
-        search_result = self.qdrant_client.query(
+class HybridSearcher:
+    def __init__(self, collection_name, client=None):
+        self.collection_name = collection_name
+        # all searchers share one Qdrant client and one copy of each embedding model,
+        # both created on first use
+        self._qdrant_client = client
+
+    @property
+    def qdrant_client(self):
+        if self._qdrant_client is None:
+            self._qdrant_client = get_qdrant_client()
+        return self._qdrant_client
+
+    @property
+    def async_qdrant_client(self):
+        # one per event loop, so not kept on the searcher
+        return get_async_qdrant_client()
+
+    @staticmethod
+    def query_vectors(text):
+        # cached per (model, normalized text), so repeated queries and keywords skip the models
+        dense = embedding_cache.dense(text)
+        indices, values = embedding_cache.sparse(text)
+        return dense.tolist(), models.SparseVector(indices=indices.tolist(), values=values.tolist())
+
+    def hybrid_query(self, dense, sparse, query_filter, limit, threshold):
+        # each branch keeps its own score threshold, then the two rankings are fused with RRF
+        return dict(
             collection_name=self.collection_name,
-            query_text=text,
-            query_filter=query_filter,
+            prefetch=[
+                models.Prefetch(
+                    query=dense,
+                    using=DENSE_VECTOR_NAME,
+                    filter=query_filter,
+                    limit=limit,
+                    score_threshold=threshold,
+                ),
+                models.Prefetch(
+                    query=sparse,
+                    using=SPARSE_VECTOR_NAME,
+                    filter=query_filter,
+                    limit=limit,
+                    score_threshold=threshold,
+                ),
+            ],
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
             limit=limit,
-            score_threshold=threshold,
+            with_payload=True,
+        )
+
+    def search(self, text: str, query_filter=None, limit=3, threshold=0.5):
+        start = time.perf_counter()
+        dense, sparse = self.query_vectors(text)
+        search_result = self.qdrant_client.query_points(
+            **self.hybrid_query(dense, sparse, query_filter, limit, threshold)
         )
 
         # Select and return metadata
-        metadata = [hit.metadata for hit in search_result]
+        metadata = [point.payload for point in search_result.points]
+        record_qdrant(self.collection_name, len(metadata), time.perf_counter() - start)
+        return metadata
+
+    async def asearch(self, text: str, query_filter=None, limit=3, threshold=0.5):
+        start = time.perf_counter()
+        dense, sparse = await asyncio.to_thread(self.query_vectors, text)
+        search_result = await self.async_qdrant_client.query_points(
+            **self.hybrid_query(dense, sparse, query_filter, limit, threshold)
+        )
+        metadata = [point.payload for point in search_result.points]
+        record_qdrant(self.collection_name, len(metadata), time.perf_counter() - start)
         return metadata
 
+# Cheap to create: the client and models are loaded by the first search
 subcategory_searcher = HybridSearcher(collection_name="subcategories")
 summary_searcher = HybridSearcher(collection_name="summaries")
 usecase_searcher = HybridSearcher(collection_name="usecases")